@@ -3,7 +3,7 @@ import json
 
 class Clickable(object):
     def __init__(self, _name, _text, _parent_activity_state, _parent_app_name, _score=1, next_transition_state=None,
-                 _parent=None, _siblings=None, _children=None):
+                 _parent=None, _siblings=None, _children=None, _visits=0):
         self.name = _name
         self.text = _text
         self.score = _score
@@ -13,6 +13,14 @@ class Clickable(object):
         self.parent_app_name = _parent_app_name
         self.siblings = _siblings
         self.children = _children
+        # Number of times the clickable was clicked, over every crawl of the app
+        self.visits = _visits
+
+    def __setattr__(self, name, value):
+        # Any change marks the object to be written on the next flush to the database
+        super(Clickable, self).__setattr__(name, value)
+        if name != 'dirty':
+            super(Clickable, self).__setattr__('dirty', True)
 
     def __str__(self):
         return json.dumps(self.__dict__)
@@ -28,7 +36,8 @@ class Clickable(object):
                 "parent_activity_state": clickable.parent_activity_state,
                 "parent_app_name": clickable.parent_app_name,
                 "siblings": clickable.siblings,
-                "children": clickable.children}
+                "children": clickable.children,
+                "visits": clickable.visits}
 
     @staticmethod
     def decode_data(document):
@@ -41,4 +50,5 @@ class Clickable(object):
                          next_transition_state=document['next_transition_state'],
                          _parent=document['parent'],
                          _siblings=document['siblings'],
-                         _children=document['children'])
+                         _children=document['children'],
+                         _visits=document.get('visits', 0))
@@ -27,10 +27,58 @@ class Config:
     # Set the name for widget to number representation
     classwidgetdict = '../data/serverdata/classWidget.txt'
 
+    # How states are fingerprinted, one of Fingerprint.FINGERPRINTS. State keys are stored in the database and used in
+    # file names, so changing this starts every app's states from scratch.
+    state_fingerprint = 'legacy'
+
+    # Whether crawling an app goes on from the states, clickables and transitions stored by earlier crawls of it
+    warm_start = True
+
+    # Most clicks replayed after a restart to get back to a state with clickables that were never clicked, following
+    # the recorded transitions. 0 starts exploring from wherever the app starts.
+    max_replay_steps = 10
+
+    # How the crawler picks the button to click, one of Strategy.STRATEGIES:
+    # random, score, least_visited, ucb or thompson
+    exploration_strategy = 'random'
+
+    # Model exported by learning/widenrnn.py --export that scores which button to click, see Scorer.py.
+    # If None, buttons are picked uniformly at random.
+    scorer_model = None
+
+    # Category of every app, for scoring with a wide or wnd model
+    categoryfile = '../data/serverdata/category.txt'
+
     # Probability of flinging the screen if scrollable is found
     # not flinging, fling up, fling down
     scroll_probability = [0.8, 0.9, 1.0]
 
+    # Name of the AVD snapshot of a clean, booted emulator, which is saved on the first boot and restored on resets
+    emulator_snapshot = 'clean'
+
+    # Folder of the AVDs, unless ANDROID_AVD_HOME is set
+    avd_home = '~/.android/avd/'
+
+    # Seconds an emulator may take to boot
+    boot_timeout = 300
+
+    # Number of APKs tested before the emulator is reset to its snapshot
+    emulator_reset_every = 50
+
+    # Seconds one iteration of the crawl loop may take before it is abandoned
+    loop_deadline = 60
+
+    # Seconds a single call to the device may take, per type of call
+    deadline_budgets = {'dump': 20, 'info': 5, 'click': 10, 'press': 10, 'scroll': 10, 'text': 10, 'screenshot': 20,
+                        'launch': 30, 'install': 120, 'idle': 10}
+
+    # The UI counts as settled after an action once this many dumps in a row, settle_interval seconds apart, give the
+    # same state. Seconds to wait for that at most after a click, and after launching an app.
+    settle_samples = 2
+    settle_interval = 0.2
+    settle_timeout = 3
+    launch_settle_timeout = 10
+
     # base storage location for log files
     log_location = '../log/'
 
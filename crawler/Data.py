@@ -9,6 +9,12 @@ class Data(object):
         self.category = _category
         self.data_activity = [] if _data_activity is None else _data_activity
 
+    def __setattr__(self, name, value):
+        # Any change marks the object to be written on the next flush to the database
+        super(Data, self).__setattr__(name, value)
+        if name != 'dirty':
+            super(Data, self).__setattr__('dirty', True)
+
     def __str__(self):
         return json.dumps(self.__dict__)
 
@@ -18,7 +24,7 @@ class Data(object):
                 "packname": data.packname,
                 "app_description": data.app_description,
                 "category": data.category,
-                "data-activity": data.data_activity}
+                "data-activity": list(data.data_activity)}
 
     @staticmethod
     def decode_data(document):
@@ -27,4 +33,4 @@ class Data(object):
                     _packname=document['packname'],
                     _app_description=document['app_description'],
                     _category=document['category'],
-                    _data_activity=document['data_activity'])
+                    _data_activity=document['data-activity'])
@@ -13,6 +13,12 @@ class DataActivity(object):
         self.parent_app = _parent_app
         self.clickables = [] if _clickables is None else _clickables
 
+    def __setattr__(self, name, value):
+        # Any change marks the object to be written on the next flush to the database
+        super(DataActivity, self).__setattr__(name, value)
+        if name != 'dirty':
+            super(DataActivity, self).__setattr__('dirty', True)
+
     def __str__(self):
         return json.dumps(self.__dict__)
 
@@ -22,11 +28,11 @@ class DataActivity(object):
                 "state": activity.state,
                 "name": activity.name,
                 "parent_app": activity.parent_app,
-                "clickables": activity.clickables}
+                "clickables": list(activity.clickables)}
 
     @staticmethod
     def decode_data(document):
-        assert document['_type'] == 'data'
+        assert document['_type'] == 'activity'
         return DataActivity(_state=document['state'],
                             _name=document['name'],
                             _parent_app=document['parent_app'],
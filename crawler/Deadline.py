@@ -0,0 +1,128 @@
+import logging
+import subprocess
+import threading
+import time
+
+from crawler.Config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline(object):
+    """
+    Time budget of a piece of work, such as one iteration of the crawl loop, that is passed down into every call that
+    talks to the device. Each call runs under the budget of its operation type (see Config.deadline_budgets), capped
+    by what is left of the deadline, and raises TimeoutError when it does not return in time. Unlike SIGALRM, this
+    works on any thread and deadlines do not cancel each other.
+    """
+
+    # Per operation type: number of calls, number of timeouts, total seconds spent and number of timed out calls whose
+    # thread is still running
+    metrics = {}
+    metrics_lock = threading.Lock()
+    # (op, thread) of the calls that timed out, until their thread is found to have finished
+    abandoned = []
+
+    def __init__(self, seconds, op='loop'):
+        self.op = op
+        self.expires = time.monotonic() + seconds
+        self.cancelled = threading.Event()
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def cancel(self):
+        """
+        Makes every following check() of this deadline fail, e.g. to stop a crawl from another thread.
+        """
+        self.cancelled.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise TimeoutError('timeout. {} was cancelled'.format(self.op))
+        if self.remaining() <= 0:
+            Deadline.record(self.op, 0, True)
+            raise TimeoutError('timeout. {} ran out of time'.format(self.op))
+
+    def budget(self, op):
+        return max(0, min(Config.deadline_budgets[op], self.remaining()))
+
+    def run(self, op, fn, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs) on a helper thread and waits for it for at most budget(op) seconds.
+        A call that times out is abandoned. It is left to finish on its own since there is no way to interrupt it.
+        :param op: operation type, one of the keys of Config.deadline_budgets
+        :return: the return value of fn
+        """
+        self.check()
+        timeout = self.budget(op)
+        result = {}
+
+        def target():
+            try:
+                result['value'] = fn(*args, **kwargs)
+            except BaseException as e:
+                result['error'] = e
+
+        start = time.monotonic()
+        thread = threading.Thread(target=target, name='deadline-' + op, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        timed_out = thread.is_alive()
+        Deadline.record(op, time.monotonic() - start, timed_out)
+
+        if timed_out:
+            with Deadline.metrics_lock:
+                Deadline.abandoned.append((op, thread))
+            logger.warning('Abandoned a {} call, {} abandoned calls are still running'.format(op, Deadline.leaked()))
+            raise TimeoutError('timeout. {} took longer than {:.1f}s'.format(op, timeout))
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    def communicate(self, op, process):
+        """
+        process.communicate() under the budget of op. The process is killed when it times out.
+        """
+        self.check()
+        timeout = self.budget(op)
+        start = time.monotonic()
+        try:
+            output = process.communicate(timeout=timeout)
+            Deadline.record(op, time.monotonic() - start, False)
+            return output
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            Deadline.record(op, time.monotonic() - start, True)
+            raise TimeoutError('timeout. {} took longer than {:.1f}s'.format(op, timeout))
+
+    @staticmethod
+    def record(op, seconds, timed_out):
+        with Deadline.metrics_lock:
+            metric = Deadline.metrics.setdefault(op, {'calls': 0, 'timeouts': 0, 'seconds': 0.0, 'running': 0})
+            metric['calls'] += 1
+            metric['timeouts'] += 1 if timed_out else 0
+            metric['seconds'] += seconds
+
+    @staticmethod
+    def leaked():
+        """
+        Updates the number of abandoned calls that are still running in the metrics. Each of them holds a thread,
+        and usually a connection to the device.
+        :return: number of abandoned calls that are still running
+        """
+        with Deadline.metrics_lock:
+            Deadline.abandoned = [(op, thread) for op, thread in Deadline.abandoned if thread.is_alive()]
+            for metric in Deadline.metrics.values():
+                metric['running'] = 0
+            for op, thread in Deadline.abandoned:
+                Deadline.metrics[op]['running'] += 1
+            return len(Deadline.abandoned)
+
+    @staticmethod
+    def report():
+        Deadline.leaked()
+        with Deadline.metrics_lock:
+            return ', '.join('{}: {} calls, {} timeouts, {} still running, {:.1f}s'.format(
+                op, m['calls'], m['timeouts'], m['running'], m['seconds']) for op, m in sorted(Deadline.metrics.items()))
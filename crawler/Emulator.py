@@ -0,0 +1,245 @@
+"""======================================================
+
+Lifecycle of the emulators the crawler runs on.
+
+The first boot of an AVD is a cold boot with -wipe-data, after which the booted, clean emulator is saved as the AVD
+snapshot Config.emulator_snapshot. Every later start boots from that snapshot, and resetting a running emulator loads
+it again, which takes seconds instead of a cold boot. Booting is waited for with a single adb call that returns as
+soon as sys.boot_completed is set, rather than polling with fixed sleeps. Stopping an emulator waits until adb no
+longer lists it, so that a start right after it does not find the dying emulator still booted.
+
+EmulatorPool keeps a spare emulator booted in the background, so a reset only has to switch over to it.
+
+Running this file saves the snapshot of an AVD, e.g. python3 Emulator.py avd0 emulator-5554
+
+======================================================"""
+import argparse
+import logging
+import os
+import subprocess
+import time
+
+from crawler.Config import Config
+
+logger = logging.getLogger(__name__)
+
+# Runs on the device and returns once booting is done
+BOOT_COMPLETED = 'while [ "$(getprop sys.boot_completed)" != "1" ]; do sleep 0.5; done'
+
+
+class Emulator(object):
+    def __init__(self, avdname, device_name, window=False, snapshot=None, read_only=False):
+        """
+        :param avdname: name of the AVD
+        :param device_name: e.g. emulator-5554, which sets the port the emulator is started on
+        :param snapshot: name of the clean snapshot, Config.emulator_snapshot by default
+        :param read_only: start with -read-only, so that several emulators can run the same AVD at once. The AVD can
+        not be changed then, so its snapshot has to be saved beforehand.
+        """
+        self.avdname = avdname
+        self.device_name = device_name
+        self.window = window
+        self.snapshot = Config.emulator_snapshot if snapshot is None else snapshot
+        self.read_only = read_only
+        self.process = None
+
+    def adb(self, *args, timeout=None):
+        """
+        :return: CompletedProcess of adb -s device_name args
+        """
+        return subprocess.run([Config.android_home + 'platform-tools/adb', '-s', self.device_name] + list(args),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+
+    def snapshot_path(self):
+        avd_home = os.environ.get('ANDROID_AVD_HOME', os.path.expanduser(Config.avd_home))
+        return os.path.join(avd_home, self.avdname + '.avd', 'snapshots', self.snapshot)
+
+    def has_snapshot(self):
+        return os.path.isdir(self.snapshot_path())
+
+    def is_booted(self):
+        try:
+            out = self.adb('shell', 'getprop', 'sys.boot_completed', timeout=Config.deadline_budgets['info'])
+        except subprocess.TimeoutExpired:
+            return False
+        return out.returncode == 0 and out.stdout.strip() == b'1'
+
+    def launch(self):
+        """
+        Starts the emulator process without waiting for it, from the snapshot if there is one and cold otherwise.
+        """
+        command = [Config.android_home + 'emulator/emulator', '-avd', self.avdname, '-skin', '480x800', '-port',
+                   self.device_name[-4:], '-no-snapshot-save']
+        if self.has_snapshot():
+            command += ['-snapshot', self.snapshot]
+        else:
+            command += ['-wipe-data', '-no-snapshot-load']
+        if self.read_only:
+            command.append('-read-only')
+        if not self.window:
+            command += ['-no-audio', '-no-window']
+        logger.info('Starting ' + self.device_name + ': ' + ' '.join(command))
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_for_boot(self, timeout=None):
+        """
+        Blocks until the device reports sys.boot_completed.
+        :raise TimeoutError: if it has not booted after timeout seconds, Config.boot_timeout by default
+        """
+        timeout = Config.boot_timeout if timeout is None else timeout
+        try:
+            self.adb('wait-for-device', 'shell', BOOT_COMPLETED, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError('timeout. ' + self.device_name + ' did not boot within ' + str(timeout) + ' seconds')
+
+    def is_gone(self):
+        """
+        :return: whether adb no longer lists the device as online
+        """
+        try:
+            out = self.adb('get-state', timeout=Config.deadline_budgets['info'])
+        except subprocess.TimeoutExpired:
+            return False
+        return out.returncode != 0 or out.stdout.strip() != b'device'
+
+    def wait_for_offline(self, timeout=None):
+        """
+        Blocks until adb no longer sees the device, so that an emulator that is shutting down is not taken for a booted
+        one by the next start().
+        :raise TimeoutError: if it is still there after timeout seconds, Config.boot_timeout by default
+        """
+        timeout = Config.boot_timeout if timeout is None else timeout
+        expires = time.monotonic() + timeout
+        while not self.is_gone():
+            if time.monotonic() >= expires:
+                raise TimeoutError('timeout. ' + self.device_name + ' did not go offline within ' + str(timeout) +
+                                   ' seconds')
+            time.sleep(0.5)
+
+    def clean(self):
+        self.adb('shell', 'rm', '-r', '/mnt/sdcard/*', timeout=Config.deadline_budgets['info'])
+
+    def save_snapshot(self):
+        out = self.adb('emu', 'avd', 'snapshot', 'save', self.snapshot, timeout=Config.boot_timeout)
+        if b'OK' in out.stdout:
+            logger.info('Saved snapshot ' + self.snapshot + ' of ' + self.avdname)
+            return True
+        logger.warning('Could not save snapshot ' + self.snapshot + ': ' + out.stdout.decode('utf-8', 'replace'))
+        return False
+
+    def start(self):
+        """
+        Starts the emulator unless it is running already, and waits until it has booted. After a cold boot the clean
+        emulator is saved as the snapshot, unless the AVD is read only.
+        """
+        if self.is_booted():
+            self.clean()
+            return self
+        cold = not self.has_snapshot()
+        # A spare of EmulatorPool may have been launched already
+        if self.process is None or self.process.poll() is not None:
+            self.launch()
+        self.wait_for_boot()
+        if cold and not self.read_only:
+            self.save_snapshot()
+        self.clean()
+        return self
+
+    def reset(self):
+        """
+        Brings the running emulator back to the clean snapshot, or restarts it if that does not work.
+        :return: self
+        """
+        if self.has_snapshot() and self.is_booted():
+            try:
+                out = self.adb('emu', 'avd', 'snapshot', 'load', self.snapshot, timeout=Config.boot_timeout)
+                if b'OK' in out.stdout:
+                    self.wait_for_boot()
+                    logger.info('Reset ' + self.device_name + ' to snapshot ' + self.snapshot)
+                    return self
+            except (subprocess.TimeoutExpired, TimeoutError):
+                pass
+            logger.info('Loading snapshot ' + self.snapshot + ' failed, restarting ' + self.device_name)
+        self.stop()
+        return self.start()
+
+    def stop(self):
+        """
+        Kills the emulator and waits until adb no longer sees it. The emulator may have been started by another
+        process, e.g. through Utility.stop_emulator, so waiting for the process is not enough.
+        :raise TimeoutError: if the device is still there after Config.boot_timeout seconds
+        """
+        try:
+            self.adb('emu', 'kill', timeout=Config.deadline_budgets['info'])
+        except subprocess.TimeoutExpired:
+            pass
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=Config.boot_timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+        self.wait_for_offline()
+
+
+class EmulatorPool(object):
+    """
+    Runs a spare emulator next to the active one, both read only. A reset switches over to the spare,
+    which has long finished booting, and starts a fresh spare in the background in place of the old active emulator.
+    """
+
+    def __init__(self, avdnames, device_names, window=False):
+        """
+        :param avdnames: AVDs of the active and the spare emulator, which may be the same AVD
+        :param device_names: names of the active and the spare emulator, e.g. emulator-5554 and emulator-5556
+        """
+        if len(set(device_names)) != len(device_names):
+            raise ValueError('Emulators of a pool need distinct device names, got ' + ', '.join(device_names))
+        self.emulators = [Emulator(avdname, name, window, read_only=True)
+                          for avdname, name in zip(avdnames, device_names)]
+        for emulator in self.emulators:
+            if not emulator.has_snapshot():
+                logger.warning('AVD ' + emulator.avdname + ' has no snapshot yet, so its emulator boots cold. Save it '
+                               'first, e.g. python3 Emulator.py ' + emulator.avdname + ' ' + emulator.device_name)
+
+    @property
+    def active(self):
+        return self.emulators[0]
+
+    def start(self):
+        for emulator in self.emulators[1:]:
+            emulator.launch()
+        self.active.start()
+        return self.active
+
+    def reset(self):
+        """
+        Switches over to the spare emulator.
+        :return: the emulator that is active from now on. Its device name differs from the previous one.
+        """
+        old = self.emulators.pop(0)
+        old.stop()
+        self.active.start()
+        old.launch()
+        self.emulators.append(old)
+        return self.active
+
+    def stop(self):
+        for emulator in self.emulators:
+            emulator.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('avdname', help='Name of the AVD.')
+    parser.add_argument('device_name', help='Name the emulator is started as, e.g. emulator-5554.')
+    parser.add_argument("--window", "-w", action="store_true", help='Opens up the emulator window.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    emulator = Emulator(args.avdname, args.device_name, args.window)
+    if emulator.has_snapshot():
+        print('Snapshot ' + emulator.snapshot_path() + ' exists already.')
+    else:
+        emulator.start()
+        emulator.stop()
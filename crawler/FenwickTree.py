@@ -0,0 +1,69 @@
+import random
+
+
+class FenwickTree(object):
+    """
+    Weights that can be changed, appended to and sampled from in O(log n), as a binary indexed tree of prefix sums.
+    """
+
+    def __init__(self, weights=()):
+        self.weights = []
+        self.tree = [0.0]
+        for w in weights:
+            self.append(w)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def __getitem__(self, i):
+        return self.weights[i]
+
+    def prefix(self, i):
+        """
+        :return: sum of the first i weights
+        """
+        total = 0.0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def total(self):
+        return self.prefix(len(self.weights))
+
+    def append(self, weight):
+        self.weights.append(weight)
+        i = len(self.weights)
+        # Node i covers the weights i - lowbit(i) + 1 to i
+        self.tree.append(weight + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+
+    def set(self, i, weight):
+        delta = weight - self.weights[i]
+        self.weights[i] = weight
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """
+        :return: the first index whose prefix sum including itself is greater than value
+        """
+        pos = 0
+        step = 1 << (len(self.weights).bit_length())
+        while step:
+            nxt = pos + step
+            if nxt < len(self.tree) and self.tree[nxt] <= value:
+                pos = nxt
+                value -= self.tree[nxt]
+            step >>= 1
+        return min(pos, len(self.weights) - 1)
+
+    def sample(self, rng=random):
+        """
+        :return: an index drawn in proportion to the weights, or -1 if they are all 0
+        """
+        total = self.total()
+        if total <= 0:
+            return -1
+        return self.find(rng.random() * total)
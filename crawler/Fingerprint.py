@@ -0,0 +1,191 @@
+"""======================================================
+
+State fingerprints of a parsed hierarchy dump.
+
+'legacy' is the hash the crawler has always used (every node's index followed by every node's class number, MD5'd),
+which is what all the stored state keys are made of. 'structure' and 'structure_text' hash the tree bottom-up
+instead, so that the key is made of the digests of the subtrees and nodes are not merely concatenated. Subtrees that
+are the same as in the previous dump reuse their digests instead of being hashed again. 'structure_text' also takes
+the text of the nodes into account, which tells apart screens that differ only in text.
+
+Running this file checks a strategy against the legacy hash over a folder of saved -FULL.xml dumps:
+e.g. python3 Fingerprint.py ../data/xml/ structure
+
+======================================================"""
+import argparse
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+from glob import glob
+
+from crawler.Config import Config
+
+
+class WidgetDictionary(object):
+    """
+    Mapping of widget class name to its number, read once from disk and kept in memory.
+    Unknown classes get the next free number and are written through to disk right away.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.ids = {}
+        self.load()
+
+    def load(self):
+        with open(self.filename) as f:
+            self.ids = json.load(f)
+
+    def __getitem__(self, class_name):
+        if class_name in self.ids:
+            return self.ids[class_name]
+        return self.add(class_name)
+
+    def add(self, class_name):
+        self.add_all([class_name])
+        return self.ids[class_name]
+
+    def add_all(self, class_names):
+        """
+        Numbers the class names that are not numbered yet, in the given order, and writes the dictionary to disk if
+        any of them were new.
+        """
+        if all(class_name in self.ids for class_name in class_names):
+            return
+        # Other crawler processes share the file and may have numbered some of them in the meantime
+        self.load()
+        ind = max(self.ids.values()) + 1 if self.ids else 0
+        changed = False
+        for class_name in class_names:
+            if class_name not in self.ids:
+                self.ids[class_name] = ind
+                ind += 1
+                changed = True
+        if changed:
+            with open(self.filename, 'w') as f:
+                json.dump(self.ids, f)
+
+    def add_root(self, root):
+        """
+        Numbers every class of a hierarchy in dump order, the order get_class_dict has always numbered them in, so that
+        the numbers do not depend on the order a fingerprint strategy visits the nodes in.
+        """
+        self.add_all([element.attrib['class'] for element in root.iter() if 'class' in element.attrib])
+
+
+class LegacyFingerprint(object):
+    def __call__(self, root, widgets):
+        bit_rep = ''
+        btn_rep = ''
+        for element in root.iter('node'):
+            bit_rep += element.get('index')
+            btn_rep += str(widgets[element.attrib['class']])
+        return hashlib.md5((bit_rep + btn_rep).encode('utf-8')).hexdigest()
+
+
+class MerkleFingerprint(object):
+    """
+    Hashes every node from its index, class number, the given attributes and the digests of its children.
+
+    Every dump is parsed anew, so the tree is still walked in full, but a node is only hashed if it is not the same as
+    in the current or the previous dump. Nodes are looked up by their raw attributes and the digests of their children,
+    which is cheap to build since it needs neither the class numbers nor MD5. A class keeps its number once it has
+    one, so the raw class name stands in for it.
+    """
+
+    def __init__(self, attributes=()):
+        self.attributes = attributes
+        self.previous = {}
+        self.current = {}
+        # Number of nodes hashed so far, the rest reused the digest of an unchanged subtree
+        self.hashed = 0
+
+    def __call__(self, root, widgets):
+        self.previous, self.current = self.current, {}
+        return self.digest(root, widgets)
+
+    def digest(self, node, widgets):
+        children = tuple(self.digest(child, widgets) for child in node)
+        key = (node.tag, node.get('index'), node.get('class')) + tuple(
+            node.get(attribute) for attribute in self.attributes) + children
+        digest = self.current.get(key)
+        if digest is None:
+            digest = self.previous.get(key)
+            if digest is None:
+                digest = self.hash(node, widgets, children)
+            self.current[key] = digest
+        return digest
+
+    def hash(self, node, widgets, children):
+        self.hashed += 1
+        if node.tag == 'node':
+            signature = (node.get('index'), widgets[node.attrib['class']]) + tuple(
+                node.get(attribute) for attribute in self.attributes) + children
+        else:
+            signature = (node.tag,) + children
+        return hashlib.md5(repr(signature).encode('utf-8')).hexdigest()
+
+
+FINGERPRINTS = {
+    'legacy': LegacyFingerprint,
+    'structure': lambda: MerkleFingerprint(),
+    'structure_text': lambda: MerkleFingerprint(('text', 'content-desc')),
+}
+
+widget_dictionaries = {}
+fingerprints = {}
+
+
+def get_widget_dictionary(filename=None):
+    filename = Config.classwidgetdict if filename is None else filename
+    if filename not in widget_dictionaries:
+        widget_dictionaries[filename] = WidgetDictionary(filename)
+    return widget_dictionaries[filename]
+
+
+def get_fingerprint(strategy=None):
+    strategy = Config.state_fingerprint if strategy is None else strategy
+    if strategy not in fingerprints:
+        fingerprints[strategy] = FINGERPRINTS[strategy]()
+    return fingerprints[strategy]
+
+
+def state_key(root, pn, strategy=None):
+    widgets = get_widget_dictionary()
+    widgets.add_root(root)
+    return pn + '-' + get_fingerprint(strategy)(root, widgets)
+
+
+def equivalent(roots, strategy):
+    """
+    Checks that a strategy tells states apart exactly like the legacy hash does, i.e. two dumps get the same
+    fingerprint under the strategy if and only if they get the same legacy fingerprint.
+    :return: list of (legacy fingerprint, strategy fingerprint) pairs that break this. Empty if equivalent.
+    """
+    widgets = get_widget_dictionary()
+    legacy = LegacyFingerprint()
+    other = FINGERPRINTS[strategy]()
+    legacy_to_other = {}
+    other_to_legacy = {}
+    mismatches = []
+    for root in roots:
+        widgets.add_root(root)
+        a = legacy(root, widgets)
+        b = other(root, widgets)
+        if legacy_to_other.setdefault(a, b) != b or other_to_legacy.setdefault(b, a) != a:
+            mismatches.append((a, b))
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('xml_dir', help='Directory of the saved -FULL.xml dumps, e.g. Config.xml_location.')
+    parser.add_argument('strategy', choices=sorted(FINGERPRINTS), help='Fingerprint strategy to check.')
+    args = parser.parse_args()
+
+    files = [y for x in os.walk(args.xml_dir) for y in glob(os.path.join(x[0], '*-FULL.xml'))]
+    result = equivalent((ET.parse(f).getroot() for f in files), args.strategy)
+    print('Checked %d dumps: %d mismatches against the legacy hash.' % (len(files), len(result)))
+    for a, b in result:
+        print('legacy %s <-> %s %s' % (a, args.strategy, b))
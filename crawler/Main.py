@@ -1,10 +1,11 @@
 import argparse
+import atexit
 import codecs
+import collections
 import logging
 import os
 import random
 import re
-import signal
 import socket
 import string
 import subprocess
@@ -15,12 +16,20 @@ from enum import Enum
 import uiautomator
 from uiautomator import Device
 
+from crawler import Strategy
 from crawler import Utility
 from crawler.Clickable import Clickable
 from crawler.Config import Config
 from crawler.Data import Data
 from crawler.DataActivity import DataActivity
+from crawler.Deadline import Deadline
+from crawler.Emulator import Emulator, EmulatorPool
 from crawler.Mongo import Mongo
+from crawler.Navigator import Navigator
+from crawler.Scorer import Scorer
+from crawler.SettleDetector import SettleDetector
+from crawler.UISnapshot import UISnapshot
+from crawler.WriteBehind import WriteBehind
 
 parser = argparse.ArgumentParser()
 parser.add_argument('device_name', metavar='D',
@@ -31,23 +40,32 @@ parser.add_argument('apk_dir', help='The directory where all apks are stored.')
 parser.add_argument('avdname', help='Name of the AVD.')
 parser.add_argument("--window", "-w", action="store_true",
                     help='If true, opens up the emulator window. Otherwise, a windowless emulator.')
-args = parser.parse_args()
+parser.add_argument("--warm_pool", metavar='SPARE',
+                    help='Keep a spare emulator booted as device SPARE, e.g. emulator-5556, and switch over to it '
+                         'instead of resetting the emulator. SPARE must not be used by any other instance.')
+parser.add_argument("--spare_avd",
+                    help='Name of the AVD of the spare emulator of --warm_pool. By default, the AVD of D.')
 
-log_location = Config.log_location
-if not os.path.exists(log_location):
-    os.makedirs(log_location)
-logging.basicConfig(filename=log_location + 'main-' + args.device_name + '.log', level=logging.DEBUG)
 logger = logging.getLogger(__name__)
-logging.getLogger().addHandler(logging.StreamHandler())
-logging.info('================Begin logging==================')
 
-now = time.strftime("%c")
-logger.info(now)
-
-mongo = Mongo()
+# Created by attach_device(), so that every worker process of the Orchestrator gets a client of its own. MongoClient
+# is not fork-safe.
+mongo = None
 
 android_home = Config.android_home
 
+# Set by attach_device() before crawling
+d = None
+device_name = ''
+avdname = ''
+window = False
+writer = None
+# Emulator or EmulatorPool the device runs on, set by the __main__ block
+emulator = None
+scorer = None
+strategy = None
+display_size = None
+
 activities = {}
 clickables = {}
 click_hash = {}
@@ -58,15 +76,49 @@ zero_counter = 0
 horizontal_counter = 0
 no_clickable_btns_counter = 0
 sequence = []
+# Steps of the current APK that were already handed over to the writer, kept for the scorer's n-grams
+history = collections.deque(maxlen=32)
+snapshot = None
+settle_detector = SettleDetector()
+navigator = Navigator()
+
 
+def setup_logging(_device_name):
+    log_location = Config.log_location
+    if not os.path.exists(log_location):
+        os.makedirs(log_location)
+    logging.basicConfig(filename=log_location + 'main-' + _device_name + '.log', level=logging.DEBUG)
+    logging.getLogger().addHandler(logging.StreamHandler())
+    logging.info('================Begin logging==================')
 
-def signal_handler(signum, frame):
-    logger.info("timeout call...")
-    raise Exception('timeout.')
-    # raise TimeoutError("Timed out!")
+    now = time.strftime("%c")
+    logger.info(now)
 
 
-signal.signal(signal.SIGALRM, signal_handler)
+def attach_device(_device_name, _device, _avdname, _window):
+    """
+    Sets the device that the crawler drives. Every process crawls with exactly one device.
+    :param _device_name: e.g. emulator-5554
+    :param _device: uiautomator Device of _device_name
+    :param _avdname: name of the AVD, used when the emulator has to be restarted
+    :param _window: whether the emulator is started with a window
+    :return:
+    """
+    global d, device_name, avdname, window, mongo, writer, scorer, strategy, display_size
+    d = _device
+    device_name = _device_name
+    avdname = _avdname
+    window = _window
+    display_size = None
+    if mongo is None:
+        mongo = Mongo()
+    if writer is None:
+        writer = WriteBehind()
+        atexit.register(writer.close)
+    if strategy is None:
+        strategy = Strategy.get_strategy(Config.exploration_strategy)
+    if scorer is None and Config.scorer_model is not None:
+        scorer = Scorer(Config.scorer_model, Config.categoryfile)
 
 
 class APP_STATE(Enum):
@@ -84,6 +136,73 @@ class APP_STATE(Enum):
     UNK = -10
 
 
+def current_snapshot(pack_name, deadline):
+    """
+    Returns the snapshot of the current screen. The hierarchy is only dumped again if an action was sent to the device
+    since the last snapshot was taken.
+    :param pack_name: package name the state key is computed for
+    :param deadline: Deadline the dump has to be done within
+    :return: UISnapshot
+    """
+    global snapshot
+    if snapshot is None or snapshot.pack_name != pack_name:
+        snapshot = UISnapshot(d, pack_name, deadline)
+    snapshot.deadline = deadline
+    return snapshot
+
+
+def invalidate_snapshot():
+    """
+    Has to be called before any action is sent to the device, since the screen may change from then on.
+    """
+    global snapshot
+    snapshot = None
+
+
+def settle(pack_name, deadline, timeout=None):
+    """
+    Waits until the screen has settled after an action, and makes the settled screen the current snapshot.
+    :param timeout: seconds to wait at most, Config.settle_timeout by default
+    :return: UISnapshot
+    """
+    global snapshot
+    snapshot = settle_detector.wait(d, pack_name, deadline, timeout)
+    return snapshot
+
+
+def clickable_at(pack_name, index):
+    """
+    Selector of the index-th clickable of the package, in the order of UISnapshot.clickables(). Unlike indexing or
+    iterating over d(clickable='true', packageName=pack_name), this does not ask the device for the number of matches,
+    so nothing is sent to the device until the returned object is acted on under a deadline.
+    """
+    return d(clickable='true', packageName=pack_name, instance=index)
+
+
+def store_data(learning_data):
+    """
+    Hands everything that changed since the last flush over to the writer. Only the documents are built on this
+    thread, the database writes happen in the background.
+    """
+    requests = Utility.collect_dirty(learning_data, activities, clickables)
+    writer.submit(Utility.write_requests, mongo, requests)
+    return 1
+
+
+def write_sequence(pack_name, line_format, footer=''):
+    """
+    Hands the sequence recorded so far over to the writer, to be appended to the sequence file of the package.
+    """
+    lines = []
+    history.extend(sequence)
+    while sequence:
+        i = sequence.pop()
+        lines.append(line_format.format(*i))
+    if footer:
+        lines.append(footer)
+    writer.submit(Utility.append_lines, Config.seqq_location + pack_name + '/seqq-' + pack_name + '.txt', lines)
+
+
 def init():
     """
     Initializing all global variables back to its original state after every testing is done on APK
@@ -99,22 +218,47 @@ def init():
     zero_counter = 0
     horizontal_counter = 0
     sequence = []
+    history.clear()
+    Utility.logged_states.clear()
+    if strategy is not None:
+        strategy.reset()
+    navigator.reset()
+    invalidate_snapshot()
 
 
-def click_button(new_click_els, pack_name, app_name):
+def score_clickables(snap, pack_name, deadline):
+    """
+    Probabilities of the clickables of the snapshot leading somewhere new, from the scorer, all computed at once.
+    :return: list of probabilities in the order of snap.clickables(pack_name), or None if there is no scorer.
+    """
+    global display_size
+    click_infos = snap.clickable_infos(pack_name)
+    if scorer is None or len(click_infos) < 2:
+        return None
+    if display_size is None:
+        display_size = deadline.run('info', Utility.get_display_size, d)
+    steps = [(key, text) for state, key, text in list(history) + sequence]
+    return scorer.score(pack_name, [Utility.btn_info_to_key(info) for info in click_infos],
+                        [info['text'] for info in click_infos], steps, display_size).tolist()
+
+
+def click_button(pack_name, app_name, deadline):
     # Have to use packageName since there might be buttons leading to popups,
     # which can continue exploding into more activity if not limited.
     global d, clickables, parent_map, visited, scores, mask, zero_counter, no_clickable_btns_counter, horizontal_counter, sequence
-    old_state = Utility.get_state(d, pack_name)
+    snap = current_snapshot(pack_name, deadline)
+    old_state = snap.state
 
-    click_els = d(clickable='true', packageName=pack_name) if new_click_els is None else new_click_els
     if old_state not in visited:
         print('===')
         print(old_state)
         print(visited)
         print('errror')
+    if old_state not in parent_map:
+        # The state was loaded from an earlier crawl, see StateGraph
+        parent_map[old_state] = snap.parent_map.copy()
     counter = 0
-    btn_result = make_decision(click_els, visited[old_state])
+    btn_result = make_decision(snap.clickables(pack_name), old_state, score_clickables(snap, pack_name, deadline))
 
     ''' Use this when making decision based on probability
     while True:
@@ -124,7 +268,7 @@ def click_button(new_click_els, pack_name, app_name):
             logger.info('trying to make decision and find btn to click again.')
             counter += 1
         if counter >= 30:
-            return None, None, APP_STATE.FAILTOCLICK
+            return None, APP_STATE.FAILTOCLICK
     '''
 
     logger.info('Length of the parent_map currently: ' + str(len(parent_map)))
@@ -136,15 +280,16 @@ def click_button(new_click_els, pack_name, app_name):
 
         print('no clickable1 : {}'.format(no_clickable_btns_counter))
         if no_clickable_btns_counter >= 5:
-            return None, None, APP_STATE.DEADLOCK
+            return None, APP_STATE.DEADLOCK
         elif zero_counter >= 30:
-            return None, None, APP_STATE.DEADLOCK
+            return None, APP_STATE.DEADLOCK
 
         try:
             # Check if more states available when swiping it
             # For the case of apps where there's horizontal motion with 4 panes usually.
             for i in range(5):
-                d(scrollable=True).fling.horiz.forward()
+                invalidate_snapshot()
+                deadline.run('scroll', d(scrollable=True).fling.horiz.forward)
                 sequence.append((old_state, 'FLING HORIZONTAL', ''))
         except uiautomator.JsonRPCError:
             logger.info("Can't scroll horizontal.")
@@ -153,30 +298,34 @@ def click_button(new_click_els, pack_name, app_name):
             if horizontal_counter >= 5:
                 raise Exception('Tried scrolling horizontal 5 times but fail so stop.')
         finally:
-            new_state = Utility.get_state(d, pack_name)
+            new_state = current_snapshot(pack_name, deadline).state
             if new_state != old_state:
-                return None, new_state, 1
-            d.press('back')
+                return new_state, 1
+            invalidate_snapshot()
+            deadline.run('press', d.press, 'back')
             sequence.append((old_state, 'BACK', ''))
 
             # Issue with clicking back button prematurely
-            if Utility.get_package_name(d) == 'com.google.android.apps.nexuslauncher':
+            if deadline.run('info', Utility.get_package_name, d) == 'com.google.android.apps.nexuslauncher':
                 subprocess.Popen(
                     [android_home + '/platform-tools/adb', '-s', device_name, 'shell', 'monkey', '-p', pack_name, '5'],
                     stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-            return None, Utility.get_state(d, pack_name), 1
+            return current_snapshot(pack_name, deadline).state, 1
     else:
         try:
-            if click_els[btn_result].exists:
-                click_btn_info = click_els[btn_result].info
+            click_infos = snap.clickable_infos(pack_name)
+            if btn_result < len(click_infos):
+                click_btn_info = click_infos[btn_result]
                 click_btn_key = Utility.btn_info_to_key(click_btn_info)
                 click_btn_text = click_btn_info['text']
                 click_btn_class = click_btn_info['className']
-                click_btn = click_els[btn_result]
+                click_btn = clickable_at(pack_name, btn_result)
 
                 # Check if the key of button to be clicked is equal to the key of button stored in clickables
                 if click_btn_key == clickables[old_state][btn_result].name:
-                    click_btn.click.wait()
+                    invalidate_snapshot()
+                    deadline.run('click', click_btn.click.wait)
+                    settle(pack_name, deadline)
                     sequence.append((old_state, click_btn_key, click_btn_text))
                 # Search through list to see if the button is of another number
                 else:
@@ -184,17 +333,19 @@ def click_button(new_click_els, pack_name, app_name):
                     found = False
                     for i in clickables[old_state]:
                         if click_btn_key == i.name:
-                            click_btn.click.wait()
+                            invalidate_snapshot()
+                            deadline.run('click', click_btn.click.wait)
+                            settle(pack_name, deadline)
                             sequence.append((old_state, click_btn_key, click_btn_text))
                             btn_result = ind
                             found = True
                         ind += 1
                     if not found:
                         # If no such clickable is found, we append the clickable into the list
+                        snap = current_snapshot(pack_name, deadline)
                         logger.info(old_state)
-                        logger.info(Utility.get_state(d, pack_name))
-                        new_parent = Utility.create_child_to_parent(dump=d.dump(compressed=False))
-                        Utility.merge_dicts(parent_map[old_state], new_parent)
+                        logger.info(snap.state)
+                        Utility.merge_dicts(parent_map[old_state], snap.parent_map)
                         _parent = Utility.get_parent_with_key(click_btn_key, parent_map[old_state])
                         if _parent != -1:
                             sibs = [Utility.xml_btn_to_key(sib) for sib in
@@ -218,45 +369,94 @@ def click_button(new_click_els, pack_name, app_name):
                 # If the button that is clicked is EditText or TextView, it might cause autocomplete tab to appear
                 # We have to add this to close the tab that appears.
                 if click_btn_class == 'android.widget.EditText' or click_btn_class == 'android.widget.TextView':
-                    click_els = d(clickable='true', packageName=pack_name)
-
-                    for i in click_els:
-                        if i.info['text'] == 'ADD TO DICTIONARY':
-                            click_els[0].click.wait()
+                    for i in current_snapshot(pack_name, deadline).clickable_infos(pack_name):
+                        if i['text'] == 'ADD TO DICTIONARY':
+                            invalidate_snapshot()
+                            deadline.run('click', clickable_at(pack_name, 0).click.wait)
+                            settle(pack_name, deadline)
                             break
 
-                new_state = Utility.get_state(d, pack_name)
-                newstate_pn_bool = Utility.get_package_name(d) == pack_name
+                snap = current_snapshot(pack_name, deadline)
+                new_state = snap.state
+                newstate_pn_bool = deadline.run('info', Utility.get_package_name, d) == pack_name
 
                 if new_state != old_state:
                     clickables[old_state][
                         btn_result].next_transition_state = new_state if newstate_pn_bool else 'OUTOFAPK'
-                    new_click_els = d(clickable='true', packageName=pack_name)
-                    score_increment = len(new_click_els)
+                    score_increment = len(snap.clickables(pack_name))
                     scores[old_state][btn_result] = score_increment
                     visited[old_state][btn_result][1] += 1
                     visited[old_state][btn_result][0] = (score_increment / (2 * visited[old_state][btn_result][1]))
+                    clickables[old_state][btn_result].visits += 1
+                    strategy.update(old_state, btn_result, visited[old_state])
                     clickables[old_state][btn_result].score = score_increment
-                    return new_click_els, new_state, 1
+                    return new_state, 1
                 else:
                     # No change in state so give it a score of 0 since it doesn't affect anything
                     clickables[old_state][
                         btn_result].next_transition_state = old_state if newstate_pn_bool else 'OUTOFAPK'
                     visited[old_state][btn_result][1] += 1
                     visited[old_state][btn_result][0] = (0 / visited[old_state][btn_result][1])
-                    return click_els, new_state, 1
+                    clickables[old_state][btn_result].visits += 1
+                    strategy.update(old_state, btn_result, visited[old_state])
+                    return new_state, 1
             else:
                 raise Exception('Warning, no such buttons available in click_button()')
         except IndexError:
             logger.info('@@@@@@@@@@@@@@@=============================')
             logger.info("Index error with finding right button to click. Restarting...")
-            logger.warning(len(click_els))
+            logger.warning(len(snap.clickable_infos(pack_name)))
             logger.warning(len(visited[old_state]))
             logger.warning(btn_result)
             raise IndexError('')
 
 
-def make_decision(click_els, _scores_arr):
+def replay_to_frontier(pack_name):
+    """
+    Clicks along the shortest recorded path from the current state to the nearest state with clickables that were
+    never clicked. Every click gets a Deadline of its own. Replaying stops at the first click that fails or does not
+    lead to the recorded state, and that transition is left out from then on.
+    :return: state the device is in afterwards
+    """
+    state = current_snapshot(pack_name, Deadline(Config.loop_deadline)).state
+    steps = navigator.path(state, clickables, visited, Config.max_replay_steps)
+    if not steps:
+        return state
+    logger.info('Replaying {} clicks to frontier state {}'.format(len(steps), steps[-1][2]))
+    for from_state, name, to_state in steps:
+        deadline = Deadline(Config.loop_deadline)
+        try:
+            snap = current_snapshot(pack_name, deadline)
+            if snap.state != from_state:
+                return snap.state
+            keys = [Utility.btn_info_to_key(info) for info in snap.clickable_infos(pack_name)]
+            if name not in keys:
+                navigator.fail(from_state, name)
+                return snap.state
+            index = keys.index(name)
+            click_btn = clickable_at(pack_name, index)
+            invalidate_snapshot()
+            deadline.run('click', click_btn.click.wait)
+            settle(pack_name, deadline)
+            sequence.append((from_state, name, snap.clickable_infos(pack_name)[index]['text']))
+            state = current_snapshot(pack_name, deadline).state
+        except (TimeoutError, uiautomator.JsonRPCError) as e:
+            logger.info('Replaying {} of state {} failed: {}'.format(name, from_state, e))
+            navigator.fail(from_state, name)
+            invalidate_snapshot()
+            return current_snapshot(pack_name, Deadline(Config.loop_deadline)).state
+        if state != to_state:
+            navigator.fail(from_state, name)
+            return state
+    return state
+
+
+def make_decision(click_els, state, probabilities=None):
+    """
+    :param state: state the clickables belong to, whose visited stats the strategy reads
+    :param probabilities: chance of every clickable leading somewhere new, from score_clickables(), or None
+    :return: index of the clickable to click, or -1 if there is none
+    """
     global zero_counter, no_clickable_btns_counter
     if len(click_els) == 0:
         logger.info('No clickable buttons available. Returning -1.')
@@ -269,36 +469,16 @@ def make_decision(click_els, _scores_arr):
         zero_counter += 1
         return 0
     else:
-        # TODO: Old implementation below with scoring
-        '''
-        total_score = sum([x[0] for x in _scores_arr])
-        if total_score < 0.5 * len(_scores_arr):
-            return -1
-        value = random.uniform(0, total_score)
-
-        # For the case that a button has 0 score, we ignore them
-        # This happens for cases when the button leads to an external link
-        zeroes = [idex for idex, iscore in enumerate(_scores_arr) if iscore[0] == 0]
-
-        curr_score = 0
-        index = 0
-        for i in _scores_arr:
-            curr_score += i[0]
-            if curr_score >= value:
-                if index not in zeroes:
-                    return index
-            index += 1
-        zero_counter = 0
-        return -1
-        '''
-
-        # TODO: Change to totally random
-        return int(random.uniform(0, len(click_els)))
+        # See Strategy.py, chosen by Config.exploration_strategy
+        return strategy.choose(state, visited.get(state, []), len(click_els), probabilities)
 
 
 def main(app_name, pack_name):
     global clickables, scores, visited, parent_map, activities, sequence
-    d.press('home')
+    # Deadline of starting the app and registering its first state. The crawl loop gets a new one every iteration.
+    deadline = Deadline(Config.loop_deadline)
+    invalidate_snapshot()
+    deadline.run('press', d.press, 'home')
 
     logger.info('Force stopping ' + pack_name + ' to reset states')
     subprocess.Popen([android_home + 'platform-tools/adb', '-s', device_name, 'shell', 'am', 'force-stop', pack_name])
@@ -306,7 +486,7 @@ def main(app_name, pack_name):
     msg = subprocess.Popen(
         [android_home + '/platform-tools/adb', '-s', device_name, 'shell', 'monkey', '-p', pack_name, '5'],
         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    startmsg = msg.communicate()[0].decode('utf-8')
+    startmsg = deadline.communicate('launch', msg)[0].decode('utf-8')
     if len(re.findall('No activities found to run', startmsg)) > 0:
         return APP_STATE.FAILTOSTART
 
@@ -314,22 +494,23 @@ def main(app_name, pack_name):
                          _packname=pack_name,
                          _data_activity=[])
 
-    # To ensure that loading page and everything is done before starting testing
-    logger.info('Wait 10 seconds for loading of APK.')
-    time.sleep(10)
-
-    old_state = Utility.get_state(d, pack_name)
+    # To ensure that loading page and everything is done before starting testing. monkey was sent to the device
+    # behind uiautomator's back, so the screen is dumped again either way.
+    logger.info('Waiting for the APK to load.')
+    old_state = settle(pack_name, deadline, Config.launch_settle_timeout).state
 
-    def rec(local_state):
+    def rec(local_state, deadline):
         global parent_map
 
-        if Utility.get_package_name(d) == 'com.google.android.apps.nexuslauncher':
+        current_package = deadline.run('info', Utility.get_package_name, d)
+        if current_package == 'com.google.android.apps.nexuslauncher':
             return -2, local_state
-        elif Utility.get_package_name(d) != pack_name:
-            initstate = Utility.get_state(d, pack_name)
-            d.press('back')
+        elif current_package != pack_name:
+            initstate = current_snapshot(pack_name, deadline).state
+            invalidate_snapshot()
+            deadline.run('press', d.press, 'back')
             sequence.append(('OUTOFAPK', 'BACK', ''))
-            nextstate = Utility.get_state(d, pack_name)
+            nextstate = current_snapshot(pack_name, deadline).state
             if nextstate != initstate:
                 return -1, nextstate
 
@@ -338,16 +519,18 @@ def main(app_name, pack_name):
                 localc = 0
                 while True:
                     tryclick_btns = d(clickable='true')
-                    rand_btn = random.choice(tryclick_btns)
-                    rand_btn.click.wait()
+                    rand_btn = deadline.run('info', random.choice, tryclick_btns)
+                    invalidate_snapshot()
+                    deadline.run('click', rand_btn.click.wait)
                     sequence.append((initstate, 'RAND_BUTTON', ''))
-                    nextstate = Utility.get_state(d, pack_name)
+                    nextstate = current_snapshot(pack_name, deadline).state
 
                     # Check if app has crashed. If it is, restart
-                    crashapp = d(clickable='true', packageName='android')
+                    crashapp = current_snapshot(pack_name, deadline).clickable_infos('android')
                     for i in crashapp:
-                        if i.info['resourceName'] == 'android:id/aerr_restart' \
-                                or i.info['resourceName'] == 'android:id/aerr_close':
+                        resource_name = i['resourceName']
+                        if resource_name == 'android:id/aerr_restart' \
+                                or resource_name == 'android:id/aerr_close':
                             return APP_STATE.CRASHED, nextstate
 
                     if localc > 2:
@@ -356,20 +539,24 @@ def main(app_name, pack_name):
                         return -1, nextstate
                     localc += 1
 
+        deadline.check()
+        if local_state in clickables and local_state in visited:
+            # Known from an earlier attempt or crawl, so its clickables and their stats are kept
+            parent_map.setdefault(local_state, current_snapshot(pack_name, deadline).parent_map.copy())
+            return 1, local_state
         da = DataActivity(_state=local_state,
                           _name=Utility.get_activity_name(d, pack_name, device_name),
                           _parent_app=app_name,
                           _clickables=[])
         activities[local_state] = da
-        click_els = d(clickable='true', packageName=pack_name)
-        parent_map[local_state] = Utility.create_child_to_parent(dump=d.dump(compressed=False))
+        snap = current_snapshot(pack_name, deadline)
+        parent_map[local_state] = snap.parent_map.copy()
         ar = []
         arch = []
         ars = []
         arv = []
 
-        for btn in click_els:
-            btn_info = btn.info
+        for btn_info in snap.clickable_infos(pack_name):
             arch.append((Utility.btn_info_to_key(btn_info), btn_info['text']))
         click_hash[local_state] = arch
 
@@ -395,42 +582,54 @@ def main(app_name, pack_name):
         clickables[local_state] = ar
         scores[local_state] = ars
         visited[local_state] = arv
-        Utility.dump_log(d, pack_name, local_state)
+        Utility.dump_log(d, pack_name, local_state, xml=snap.xml, writer=writer, deadline=deadline)
         return 1, local_state
 
     logger.info('Adding new activity.')
-    recvalue, new_state = rec(old_state)
+    recvalue, new_state = rec(old_state, deadline)
     logger.info('Activity has recvalue of ' + str(recvalue))
     if recvalue == APP_STATE.CRASHED:
         return APP_STATE.CRASHED
 
-    new_click_els = None
+    if Config.max_replay_steps > 0:
+        new_state = replay_to_frontier(pack_name)
+        deadline = Deadline(Config.loop_deadline)
+        # The replay may have ended up somewhere that was not recorded
+        if new_state not in visited:
+            recvalue = -1
+            while recvalue == -1:
+                recvalue, new_state = rec(new_state, deadline)
+                if new_state in scores or recvalue == APP_STATE.UNK:
+                    recvalue = 1
+            if recvalue == APP_STATE.CRASHED:
+                return APP_STATE.CRASHED
+
     counter = 0
 
     while True:
-        signal.alarm(60)
+        deadline = Deadline(Config.loop_deadline)
         try:
-            edit_btns = d(clickable='true', packageName=pack_name)
-            for i in edit_btns:
-                i.set_text(Utility.get_text())
-            if d(scrollable='true').exists:
+            for index in range(len(current_snapshot(pack_name, deadline).clickables(pack_name))):
+                invalidate_snapshot()
+                deadline.run('text', clickable_at(pack_name, index).set_text, Utility.get_text())
+            if current_snapshot(pack_name, deadline).scrollable:
                 r = random.uniform(0, Config.scroll_probability[2])
                 if r < Config.scroll_probability[0]:
-                    new_click_els, new_state, state_info = click_button(new_click_els, pack_name, app_name)
+                    new_state, state_info = click_button(pack_name, app_name, deadline)
                 else:
                     logger.info('Scrolling...')
+                    invalidate_snapshot()
                     if r < Config.scroll_probability[1]:
-                        d(scrollable='true').fling()
+                        deadline.run('scroll', d(scrollable='true').fling)
                         sequence.append((old_state, 'SCROLL DOWN', ''))
                     elif r < Config.scroll_probability[2]:
-                        d(scrollable='true').fling.backward()
+                        deadline.run('scroll', d(scrollable='true').fling.backward)
                         sequence.append((old_state, 'SCROLL UP', ''))
 
-                    new_state = Utility.get_state(d, pack_name)
-                    new_click_els = d(clickable='true', packageName=pack_name)
+                    new_state = current_snapshot(pack_name, deadline).state
                     state_info = APP_STATE.SCROLLING
             else:
-                new_click_els, new_state, state_info = click_button(new_click_els, pack_name, app_name)
+                new_state, state_info = click_button(pack_name, app_name, deadline)
 
             logger.info('Number of iterations: ' + str(counter))
             logger.info('state_info is ' + str(state_info))
@@ -444,7 +643,7 @@ def main(app_name, pack_name):
             if new_state != old_state and (new_state not in scores or new_state not in visited):
                 recvalue = -1
                 while recvalue == -1:
-                    recvalue, new_state = rec(new_state)
+                    recvalue, new_state = rec(new_state, deadline)
                     if new_state in scores:
                         recvalue = 1
                     if recvalue == APP_STATE.UNK:
@@ -452,12 +651,9 @@ def main(app_name, pack_name):
 
             if counter % 30 == 0:
                 logger.info('Saving data to database...')
-                store_suc = Utility.store_data(learning_data, activities, clickables, mongo)
-                logger.info('Data saved to database: {}'.format(store_suc))
-                with open(Config.seqq_location + pack_name + '/seqq-' + pack_name + '.txt', 'a') as f:
-                    while sequence:
-                        i = sequence.pop()
-                        f.write('{}\t{}\t{}\n'.format(i[0], i[1], i[2]))
+                store_suc = store_data(learning_data)
+                logger.info('Data queued for database: {}'.format(store_suc))
+                write_sequence(pack_name, '{}\t{}\t{}\n')
             counter += 1
             if counter >= 300:
                 return 1
@@ -465,195 +661,211 @@ def main(app_name, pack_name):
         except KeyboardInterrupt:
             logger.info('@@@@@@@@@@@@@@@=============================')
             logger.info('KeyboardInterrupt...')
-            store_suc = Utility.store_data(learning_data, activities, clickables, mongo)
-            logger.info('Data saved to database: {}'.format(store_suc))
+            store_suc = store_data(learning_data)
+            logger.info('Data queued for database: {}'.format(store_suc))
             return APP_STATE.KEYBOARDINT
         except KeyError:
             logger.info('@@@@@@@@@@@@@@@=============================')
             logger.info('Crash')
-            store_suc = Utility.store_data(learning_data, activities, clickables, mongo)
-            logger.info('Data saved to database: {}'.format(store_suc))
+            store_suc = store_data(learning_data)
+            logger.info('Data queued for database: {}'.format(store_suc))
             return APP_STATE.KEYERROR
         except IndexError:
             logger.info('@@@@@@@@@@@@@@@=============================')
             logger.info('IndexError...')
-            store_suc = Utility.store_data(learning_data, activities, clickables, mongo)
-            logger.info('Data saved to database: {}'.format(store_suc))
+            store_suc = store_data(learning_data)
+            logger.info('Data queued for database: {}'.format(store_suc))
             return APP_STATE.INDEXERROR
         except TimeoutError:
             logger.info('@@@@@@@@@@@@@@@=============================')
             logger.info('Timeout...')
-            store_suc = Utility.store_data(learning_data, activities, clickables, mongo)
-            logger.info('Data saved to database: {}'.format(store_suc))
+            store_suc = store_data(learning_data)
+            logger.info('Data queued for database: {}'.format(store_suc))
             return APP_STATE.TIMEOUT
         except uiautomator.JsonRPCError:
             logger.info('@@@@@@@@@@@@@@@=============================')
             logger.info('JSONRPCError...')
-            store_suc = Utility.store_data(learning_data, activities, clickables, mongo)
-            logger.info('Data saved to database: {}'.format(store_suc))
+            store_suc = store_data(learning_data)
+            logger.info('Data queued for database: {}'.format(store_suc))
             return APP_STATE.JSONRPCERROR
         except socket.timeout:
             logger.info('@@@@@@@@@@@@@@@=============================')
             logger.info('Socket timeout error...')
             return APP_STATE.SOCKTIMEOUTERROR
         finally:
-            signal.alarm(0)
-            Utility.dump_log(d, pack_name, Utility.get_state(d, pack_name))
-            with open(Config.seqq_location + pack_name + '/seqq-' + pack_name + '.txt', 'a') as f:
-                while sequence:
-                    i = sequence.pop()
-                    f.write('{}\t{}\t{}\n'.format(i[0], i[1], i[2]))
+            # The iteration may have run out of time, so the log of the last state gets a deadline of its own
+            deadline = Deadline(Config.loop_deadline)
+            snap = current_snapshot(pack_name, deadline)
+            Utility.dump_log(d, pack_name, snap.state, xml=snap.xml, writer=writer, deadline=deadline)
+            write_sequence(pack_name, '{}\t{}\t{}\n')
 
 
-def official(_apkdir):
+def open_info_file(suffix=''):
+    timestr = time.strftime("%Y%m%d%H%M%S")
+
+    info_location = Config.info_location
+    if not os.path.exists(info_location):
+        os.makedirs(info_location)
+    return codecs.open(info_location + '/information-' + timestr + suffix + '.txt', 'w', 'utf-8')
+
+
+def test_apk(i, _apkdir, file, start_time):
+    """
+    Installs the APK, runs up to 4 attempts of main() on it and uninstalls it again.
+    :param i: file name of the APK in _apkdir
+    :param _apkdir: directory where the APK is stored
+    :param file: information file the outcome of the APK is written to
+    :param start_time: time the crawl started, for logging
+    :return: package name of the APK
+    """
     global no_clickable_btns_counter
 
     dir = _apkdir
+    english = True
+    attempts = 0
+    m = re.findall('^(.*)_.*\.apk', i)
+    apk_packname = m[0]
+
+    ''' Get the application name from badge. '''
+    try:
+        ps = subprocess.Popen([android_home + 'build-tools/26.0.1/aapt', 'dump', 'badging', dir + i],
+                              stdout=subprocess.PIPE)
+        output = subprocess.check_output(('grep', 'application-label:'), stdin=ps.stdout)
+        label = output.decode('utf-8')
+    except subprocess.CalledProcessError:
+        logger.info("No android application available.")
+        label = 'application-label: unknown APK.'
+
+    m = re.findall('^application-label:(.*)$', label)
+    appname = m[0][1:-1]
+
+    Config.app_name = appname
+
+    ''' Check if there is non-ASCII character. '''
+    for scii in m[0]:
+        if scii not in string.printable:
+            logger.info('There is a non-ASCII character in application name. Stop immediately.\n')
+            file.write('|' + apk_packname + '|' + 'Non-ASCII character detected in appname.' '\n')
+            english = False
+            break
+
+    if english:
+        if not os.path.exists(Config.seqq_location + apk_packname):
+            os.makedirs(Config.seqq_location + apk_packname)
 
+        ''' Start installation of the APK '''
+        x = subprocess.Popen([android_home + 'platform-tools/adb', '-s', device_name, 'install', dir + i],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            installmsg = Deadline(Config.deadline_budgets['install'], 'install').communicate('install', x)[1].decode(
+                'utf-8')
+        except TimeoutError:
+            logger.info('Timeout installing ' + apk_packname + ' APK.')
+            file.write('|' + apk_packname + '|' + 'Failed to install; timeout' '\n')
+            return apk_packname
+        if len(re.findall('Success', installmsg)) > 0:
+            logger.info("Installed success: " + apk_packname + ' APK.')
+            pass
+        if len(re.findall('INSTALL_FAILED_ALREADY_EXISTS', installmsg)) > 0:
+            logger.info("Already exists: " + apk_packname + ' APK.')
+            pass
+        elif len(re.findall('INSTALL_FAILED_NO_MATCHING_ABIS', installmsg)) > 0:
+            logger.info('No Matching ABIs: ' + apk_packname + ' APK.')
+            file.write('|' + apk_packname + '|' + 'Failed to install; no matching ABIs' '\n')
+            return apk_packname
+        else:
+            pass
+
+        logger.info('\nDoing a UI testing on application ' + appname + '.')
+
+        init()
+        if Config.warm_start:
+            Utility.load_data(mongo).merge_into(activities, clickables, visited, scores)
+        if not os.path.exists(Config.seqq_location + apk_packname):
+            os.makedirs(Config.seqq_location + apk_packname)
+        write_sequence(apk_packname, '{}\t{}\n', footer='=== BEGIN OF SEQUENCE ===\n')
+        no_clickable_btns_counter = 0
+        while attempts <= 3:
+            try:
+                retvalue = main(appname, apk_packname)
+                if retvalue == APP_STATE.FAILTOSTART:
+                    logger.info("Fail to start application using monkey.")
+                    file.write('|' + apk_packname + '|' + 'Failed to start application using monkey.' '\n')
+                    break
+                elif retvalue == APP_STATE.KEYERROR:
+                    logger.info("Keyerror crash.")
+                    file.write('|' + apk_packname + '|' + 'Crashed - KeyError' '\n')
+                elif retvalue == APP_STATE.INDEXERROR:
+                    logger.info("Indexerror crash.")
+                    file.write('|' + apk_packname + '|' + 'Crashed - IndexError' '\n')
+                elif retvalue == APP_STATE.CRASHED:
+                    logger.info("App crashed")
+                    file.write('|' + apk_packname + '|' + 'Crashed - UnknownError' '\n')
+                    break
+                elif retvalue == APP_STATE.DEADLOCK:
+                    logger.info("Dead lock. Restarting...")
+                elif retvalue == APP_STATE.FAILTOCLICK:
+                    logger.info("Fail to click. Restarting...")
+                elif retvalue == APP_STATE.TIMEOUT:
+                    logger.info("Timeout. Restarting...")
+                elif retvalue == APP_STATE.JSONRPCERROR:
+                    logger.info("JSONRPCError. Restarting...")
+                elif retvalue == APP_STATE.SOCKTIMEOUTERROR:
+                    logger.info("Socket timeout. Restarting...")
+                elif retvalue == APP_STATE.KEYBOARDINT:
+                    logger.info("keyboard interrupt. Restarting...")
+            except BaseException as e:
+                if re.match('timeout', str(e), re.IGNORECASE):
+                    logger.info("Timeout from nothing happening. Restarting... ")
+                else:
+                    logger.info("Unknown exception." + str(e))
+                    # raise Exception(e)
+            finally:
+                attempts += 1
+                logger.info('==========================================')
+                new_time = datetime.now()
+                logger.info('Current time is ' + str(new_time))
+                logger.info('Time elapsed: ' + str(new_time - start_time))
+                logger.info('Last APK tested is: {}'.format(apk_packname))
+                logger.info('==========================================')
+                write_sequence(apk_packname, '{}\t{}\n', footer='=== END ATTEMPT {} ===\n'.format(attempts))
+
+        write_sequence(apk_packname, '{}\t{}\n', footer='=== END OF SEQUENCE\n')
+        logger.info('Force stopping ' + apk_packname + ' to end test for the APK')
+        subprocess.Popen(
+            [android_home + 'platform-tools/adb', '-s', device_name, 'shell', 'am', 'force-stop', apk_packname])
+
+        # Everything of the APK has to be written before counting it, and before the next APK is started
+        writer.flush()
+        act_c = mongo.activity.count({"_type": "activity", "parent_app": Config.app_name})
+        click_c = mongo.clickable.count({"_type": "clickable", "parent_app_name": Config.app_name})
+        file.write(appname + '|' + apk_packname + '|True|' + str(act_c) + '|' + str(click_c) + '\n')
+        subprocess.Popen([android_home + 'platform-tools/adb', '-s', device_name, 'uninstall', apk_packname],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        logger.info('Uninstalled ' + apk_packname)
+        logger.info('Device calls so far: ' + Deadline.report())
+        logger.info('@@@@@@@@@@@ End ' + apk_packname + ' APK @@@@@@@@@@@')
+
+    return apk_packname
+
+
+def official(_apkdir):
     with open(apklist, 'r') as f:
         apks_to_test = [line.rstrip() for line in f]
-    timestr = time.strftime("%Y%m%d%H%M%S")
-
-    info_location = Config.info_location
-    if not os.path.exists(info_location):
-        os.makedirs(info_location)
-    file = codecs.open(info_location + '/information-' + timestr + '.txt', 'w', 'utf-8')
+    file = open_info_file()
 
     no_apks_tested = 0
     start_time = datetime.now()
     for i in apks_to_test:
-        english = True
-        attempts = 0
-        m = re.findall('^(.*)_.*\.apk', i)
-        apk_packname = m[0]
-
-        ''' Get the application name from badge. '''
-        try:
-            ps = subprocess.Popen([android_home + 'build-tools/26.0.1/aapt', 'dump', 'badging', dir + i],
-                                  stdout=subprocess.PIPE)
-            output = subprocess.check_output(('grep', 'application-label:'), stdin=ps.stdout)
-            label = output.decode('utf-8')
-        except subprocess.CalledProcessError:
-            logger.info("No android application available.")
-            label = 'application-label: unknown APK.'
-
-        m = re.findall('^application-label:(.*)$', label)
-        appname = m[0][1:-1]
-
-        Config.app_name = appname
-
-        ''' Check if there is non-ASCII character. '''
-        for scii in m[0]:
-            if scii not in string.printable:
-                logger.info('There is a non-ASCII character in application name. Stop immediately.\n')
-                file.write('|' + apk_packname + '|' + 'Non-ASCII character detected in appname.' '\n')
-                english = False
-                break
-
-        if english:
-            if not os.path.exists(Config.seqq_location + apk_packname):
-                os.makedirs(Config.seqq_location + apk_packname)
-
-            ''' Start installation of the APK '''
-            x = subprocess.Popen([android_home + 'platform-tools/adb', '-s', device_name, 'install', dir + i],
-                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            installmsg = x.communicate()[1].decode('utf-8')
-            if len(re.findall('Success', installmsg)) > 0:
-                logger.info("Installed success: " + apk_packname + ' APK.')
-                pass
-            if len(re.findall('INSTALL_FAILED_ALREADY_EXISTS', installmsg)) > 0:
-                logger.info("Already exists: " + apk_packname + ' APK.')
-                pass
-            elif len(re.findall('INSTALL_FAILED_NO_MATCHING_ABIS', installmsg)) > 0:
-                logger.info('No Matching ABIs: ' + apk_packname + ' APK.')
-                file.write('|' + apk_packname + '|' + 'Failed to install; no matching ABIs' '\n')
-                continue
-            else:
-                pass
-
-            logger.info('\nDoing a UI testing on application ' + appname + '.')
-
-            init()
-            if not os.path.exists(Config.seqq_location + apk_packname):
-                os.makedirs(Config.seqq_location + apk_packname)
-            with open(Config.seqq_location + apk_packname + '/seqq-' + apk_packname + '.txt', 'a') as f:
-                f.write('=== BEGIN OF SEQUENCE ===\n')
-            no_clickable_btns_counter = 0
-            while attempts <= 3:
-                signal.alarm(60)
-                try:
-                    retvalue = main(appname, apk_packname)
-                    if retvalue == APP_STATE.FAILTOSTART:
-                        logger.info("Fail to start application using monkey.")
-                        file.write('|' + apk_packname + '|' + 'Failed to start application using monkey.' '\n')
-                        break
-                    elif retvalue == APP_STATE.KEYERROR:
-                        logger.info("Keyerror crash.")
-                        file.write('|' + apk_packname + '|' + 'Crashed - KeyError' '\n')
-                    elif retvalue == APP_STATE.INDEXERROR:
-                        logger.info("Indexerror crash.")
-                        file.write('|' + apk_packname + '|' + 'Crashed - IndexError' '\n')
-                    elif retvalue == APP_STATE.CRASHED:
-                        logger.info("App crashed")
-                        file.write('|' + apk_packname + '|' + 'Crashed - UnknownError' '\n')
-                        break
-                    elif retvalue == APP_STATE.DEADLOCK:
-                        logger.info("Dead lock. Restarting...")
-                    elif retvalue == APP_STATE.FAILTOCLICK:
-                        logger.info("Fail to click. Restarting...")
-                    elif retvalue == APP_STATE.TIMEOUT:
-                        logger.info("Timeout. Restarting...")
-                    elif retvalue == APP_STATE.JSONRPCERROR:
-                        logger.info("JSONRPCError. Restarting...")
-                    elif retvalue == APP_STATE.SOCKTIMEOUTERROR:
-                        logger.info("Socket timeout. Restarting...")
-                    elif retvalue == APP_STATE.KEYBOARDINT:
-                        logger.info("keyboard interrupt. Restarting...")
-                except BaseException as e:
-                    if re.match('timeout', str(e), re.IGNORECASE):
-                        logger.info("Timeout from nothing happening. Restarting... ")
-                    else:
-                        logger.info("Unknown exception." + str(e))
-                        # raise Exception(e)
-                finally:
-                    signal.alarm(0)
-                    attempts += 1
-                    logger.info('==========================================')
-                    new_time = datetime.now()
-                    logger.info('Current time is ' + str(new_time))
-                    logger.info('Time elapsed: ' + str(new_time - start_time))
-                    logger.info('Last APK tested is: {}'.format(apk_packname))
-                    logger.info('==========================================')
-                    with open(Config.seqq_location + apk_packname + '/seqq-' + apk_packname + '.txt', 'a') as f:
-                        while sequence:
-                            i = sequence.pop()
-                            f.write('{}\t{}\n'.format(i[0], i[1]))
-                        f.write('=== END ATTEMPT {} ===\n'.format(attempts))
-
-            with open(Config.seqq_location + apk_packname + '/seqq-' + apk_packname + '.txt', 'a') as f:
-                while sequence:
-                    i = sequence.pop()
-                    f.write('{}\t{}\n'.format(i[0], i[1]))
-                f.write('=== END OF SEQUENCE\n')
-            logger.info('Force stopping ' + apk_packname + ' to end test for the APK')
-            subprocess.Popen(
-                [android_home + 'platform-tools/adb', '-s', device_name, 'shell', 'am', 'force-stop', apk_packname])
-
-            act_c = mongo.activity.count({"_type": "activity", "parent_app": Config.app_name})
-            click_c = mongo.clickable.count({"_type": "clickable", "parent_app_name": Config.app_name})
-            file.write(appname + '|' + apk_packname + '|True|' + str(act_c) + '|' + str(click_c) + '\n')
-            subprocess.Popen([android_home + 'platform-tools/adb', '-s', device_name, 'uninstall', apk_packname],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            logger.info('Uninstalled ' + apk_packname)
-            logger.info('@@@@@@@@@@@ End ' + apk_packname + ' APK @@@@@@@@@@@')
+        apk_packname = test_apk(i, _apkdir, file, start_time)
 
         no_apks_tested += 1
-        if no_apks_tested % 50 == 0:
+        if no_apks_tested % Config.emulator_reset_every == 0:
             logger.info('Total apks tested: {}'.format(no_apks_tested))
-            logger.info('Restarting emulator...')
-            Utility.stop_emulator(device_name)
-            time.sleep(10)
-            Utility.start_emulator(avdname, device_name, window_sel=args.window)
+            logger.info('Resetting emulator...')
+            active = emulator.reset()
+            if active.device_name != device_name:
+                attach_device(active.device_name, Device(active.device_name), avdname, window)
 
             logger.info('==========================================')
             new_time = datetime.now()
@@ -663,21 +875,35 @@ def official(_apkdir):
             logger.info('==========================================')
 
 
-try:
-    """
-    device_name e.g. emulator-5554
-    apklist e.g. directory-to-apk-x
-    avdname e.g, avd0
-    e.g. python3 Main.py emulator-5554 ../apk/apk-0 avd0
-    """
-    device_name = args.device_name
-    apklist = args.apklist
-    apkdir = args.apk_dir
-    avdname = args.avdname
-    d = Device(device_name)
-
-    Utility.start_emulator(avdname, device_name, window_sel=args.window)
-    official(_apkdir=apkdir)
-
-except Exception as e:
-    logging.exception("message")
+if __name__ == '__main__':
+    try:
+        """
+        device_name e.g. emulator-5554
+        apklist e.g. directory-to-apk-x
+        avdname e.g, avd0
+        e.g. python3 Main.py emulator-5554 ../apk/apk-0 avd0
+        """
+        args = parser.parse_args()
+        setup_logging(args.device_name)
+        apklist = args.apklist
+        apkdir = args.apk_dir
+        if args.warm_pool:
+            if args.warm_pool == args.device_name:
+                parser.error('The spare emulator of --warm_pool needs a device name other than ' + args.device_name)
+            emulator = EmulatorPool([args.avdname, args.spare_avd or args.avdname],
+                                    [args.device_name, args.warm_pool], args.window)
+        else:
+            emulator = Emulator(args.avdname, args.device_name, args.window)
+        attach_device(args.device_name, Device(args.device_name), args.avdname, args.window)
+
+        emulator.start()
+        official(_apkdir=apkdir)
+
+    except Exception as e:
+        logging.exception("message")
+    finally:
+        if writer is not None:
+            writer.close()
+        if isinstance(emulator, EmulatorPool):
+            # The spare would otherwise keep running
+            emulator.stop()
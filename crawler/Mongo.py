@@ -1,12 +1,30 @@
 import sys
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient
 from crawler.Config import Config
 sys.path.append('/Users/hkoh006/Desktop/UITestLearning')
 
 class Mongo():
-    def __init__(self):
-        client = MongoClient(Config.mongoHost, Config.mongoPort)
+    def __init__(self, client=None):
+        # A mongomock client can be passed in place of the real one
+        client = MongoClient(Config.mongoHost, Config.mongoPort) if client is None else client
         db = client['dataset12']
         self.app = db.app
         self.activity = db.activity
         self.clickable = db.clickable
+        self.indexed = False
+
+    def ensure_indexes(self):
+        """
+        Creates the indexes on the keys that documents are upserted with. Done on first write rather than on
+        construction so that creating a Mongo does not need a connection.
+        """
+        if self.indexed:
+            return
+        self.app.create_index([('_type', ASCENDING), ('appname', ASCENDING)])
+        self.activity.create_index([('state', ASCENDING), ('parent_app', ASCENDING), ('name', ASCENDING)])
+        self.clickable.create_index(
+            [('name', ASCENDING), ('parent_activity_state', ASCENDING), ('parent_app_name', ASCENDING)])
+        # The state graph of an app is read by app, see StateGraph.load
+        self.activity.create_index([('parent_app', ASCENDING), ('state', ASCENDING)])
+        self.clickable.create_index([('parent_app_name', ASCENDING), ('parent_activity_state', ASCENDING)])
+        self.indexed = True
@@ -0,0 +1,60 @@
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+# next_transition_state of clickables that leave the app
+OUT_OF_APK = 'OUTOFAPK'
+
+
+class Navigator(object):
+    """
+    Finds the shortest known way from a state to the nearest state that still has clickables which were never
+    clicked, following the transitions recorded in Clickable.next_transition_state. Edges that did not lead where they
+    were recorded to when replayed are remembered and left out of later paths.
+    """
+
+    def __init__(self):
+        self.failed = set()
+
+    def reset(self):
+        self.failed.clear()
+
+    def fail(self, state, name):
+        logger.info('Transition ' + name + ' of ' + state + ' did not reproduce, leaving it out.')
+        self.failed.add((state, name))
+
+    @staticmethod
+    def is_frontier(stats):
+        return any(stat[1] == 0 for stat in stats)
+
+    def path(self, start, clickables, visited, max_steps):
+        """
+        Breadth first search over the recorded transitions.
+        :param clickables: Main.clickables
+        :param visited: Main.visited
+        :return: list of (state, clickable name, next state) to click from start on, empty if start is a frontier
+        state itself, or None if no frontier state is reachable within max_steps clicks
+        """
+        if self.is_frontier(visited.get(start, [])):
+            return []
+        previous = {start: None}
+        queue = collections.deque([(start, 0)])
+        while queue:
+            state, depth = queue.popleft()
+            if depth >= max_steps:
+                continue
+            for clickable in clickables.get(state, []):
+                nxt = clickable.next_transition_state
+                if nxt is None or nxt == OUT_OF_APK or nxt in previous or (state, clickable.name) in self.failed:
+                    continue
+                previous[nxt] = (state, clickable.name)
+                if self.is_frontier(visited.get(nxt, [])):
+                    steps = []
+                    while previous[nxt] is not None:
+                        state, name = previous[nxt]
+                        steps.append((state, name, nxt))
+                        nxt = state
+                    return steps[::-1]
+                queue.append((nxt, depth + 1))
+        return None
@@ -0,0 +1,245 @@
+"""======================================================
+
+Runs the crawler on several emulators at once.
+
+Every worker process owns one emulator and its own Device, and is handed APKs from a single queue shared by all
+workers, so that a slow APK only holds up its own emulator. An APK whose emulator or worker process died while it was
+being tested is put back into the queue and picked up again by whichever worker is free next.
+
+e.g. python3 Orchestrator.py ../apk/apk-all ../../apk2/ avd --emulators 4
+
+======================================================"""
+import argparse
+import collections
+import logging
+import multiprocessing
+import os
+import queue
+from datetime import datetime
+
+from uiautomator import Device
+
+from crawler import Main
+from crawler import Utility
+from crawler.Config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def device_alive(device):
+    """
+    Checks if the emulator behind the device still answers.
+    """
+    try:
+        device.info
+        return True
+    except Exception:
+        return False
+
+
+def crawl_apk(device_name, device, avdname, window, apk, apk_dir, file, start_time):
+    """
+    Default crawl function of a worker, which tests the APK with the crawler in Main.py.
+    """
+    Main.attach_device(device_name, device, avdname, window)
+    Main.test_apk(apk, apk_dir, file, start_time)
+
+
+class Orchestrator(object):
+    def __init__(self, apks, apk_dir, avdnames, window=False, max_workers=None, max_retries=2,
+                 restart_every=50, device_factory=Device, start_emulator=Utility.start_emulator,
+                 stop_emulator=Utility.stop_emulator, crawl=crawl_apk, poll_interval=1):
+        """
+        :param apks: list of APK file names in apk_dir
+        :param apk_dir: directory where all APKs are stored
+        :param avdnames: one AVD name per emulator. The i-th emulator is started as emulator-(5554 + 2i).
+        :param window: whether the emulators are started with a window
+        :param max_workers: maximum number of emulators running on this host at the same time. Defaults to the
+        number of cores.
+        :param max_retries: number of times an APK is put back into the queue after its emulator died, and number of
+        times a worker process that died is started again
+        :param restart_every: each emulator is restarted after this many APKs
+        :param device_factory: creates the Device of an emulator name. A fake Device can be passed for testing.
+        :param start_emulator: starts an emulator, with the signature of Utility.start_emulator
+        :param stop_emulator: stops an emulator, with the signature of Utility.stop_emulator
+        :param crawl: tests a single APK, with the signature of crawl_apk
+        :param poll_interval: seconds between two checks of whether the workers are still alive
+        """
+        max_workers = os.cpu_count() if max_workers is None else max_workers
+        self.apks = apks
+        self.apk_dir = apk_dir
+        self.avdnames = avdnames[:max_workers]
+        self.window = window
+        self.max_retries = max_retries
+        self.restart_every = restart_every
+        self.device_factory = device_factory
+        self.start_emulator = start_emulator
+        self.stop_emulator = stop_emulator
+        self.crawl = crawl
+        self.poll_interval = poll_interval
+
+    def run(self):
+        """
+        Tests every APK and blocks until each of them has an outcome.
+
+        APKs are handed out by this process, one at a time to whichever worker reports that it is ready, so it always
+        knows which APK a worker holds. A worker process that dies is noticed by polling, its APK is retried or
+        failed, and the worker is started again up to max_retries times. If no worker is left, the APKs that were not
+        tested are failed.
+        :return: dict of APK to its outcome, which is 'done', or 'failed' if its emulator died on every retry
+        """
+        results = multiprocessing.Queue()
+        pending = collections.deque((apk, 0) for apk in self.apks)
+        outcomes = {}
+        remaining = len(self.apks)
+        workers = {}
+        inboxes = {}
+        respawns = collections.Counter()
+        # Worker ids that are waiting for an APK, and the (apk, retries) each busy worker holds
+        idle = []
+        holding = {}
+
+        def spawn(worker_id):
+            inboxes[worker_id] = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=self.work, args=(worker_id, inboxes[worker_id], results))
+            worker.start()
+            workers[worker_id] = worker
+
+        def finish(apk, retries, outcome):
+            nonlocal remaining
+            if outcome == 'died' and retries < self.max_retries:
+                pending.append((apk, retries + 1))
+                return
+            outcomes[apk] = 'failed' if outcome == 'died' else outcome
+            remaining -= 1
+
+        def dispatch():
+            while idle and pending:
+                worker_id = idle.pop()
+                holding[worker_id] = pending.popleft()
+                inboxes[worker_id].put(holding[worker_id][0])
+
+        for worker_id in range(len(self.avdnames)):
+            spawn(worker_id)
+
+        while remaining > 0:
+            try:
+                worker_id, pid, apk, outcome = results.get(timeout=self.poll_interval)
+                # Messages of a worker that died in the meantime were already dealt with when it was found dead
+                if worker_id in workers and workers[worker_id].pid == pid:
+                    if outcome != 'ready':
+                        finish(apk, holding.pop(worker_id)[1], outcome)
+                    elif worker_id not in idle:
+                        idle.append(worker_id)
+            except queue.Empty:
+                pass
+
+            for worker_id, worker in list(workers.items()):
+                if worker.is_alive():
+                    continue
+                logger.warning('Worker {} exited with code {}'.format(worker_id, worker.exitcode))
+                del workers[worker_id]
+                if worker_id in idle:
+                    idle.remove(worker_id)
+                if worker_id in holding:
+                    apk, retries = holding.pop(worker_id)
+                    finish(apk, retries, 'died')
+                if respawns[worker_id] < self.max_retries:
+                    respawns[worker_id] += 1
+                    spawn(worker_id)
+
+            if not workers:
+                logger.error('No worker is left, failing the {} APKs that were not tested'.format(remaining))
+                for apk, retries in pending:
+                    outcomes[apk] = 'failed'
+                break
+            dispatch()
+
+        for worker_id, worker in workers.items():
+            inboxes[worker_id].put(None)
+        for worker in workers.values():
+            worker.join(Config.boot_timeout)
+            if worker.is_alive():
+                worker.terminate()
+        return outcomes
+
+    def work(self, worker_id, inbox, results):
+        """
+        Runs in a worker process. Reports (worker_id, pid, None, 'ready') whenever it can take an APK, and
+        (worker_id, pid, apk, outcome) after testing one, where outcome is 'done', or 'died' if the emulator died.
+        """
+        pid = os.getpid()
+        device_name = 'emulator-' + str(5554 + 2 * worker_id)
+        avdname = self.avdnames[worker_id]
+        file = Main.open_info_file('-' + device_name)
+        start_time = datetime.now()
+
+        self.start_emulator(avdname, device_name, self.window)
+        device = self.device_factory(device_name)
+        no_apks_tested = 0
+
+        while True:
+            results.put((worker_id, pid, None, 'ready'))
+            apk = inbox.get()
+            if apk is None:
+                break
+            try:
+                logger.info('{} testing {}'.format(device_name, apk))
+                self.crawl(device_name, device, avdname, self.window, apk, self.apk_dir, file, start_time)
+            except Exception:
+                logger.exception('Exception while testing {} on {}'.format(apk, device_name))
+            no_apks_tested += 1
+            file.flush()
+            alive = device_alive(device)
+            results.put((worker_id, pid, apk, 'done' if alive else 'died'))
+
+            if alive and no_apks_tested % self.restart_every != 0:
+                continue
+            if not alive:
+                logger.info('{} died while testing {}. Restarting emulator...'.format(device_name, apk))
+            try:
+                device = self.restart(avdname, device_name)
+            except Exception:
+                # The orchestrator notices that this worker is gone and starts another one in its place
+                logger.exception('Could not restart {}, stopping worker {}'.format(device_name, worker_id))
+                break
+
+        try:
+            self.stop_emulator(device_name)
+        except Exception:
+            logger.exception('Could not stop ' + device_name)
+        file.close()
+        # Worker processes exit without running atexit handlers, so the writer has to be drained here
+        if Main.writer is not None:
+            Main.writer.close()
+
+    def restart(self, avdname, device_name):
+        self.stop_emulator(device_name)
+        self.start_emulator(avdname, device_name, self.window)
+        return self.device_factory(device_name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('apklist', help='The list of apk packages shared by all emulators.')
+    parser.add_argument('apk_dir', help='The directory where all apks are stored.')
+    parser.add_argument('avdprefix', help='Prefix of the AVD names. The i-th emulator uses AVD <avdprefix><i>.')
+    parser.add_argument('--emulators', '-n', type=int, default=1, help='Number of emulators to run.')
+    parser.add_argument('--max_workers', type=int, default=os.cpu_count(),
+                        help='Maximum number of emulators running at the same time on this host.')
+    parser.add_argument('--max_retries', type=int, default=2,
+                        help='Number of times an APK is retried after its emulator died.')
+    parser.add_argument("--window", "-w", action="store_true",
+                        help='If true, opens up the emulator window. Otherwise, a windowless emulator.')
+    args = parser.parse_args()
+
+    Main.setup_logging('orchestrator')
+    with open(args.apklist, 'r') as f:
+        apks_to_test = [line.rstrip() for line in f if line.strip()]
+
+    orchestrator = Orchestrator(apks_to_test, args.apk_dir,
+                                [args.avdprefix + str(i) for i in range(args.emulators)],
+                                window=args.window, max_workers=args.max_workers, max_retries=args.max_retries)
+    outcomes = orchestrator.run()
+    logger.info('Tested {} APKs, {} failed.'.format(len(outcomes),
+                                                   len([x for x in outcomes.values() if x == 'failed'])))
@@ -0,0 +1,33 @@
+class ParentMap(dict):
+    """
+    {child: parent} map of a hierarchy dump which also keeps an index of clickable children by their key,
+    so that finding the parent of a clickable does not need a scan through every node of the dump.
+    The index is kept up to date on every insertion, so merging further dumps into the map only indexes the new nodes.
+    """
+
+    def __init__(self, pairs=(), key=None):
+        super().__init__()
+        self.key = key
+        self.key_index = {}
+        for child, parent in pairs:
+            self[child] = parent
+
+    def __setitem__(self, child, parent):
+        super().__setitem__(child, parent)
+        if child.get('clickable') == 'true':
+            # First node with a given key wins, same as the order a scan through the map would find it
+            self.key_index.setdefault(self.key(child), parent)
+
+    def get_parent(self, key):
+        return self.key_index.get(key, -1)
+
+    def merge(self, other):
+        for child, parent in other.items():
+            if child not in self:
+                self[child] = parent
+
+    def copy(self):
+        pmap = ParentMap(key=self.key)
+        dict.update(pmap, self)
+        pmap.key_index = dict(self.key_index)
+        return pmap
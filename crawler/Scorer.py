@@ -0,0 +1,149 @@
+import logging
+
+import numpy as np
+
+from dataparsing import btn_position
+
+logger = logging.getLogger(__name__)
+
+# Words generate_traintest.py writes for the steps of a sequence that are not a button
+ACTION_WORDS = {'RAND_BUTTON': '~!@#randbutton#@!~', 'SCROLL UP': '~!@#scrollup#@!~',
+                'SCROLL DOWN': '~!@#scrolldown#@!~', 'BACK': '~!@#back#@!~', 'FLING HORIZONTAL': '~!@#flinghoriz#@!~'}
+NULL_WORD = '~!@#null#@!~'
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class Scorer(object):
+    """
+    Scores every clickable of a screen at once with a model trained by learning/widenrnn.py and exported with its
+    --export option. The model is loaded once and evaluated with numpy in the crawler's process, so a screen costs a
+    few matrix products instead of another round trip.
+    """
+
+    def __init__(self, filename, categoryfile=None):
+        """
+        :param filename: .npz file written by widenrnn.py --export
+        :param categoryfile: file of package name and category per line, as read by generate_traintest.py. Apps that
+        are not listed get the category '#'.
+        """
+        model = np.load(filename)
+        self.method = str(model['method'])
+        self.grams = int(model['grams'])
+        self.individual_word = bool(model['individual_word'])
+        self.seq_length = int(model['seq_length'])
+        self.weights = {name: model[name] for name in model.files if name.endswith(('_W', '_b', 'kernel', 'bias'))}
+
+        self.category_ids = self.vocabulary(model['category'])
+        self.btnclass_ids = self.vocabulary(model['btnclass'])
+        self.position_ids = self.vocabulary(model['position'])
+        self.word_ids = self.vocabulary(model['word_list'])
+        # Words the model has never seen are looked up in an extra row of zeros
+        word_vector = model['word_vector']
+        self.word_vector = np.vstack((word_vector, np.zeros((1, word_vector.shape[1]), dtype=word_vector.dtype)))
+        self.unknown_word = len(word_vector)
+
+        self.categories = {}
+        if categoryfile is not None:
+            try:
+                with open(categoryfile, 'r') as f:
+                    for line in f:
+                        isplit = line.strip().split('\t')
+                        if len(isplit) == 2:
+                            self.categories[isplit[0]] = isplit[1]
+            except IOError:
+                logger.warning('Category file ' + categoryfile + ' not found, every app is scored as category #.')
+        logger.info('Loaded ' + self.method + ' model from ' + filename)
+
+    @staticmethod
+    def vocabulary(tokens):
+        ids = {}
+        for i, token in enumerate(tokens.tolist()):
+            ids.setdefault(token, i)
+        return ids
+
+    def step_words(self, key, text):
+        """
+        Words a step of the sequence, as recorded in Main.sequence, is encoded with.
+        """
+        if key in ACTION_WORDS:
+            return [ACTION_WORDS[key]]
+        if not text:
+            return [NULL_WORD]
+        return text.lower().split(' ') if self.individual_word else [text.lower()]
+
+    def wide_features(self, pack_name, keys, display_size):
+        """
+        :return: (n, 3) float32 ids of the category, button class and button position of every clickable
+        """
+        category = self.categories.get(pack_name, '#')
+        classes, bounds, parsed = btn_position.parse_names(keys)
+        dims = np.tile(np.array(display_size, dtype=np.float64), (len(keys), 1))
+        positions = btn_position.grid_by_screen(bounds, parsed, dims)
+        features = np.empty((len(keys), 3), dtype=np.float32)
+        features[:, 0] = self.category_ids.get(category, self.category_ids['#'])
+        features[:, 1] = [self.btnclass_ids.get(c, self.btnclass_ids['NA']) for c in classes]
+        features[:, 2] = [self.position_ids.get(p, self.position_ids['-1']) for p in positions]
+        return features
+
+    def deep_features(self, history, texts):
+        """
+        :param history: (key, text) of the steps taken before, oldest first
+        :param texts: text of every clickable, the step that would be taken next
+        :return: (n, seq_length) word ids of the last grams - 1 steps followed by each clickable, padded with 0 like
+        learning/widenrnn.py pads them
+        """
+        previous = []
+        steps = history[-(self.grams - 1):] if self.grams > 1 else []
+        for key, text in steps:
+            previous.extend(self.step_words(key, text)[:self.seq_length])
+        ids = np.zeros((len(texts), self.seq_length), dtype=np.int64)
+        for i, text in enumerate(texts):
+            words = (previous + self.step_words(None, text)[:self.seq_length])[:self.seq_length]
+            ids[i, :len(words)] = [self.word_ids.get(word, self.unknown_word) for word in words]
+        return ids
+
+    def lstm(self, ids):
+        """
+        BasicLSTMCell of widenrnn.py run over the word vectors of ids, without dropout.
+        :return: last output of every row
+        """
+        kernel = self.weights['lstm_kernel']
+        bias = self.weights['lstm_bias']
+        units = kernel.shape[1] // 4
+        inputs = self.word_vector[ids]
+        c = np.zeros((len(ids), units), dtype=np.float32)
+        h = np.zeros((len(ids), units), dtype=np.float32)
+        for t in range(inputs.shape[1]):
+            gates = np.concatenate((inputs[:, t], h), axis=1).dot(kernel) + bias
+            i, j, f, o = np.split(gates, 4, axis=1)
+            # forget_bias of BasicLSTMCell is 1.0
+            c = c * sigmoid(f + 1.0) + sigmoid(i) * np.tanh(j)
+            h = np.tanh(c) * sigmoid(o)
+        return h
+
+    def score(self, pack_name, keys, texts, history, display_size):
+        """
+        :param keys: Utility.btn_info_to_key of every clickable of the screen
+        :param texts: text of every clickable
+        :param history: (key, text) of the steps taken so far, oldest first
+        :param display_size: (width, height) of the screen in pixels
+        :return: float64 array of the probability that clicking each clickable is positive, i.e. leads somewhere new
+        """
+        w = self.weights
+        if self.method == 'w':
+            logits = self.wide_features(pack_name, keys, display_size).dot(w['wide_W']) + w['wide_b']
+        else:
+            last = self.lstm(self.deep_features(history, texts))
+            logits = np.maximum(last.dot(w['deep_W']) + w['deep_b'], 0)
+            if self.method == 'wnd':
+                wide = np.maximum(self.wide_features(pack_name, keys, display_size).dot(w['wide_W']) + w['wide_b'], 0)
+                logits = (wide + logits).dot(w['out_W']) + w['out_b']
+        return softmax(logits.astype(np.float64))[:, 0]
@@ -0,0 +1,49 @@
+import logging
+import time
+
+from crawler.Config import Config
+from crawler.UISnapshot import UISnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class SettleDetector(object):
+    """
+    Waits for the UI to settle after an action, instead of sleeping for a fixed time. The device is first asked to wait
+    until it is idle, then the hierarchy is dumped until the state key has stayed the same for a number of samples in a
+    row. The last snapshot taken is handed back, so the settled screen never has to be dumped again.
+    """
+
+    def __init__(self, samples=None, interval=None, timeout=None):
+        """
+        :param samples: number of dumps in a row that have to give the same state, Config.settle_samples by default
+        :param interval: seconds between two dumps, Config.settle_interval by default
+        :param timeout: seconds after which the UI is taken as it is, Config.settle_timeout by default
+        """
+        self.samples = Config.settle_samples if samples is None else samples
+        self.interval = Config.settle_interval if interval is None else interval
+        self.timeout = Config.settle_timeout if timeout is None else timeout
+
+    def wait(self, device, pack_name, deadline, timeout=None):
+        """
+        :param timeout: overrides the timeout of the detector, e.g. for launching an app
+        :return: UISnapshot of the settled screen, or of the last dump if it did not settle in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        expires = time.monotonic() + timeout
+        # Leaves a second of the budget for the call itself
+        idle_timeout = max(0, min(timeout, deadline.budget('idle') - 1))
+        deadline.run('idle', device.wait.idle, timeout=int(idle_timeout * 1000))
+
+        snap = UISnapshot(device, pack_name, deadline)
+        state = snap.state
+        stable = 1
+        while stable < self.samples:
+            if time.monotonic() + self.interval >= expires:
+                logger.info('UI did not settle within {}s, going on with {}'.format(timeout, state))
+                break
+            time.sleep(self.interval)
+            snap = UISnapshot(device, pack_name, deadline)
+            stable = stable + 1 if snap.state == state else 1
+            state = snap.state
+        return snap
@@ -0,0 +1,85 @@
+import logging
+
+from crawler.Clickable import Clickable
+from crawler.DataActivity import DataActivity
+
+logger = logging.getLogger(__name__)
+
+
+class StateGraph(object):
+    """
+    The states of an app found by earlier crawls, read back from the activity and clickable collections: the
+    clickables of every state in the order they were found, where each of them led and how often it was clicked. It is
+    merged into the crawler's globals before an app is crawled, so a re-crawl goes on from what is already known
+    instead of starting cold.
+    """
+
+    def __init__(self, app_name):
+        self.app_name = app_name
+        self.activities = {}
+        self.clickables = {}
+
+    def __len__(self):
+        return len(self.activities)
+
+    @staticmethod
+    def load(mongo, app_name):
+        """
+        Reads the graph of an app with one query per collection, both served by the (app, state) indexes.
+        """
+        mongo.ensure_indexes()
+        graph = StateGraph(app_name)
+        for document in mongo.activity.find({'_type': 'activity', 'parent_app': app_name}):
+            graph.activities[document['state']] = DataActivity.decode_data(document)
+        by_state = {}
+        for document in mongo.clickable.find({'_type': 'clickable', 'parent_app_name': app_name}):
+            clickable = Clickable.decode_data(document)
+            by_state.setdefault(clickable.parent_activity_state, {})[clickable.name] = clickable
+        for state, activity in graph.activities.items():
+            found = by_state.get(state, {})
+            # The activity lists its clickables in the order they were found, which is the order visited is kept in
+            ordered = [found.pop(name) for name in activity.clickables if name in found]
+            graph.clickables[state] = ordered + list(found.values())
+        # Nothing has changed since these were written
+        for known in graph.clickables.values():
+            for clickable in known:
+                clickable.dirty = False
+        for activity in graph.activities.values():
+            activity.dirty = False
+        return graph
+
+    @staticmethod
+    def visit_stats(clickable):
+        """
+        :return: the [score, count] pair of Main.visited as click_button left it after the clicks of the clickable
+        """
+        if clickable.visits == 0:
+            return [1, 0]
+        if clickable.next_transition_state == clickable.parent_activity_state:
+            return [0, clickable.visits]
+        return [clickable.score / (2 * clickable.visits), clickable.visits]
+
+    def merge_into(self, activities, clickables, visited, scores):
+        """
+        Adds the states and clickables that are not in the globals yet. States that are already there only get the
+        clickables they do not know of, so nothing found in this run is overwritten.
+        :return: number of states added
+        """
+        added = 0
+        for state, known in self.clickables.items():
+            if state not in clickables:
+                activities[state] = self.activities[state]
+                clickables[state] = []
+                visited[state] = []
+                scores[state] = []
+                added += 1
+            names = set(c.name for c in clickables[state])
+            for clickable in known:
+                if clickable.name in names:
+                    continue
+                clickables[state].append(clickable)
+                visited[state].append(self.visit_stats(clickable))
+                changed = clickable.visits and clickable.next_transition_state != state
+                scores[state].append(clickable.score if changed else -1)
+        logger.info('Warm loaded {} of {} known states of {}'.format(added, len(self), self.app_name))
+        return added
@@ -0,0 +1,170 @@
+"""======================================================
+
+Exploration strategies that pick which clickable of a state the crawler clicks next.
+
+Strategies read the statistics click_button keeps in Main.visited, a [score, count] pair per clickable of a state:
+score is how many clickables the next state had, halved per visit, or 0 if the click did not change the state, and
+count is how often the clickable was clicked. A clickable that was never clicked has [1, 0].
+
+======================================================"""
+import abc
+import math
+import random
+
+from crawler.FenwickTree import FenwickTree
+
+UNVISITED = [1, 0]
+
+
+def stats_of(stats, count):
+    """
+    :return: stats padded with UNVISITED to count clickables
+    """
+    return stats[:count] + [UNVISITED] * (count - len(stats))
+
+
+class Strategy(abc.ABC):
+    """
+    Picks the clickable to click among count clickables of a state.
+    """
+
+    @abc.abstractmethod
+    def choose(self, state, stats, count, probabilities=None):
+        """
+        :param stats: Main.visited[state]
+        :param probabilities: chance of every clickable leading somewhere new according to the scorer, or None
+        :return: index of the clickable
+        """
+
+    def update(self, state, index, stats):
+        """
+        Called after stats[index] of a state changed.
+        """
+        pass
+
+    def reset(self):
+        """
+        Called before the next APK is crawled.
+        """
+        pass
+
+
+class RandomStrategy(Strategy):
+    """
+    Uniformly at random, or in proportion to the scorer's probabilities if there are any.
+    """
+
+    def choose(self, state, stats, count, probabilities=None):
+        if probabilities is not None and sum(probabilities) > 0:
+            return random.choices(range(count), weights=probabilities)[0]
+        return int(random.uniform(0, count))
+
+
+class WeightedStrategy(Strategy):
+    """
+    Samples clickables in proportion to a weight computed from their stats. The weights of every state are kept in a
+    FenwickTree that is updated along with visited, so a click costs O(log n) whatever the number of clickables.
+    """
+
+    def __init__(self):
+        self.trees = {}
+
+    @abc.abstractmethod
+    def weight(self, stat):
+        """
+        :param stat: [score, count] of a clickable
+        :return: weight of the clickable, at least 0
+        """
+
+    def tree(self, state, stats, count):
+        tree = self.trees.get(state)
+        if tree is None or len(tree) > count:
+            tree = self.trees[state] = FenwickTree(self.weight(stat) for stat in stats_of(stats, count))
+        while len(tree) < count:
+            tree.append(self.weight(stats[len(tree)] if len(tree) < len(stats) else UNVISITED))
+        return tree
+
+    def choose(self, state, stats, count, probabilities=None):
+        if probabilities is not None:
+            # The scorer's probabilities change with every screen, so these weights cannot be kept
+            weights = [self.weight(stat) * p for stat, p in zip(stats_of(stats, count), probabilities)]
+            if sum(weights) > 0:
+                return random.choices(range(count), weights=weights)[0]
+        index = self.tree(state, stats, count).sample()
+        return index if index != -1 else int(random.uniform(0, count))
+
+    def update(self, state, index, stats):
+        tree = self.trees.get(state)
+        if tree is not None and index < len(tree):
+            tree.set(index, self.weight(stats[index]))
+
+    def reset(self):
+        self.trees.clear()
+
+
+class ScoreStrategy(WeightedStrategy):
+    """
+    In proportion to the score, so clickables that did not change the state are never clicked again. This is the
+    scoring the crawler used before it picked at random.
+    """
+
+    def weight(self, stat):
+        return max(stat[0], 0)
+
+
+class LeastVisitedStrategy(WeightedStrategy):
+    """
+    Halves the weight of a clickable every time it is clicked, so the least clicked ones are tried first.
+    """
+
+    def weight(self, stat):
+        return 2.0 ** -stat[1]
+
+
+class UCBStrategy(Strategy):
+    """
+    UCB1 over the scores: every clickable is clicked once, then the one with the highest score plus exploration bonus.
+    """
+
+    def __init__(self, exploration=1.0):
+        self.exploration = exploration
+
+    def choose(self, state, stats, count, probabilities=None):
+        stats = stats_of(stats, count)
+        unvisited = [i for i, stat in enumerate(stats) if stat[1] == 0]
+        if unvisited:
+            return random.choice(unvisited)
+        log_total = math.log(sum(stat[1] for stat in stats))
+        bounds = [stat[0] + self.exploration * math.sqrt(2 * log_total / stat[1]) for stat in stats]
+        return max(range(count), key=bounds.__getitem__)
+
+
+class ThompsonStrategy(Strategy):
+    """
+    Thompson sampling with a normal posterior around the score of every clickable, narrowing with every click.
+    """
+
+    def __init__(self, deviation=1.0):
+        self.deviation = deviation
+
+    def choose(self, state, stats, count, probabilities=None):
+        samples = [random.gauss(stat[0], self.deviation / math.sqrt(stat[1] + 1)) for stat in stats_of(stats, count)]
+        return max(range(count), key=samples.__getitem__)
+
+
+STRATEGIES = {
+    'random': RandomStrategy,
+    'score': ScoreStrategy,
+    'least_visited': LeastVisitedStrategy,
+    'ucb': UCBStrategy,
+    'thompson': ThompsonStrategy,
+}
+
+
+def get_strategy(name):
+    """
+    :param name: one of STRATEGIES, e.g. Config.exploration_strategy
+    """
+    if name not in STRATEGIES:
+        raise ValueError('Unknown exploration strategy ' + name + ', expected one of ' + ', '.join(sorted(STRATEGIES)))
+    return STRATEGIES[name]()
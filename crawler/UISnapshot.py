@@ -0,0 +1,81 @@
+import logging
+import xml.etree.ElementTree as ET
+
+from crawler import Utility
+
+logger = logging.getLogger(__name__)
+
+
+class UISnapshot(object):
+    """
+    A view of the device's UI hierarchy taken with a single dump.
+    The dump is fetched and parsed lazily on first use, and the state key, parent map, clickables and the xml that
+    gets written to disk are all served from it. A snapshot is only valid until the next action is sent to the
+    device, after which the crawler has to take a new one.
+    """
+
+    def __init__(self, device, pack_name, deadline=None):
+        self.device = device
+        self.pack_name = pack_name
+        self.deadline = deadline
+        self._xml = None
+        self._root = None
+        self._state = None
+        self._parent_map = None
+        self._clickables = {}
+        self._clickable_infos = {}
+
+    @property
+    def xml(self):
+        if self._xml is None:
+            if self.deadline is None:
+                self._xml = self.device.dump(compressed=False)
+            else:
+                self._xml = self.deadline.run('dump', self.device.dump, compressed=False)
+        return self._xml
+
+    @property
+    def root(self):
+        if self._root is None:
+            self._root = ET.fromstring(self.xml.encode('utf-8'))
+        return self._root
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = Utility.get_state_from_root(self.root, self.pack_name)
+        return self._state
+
+    @property
+    def parent_map(self):
+        if self._parent_map is None:
+            self._parent_map = Utility.create_child_to_parent_from_root(self.root)
+        return self._parent_map
+
+    @property
+    def scrollable(self):
+        for node in self.root.iter('node'):
+            if node.get('scrollable') == 'true':
+                return True
+        return False
+
+    def clickables(self, package=None):
+        """
+        Returns the clickable nodes of the hierarchy in dump order, which is the same order the uiautomator
+        selector d(clickable='true', packageName=package) enumerates them in.
+        :param package: only keep nodes of this package. If None, every clickable node is returned.
+        :return: list of xml nodes. Bounds, text and class are available through node.attrib.
+        """
+        if package not in self._clickables:
+            self._clickables[package] = [node for node in self.root.iter('node')
+                                         if node.get('clickable') == 'true'
+                                         and (package is None or node.get('package') == package)]
+        return self._clickables[package]
+
+    def clickable_infos(self, package=None):
+        """
+        Returns the attributes of clickables(package), in the format of uiautomator's .info, all read from the dump.
+        """
+        if package not in self._clickable_infos:
+            self._clickable_infos[package] = [Utility.xml_btn_to_info(node) for node in self.clickables(package)]
+        return self._clickable_infos[package]
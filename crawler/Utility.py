@@ -1,104 +1,141 @@
-import hashlib
-import json
 import logging
-import operator
 import os
 import random
 import re
-import signal
+import shutil
 import string
-import subprocess
+import tempfile
 import xml.etree.ElementTree as ET
 
-import time
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
 
 from crawler.Clickable import Clickable
 from crawler.Config import Config
 from crawler.Data import Data
 from crawler.DataActivity import DataActivity
+from crawler.Emulator import Emulator
+from crawler import Fingerprint
+from crawler.ParentMap import ParentMap
+from crawler.StateGraph import StateGraph
 
 logger = logging.getLogger(__name__)
 
+# (packname, state) whose screenshot and xml have been handed to a write-behind writer, cleared by Main.init()
+logged_states = set()
+
 
 def store_data(data, activities, clickables, mongo):
-    signal.alarm(0)
+    requests = collect_dirty(data, activities, clickables)
+
+    logger.info('Storing data to database.')
+    write_requests(mongo, requests)
+    return 1
+
+
+def collect_dirty(data, activities, clickables):
+    """
+    Collects the writes for the data, activities and clickables that changed since the last flush, and marks them as
+    clean. Only the documents are built here, so the writes can be sent later on without touching the crawl data.
+    write_requests() marks them as dirty again if the writes fail.
+    :return: tuple of the write requests for the app, activity and clickable collection, and the objects they were
+    built from
+    """
     for state, activity in activities.items():
         if state not in data.data_activity:
             data.data_activity.append(activity.state)
+            data.dirty = True
         for clickable in clickables[state]:
             if clickable.name not in activity.clickables:
                 activity.clickables.append(clickable.name)
-
-    logger.info('Storing data to database.')
-    mongo.app.update({"_type": "data", "appname": Config.app_name}, Data.encode_data(data), upsert=True)
+                activity.dirty = True
+
+    app_requests = []
+    activity_requests = []
+    clickable_requests = []
+    changed = []
+    if data.dirty:
+        app_requests.append(ReplaceOne({"_type": "data", "appname": Config.app_name}, Data.encode_data(data),
+                                       upsert=True))
+        changed.append(data)
+        data.dirty = False
     for state, activity in activities.items():
-        mongo.activity.update({"state": state, "parent_app": Config.app_name, "name": activity.name},
-                              DataActivity.encode_data(activity),
-                              upsert=True)
+        if activity.dirty:
+            activity_requests.append(ReplaceOne({"state": state, "parent_app": Config.app_name, "name": activity.name},
+                                                DataActivity.encode_data(activity),
+                                                upsert=True))
+            changed.append(activity)
+            activity.dirty = False
     for state, v in clickables.items():
         for clickable in v:
-            mongo.clickable.update(
-                {"name": clickable.name, "parent_activity_state": state, "parent_app_name": Config.app_name},
-                Clickable.encode_data(clickable),
-                upsert=True)
-    return 1
+            if clickable.dirty:
+                clickable_requests.append(ReplaceOne(
+                    {"name": clickable.name, "parent_activity_state": state, "parent_app_name": Config.app_name},
+                    Clickable.encode_data(clickable),
+                    upsert=True))
+                changed.append(clickable)
+                clickable.dirty = False
+    return app_requests, activity_requests, clickable_requests, changed
+
+
+def write_requests(mongo, requests):
+    """
+    Sends the requests from collect_dirty() as one unordered bulk write per collection. If a write fails, everything
+    the requests were built from is marked as dirty again, so that it is written with the next flush. The writes are
+    upserts, so writing a document twice does no harm.
+    """
+    app_requests, activity_requests, clickable_requests, changed = requests
+    try:
+        mongo.ensure_indexes()
+        for collection, reqs in ((mongo.app, app_requests), (mongo.activity, activity_requests),
+                                 (mongo.clickable, clickable_requests)):
+            if reqs:
+                collection.bulk_write(reqs, ordered=False)
+    except PyMongoError:
+        for item in changed:
+            item.dirty = True
+        raise
 
 
 def load_data(mongo):
-    mongo.app.find({"_type": "data", "appname": Config.app_name})
-    return 1
+    """
+    Reads what earlier crawls found of Config.app_name.
+    :return: StateGraph, empty if the database cannot be read
+    """
+    try:
+        return StateGraph.load(mongo, Config.app_name)
+    except PyMongoError as e:
+        logger.warning('Could not load the state graph of ' + Config.app_name + ': ' + str(e))
+        return StateGraph(Config.app_name)
 
 
 def get_state(device, pn):
-    with open(Config.classwidgetdict) as f:
-        content = json.load(f)
-        dict_of_widget = content
-
-    def get_bit_rep(pn):
-        xml = device.dump(compressed=False)
-        root = ET.fromstring(xml.encode('utf-8'))
-        bit_rep = ''
-        btn_rep = ''
-        for element in root.iter('node'):
-            bit_rep += element.get('index')
-            btn_rep += str(dict_of_widget[element.attrib['class']])
-
-        return bit_rep, btn_rep
-
-    # def check_text_box():
-    #     xml = device.dump(compressed=True)
-    #     root = ET.fromstring(xml.encode('utf-8'))
-    #     keytxt = ''
-    #     for element in root.iter('node'):
-    #         keytxt += element.get('index')
-    #     return keytxt
-
-    # Assumes that there is a consecutive index from 0 to 32 within dump itself
-    # TODO: what if there is a number box or other types? Not checking for those...
-    # a = '01234567891011121314151617181920212223242526272829303132'
+    xml = device.dump(compressed=False)
+    return get_state_from_root(ET.fromstring(xml.encode('utf-8')), pn)
 
-    try:
-        # if a in check_text_box():
-        #     device.press.back()
-        #     time.sleep(1)
 
-        final_rep = get_bit_rep(pn)
-        key = final_rep[0] + final_rep[1]
-        hash_key = hashlib.md5(key.encode('utf-8'))
-        return pn + '-' + hash_key.hexdigest()
-    except KeyError:
-        get_class_dict(device, Config.classwidgetdict)
-        return get_state(device, pn)
+def get_state_from_root(root, pn):
+    """
+    Computes the state key from an already parsed hierarchy, so that callers holding a dump do not need another one.
+    The fingerprint strategy is Config.state_fingerprint, see Fingerprint.py.
+    """
+    return Fingerprint.state_key(root, pn)
 
 
 def create_child_to_parent(dump):
     dump = dump.encode('ascii', 'replace')
     tree = ET.fromstring(dump)
-    pmap = dict((c, p) for p in tree.iter() for c in p)
+    return create_child_to_parent_from_root(tree)
+
+
+def create_child_to_parent_from_root(tree):
+    pmap = ParentMap(((c, p) for p in tree.iter() for c in p), key=xml_btn_to_key)
     return pmap
 
 
 def get_parent_with_key(key, _parent_map):
+    if isinstance(_parent_map, ParentMap):
+        return _parent_map.get_parent(key)
     for child, parent in _parent_map.items():
         if key == xml_btn_to_key(child) and child.attrib['clickable'] == 'true':
             return parent
@@ -125,28 +162,21 @@ def get_bounds_from_key(key):
     return m[-1][1:-1]
 
 
-def btn_to_key(btn):
+def btn_to_key(btn, deadline=None):
     """deprecated. Use btn_info_to_key() instead"""
-    signal.alarm(5)
-    try:
-        info = btn.info
-        cd = '' if info['contentDescription'] is None else str(info['contentDescription'])
-        key = '{' + info['className'].split('.')[-1] + '}-{' + cd + '}-{' + convert_bounds(btn) + '}'
-        return key
-    finally:
-        signal.alarm(0)
+    info = btn.info if deadline is None else deadline.run('info', lambda: btn.info)
+    cd = '' if info['contentDescription'] is None else str(info['contentDescription'])
+    key = '{' + info['className'].split('.')[-1] + '}-{' + cd + '}-{' + convert_bounds_with_node_info(
+        info['bounds']) + '}'
+    return key
 
 
 def btn_info_to_key(btn_info):
-    signal.alarm(5)
-    try:
-        info = btn_info
-        cd = '' if info['contentDescription'] is None else str(info['contentDescription'])
-        key = '{' + info['className'].split('.')[-1] + '}-{' + cd + '}-{' + convert_bounds_with_node_info(
-            info['bounds']) + '}'
-        return key
-    finally:
-        signal.alarm(0)
+    info = btn_info
+    cd = '' if info['contentDescription'] is None else str(info['contentDescription'])
+    key = '{' + info['className'].split('.')[-1] + '}-{' + cd + '}-{' + convert_bounds_with_node_info(
+        info['bounds']) + '}'
+    return key
 
 
 def xml_btn_to_key(xml_btn):
@@ -159,6 +189,22 @@ def xml_btn_to_key(xml_btn):
     return key
 
 
+def xml_btn_to_info(xml_btn):
+    """
+    Builds the same attributes as uiautomator's .info from a node of a hierarchy dump, so that the attributes of every
+    clickable can be read from a single dump instead of one .info call per clickable.
+    btn_info_to_key() of the result is equal to xml_btn_to_key() of the node.
+    """
+    info = xml_btn.attrib
+    bounds = [int(x) for x in re.findall(r'-?\d+', info['bounds'])]
+    return {'className': info['class'],
+            'contentDescription': info['content-desc'],
+            'text': info.get('text', ''),
+            'resourceName': info.get('resource-id', ''),
+            'packageName': info.get('package', ''),
+            'bounds': {'left': bounds[0], 'top': bounds[1], 'right': bounds[2], 'bottom': bounds[3]}}
+
+
 def convert_bounds_with_node_info(node):
     sbound = ''
     bounds = node
@@ -183,6 +229,11 @@ def get_package_name(d):
     return info['currentPackageName']
 
 
+def get_display_size(d):
+    info = d.info
+    return info['displayWidth'], info['displayHeight']
+
+
 def get_activity_name(d, pn, device_name):
     # android_home = Config.android_home
     #    try:
@@ -197,28 +248,12 @@ def get_activity_name(d, pn, device_name):
     return "UNKActivity"
 
 
-def get_class_dict(d, fi):
-    x = d.dump(compressed=False)
-    root = ET.fromstring(x)
-    arr = []
+def get_class_dict(d, fi, root=None):
+    if root is None:
+        x = d.dump(compressed=False)
+        root = ET.fromstring(x)
 
-    with open(fi) as f:
-        content = json.load(f)
-    dict = content
-
-    if dict:
-        ind = max(dict.items(), key=operator.itemgetter(1))[1]
-        ind += 1
-    else:
-        ind = 0
-    for i in root.iter():
-        if 'class' in i.attrib:
-            if i.attrib['class'] not in dict:
-                dict[i.attrib['class']] = ind
-                ind += 1
-
-    with open(fi, 'w') as f:
-        json.dump(dict, f)
+    Fingerprint.get_widget_dictionary(fi).add_root(root)
 
 
 def get_text():
@@ -227,12 +262,39 @@ def get_text():
 
 
 def merge_dicts(d1, d2):
+    if isinstance(d1, ParentMap):
+        d1.merge(d2)
+        return
     for k, v in d2.items():
         if k not in d1:
             d1[k] = v
 
 
-def dump_log(d, packname, state):
+def dump_log(d, packname, state, xml=None, writer=None, deadline=None):
+    if writer is not None:
+        # Only the screenshot has to be taken on this thread. It is taken into a local file, which the writer moves
+        # to the screen directory together with writing the xml.
+        if (packname, state) in logged_states:
+            return
+        fd, screenshot = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        try:
+            if deadline is None:
+                d.screenshot(screenshot)
+                if xml is None:
+                    xml = d.dump(compressed=False)
+            else:
+                deadline.run('screenshot', d.screenshot, screenshot)
+                if xml is None:
+                    xml = deadline.run('dump', d.dump, compressed=False)
+        except BaseException:
+            os.remove(screenshot)
+            raise
+        writer.submit(store_log, packname, state, screenshot, xml)
+        # Only now, so that a state whose screenshot timed out is logged the next time it is seen
+        logged_states.add((packname, state))
+        return
+
     screen_directory = Config.screen_location + packname + '/'
     xml_directory = Config.xml_location + packname + '/'
 
@@ -246,35 +308,43 @@ def dump_log(d, packname, state):
         os.makedirs(xml_directory)
     else:
         if not os.path.isfile(xml_directory + state + '.png'):
-            d.dump(xml_directory + state + '-FULL.xml', compressed=False)
+            if xml is None:
+                d.dump(xml_directory + state + '-FULL.xml', compressed=False)
+            else:
+                # Reuse the hierarchy that was already dumped for this state instead of asking the device again
+                with open(xml_directory + state + '-FULL.xml', 'w', encoding='utf-8') as f:
+                    f.write(xml)
+
+
+def store_log(packname, state, screenshot, xml):
+    screen_directory = Config.screen_location + packname + '/'
+    xml_directory = Config.xml_location + packname + '/'
+
+    os.makedirs(screen_directory, exist_ok=True)
+    if not os.path.isfile(screen_directory + state + '.png'):
+        shutil.move(screenshot, screen_directory + state + '.png')
+    else:
+        os.remove(screenshot)
+
+    os.makedirs(xml_directory, exist_ok=True)
+    if not os.path.isfile(xml_directory + state + '-FULL.xml'):
+        with open(xml_directory + state + '-FULL.xml', 'w', encoding='utf-8') as f:
+            f.write(xml)
+
+
+def append_lines(filename, lines):
+    with open(filename, 'a') as f:
+        f.writelines(lines)
 
 
 def start_emulator(avdnum, emuname, window_sel):
-    android_home = Config.android_home
-    while True:
-        msg = subprocess.Popen(
-            [android_home + 'platform-tools/adb', '-s', emuname, 'shell', 'getprop', 'init.svc.bootanim'],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        bootmsg = msg.communicate()
-        if bootmsg[0] == b'stopped\n':
-            time.sleep(3)
-            subprocess.Popen([android_home + 'platform-tools/adb', '-s', emuname, 'shell', 'rm', '-r', '/mnt/sdcard/*'])
-            return 1
-        elif len(re.findall('not found', bootmsg[1].decode('utf-8'))) >= 1:
-            if window_sel:
-                subprocess.Popen(
-                    [android_home + 'emulator/emulator', '-avd', avdnum, '-wipe-data', '-skin', '480x800', '-port',
-                     emuname[-4:], '-no-snapstorage'], stderr=subprocess.DEVNULL)
-            elif not window_sel:
-                subprocess.Popen(
-                    [android_home + 'emulator/emulator', '-avd', avdnum, '-wipe-data', '-skin', '480x800', '-no-audio',
-                     '-no-window', '-port', emuname[-4:], '-no-snapstorage'], stderr=subprocess.DEVNULL)
-            time.sleep(10)
-        else:
-            logger.info('Waiting for emulator to start...')
-            time.sleep(5)
+    """
+    Starts the emulator from the clean snapshot of the AVD unless it is running already, and waits until it has
+    booted. See Emulator.py.
+    """
+    Emulator(avdnum, emuname, window_sel).start()
+    return 1
 
 
 def stop_emulator(emuname):
-    android_home = Config.android_home
-    subprocess.Popen([android_home + 'platform-tools/adb', '-s', emuname, 'emu', 'kill'])
+    Emulator(None, emuname).stop()
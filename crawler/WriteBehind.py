@@ -0,0 +1,46 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind(object):
+    """
+    Bounded queue of writes served by a background thread, so that the crawl thread can keep driving the device while
+    the database and the file system catch up. When the queue is full, submit() blocks until there is room again.
+    Writes are done one at a time in the order they were submitted.
+    """
+
+    def __init__(self, maxsize=256):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = threading.Thread(target=self.work, name='write-behind', daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        self.queue.put((fn, args, kwargs))
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                fn, args, kwargs = item
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception('Write-behind failed to write.')
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """
+        Blocks until everything submitted so far is written.
+        """
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.flush()
+            self.queue.put(None)
+            self.thread.join()
@@ -0,0 +1,83 @@
+"""
+Content addressed cache of preprocessed arrays, used by learning/widenrnn.py.
+
+Every entry is a folder named after the sha1 of the contents of the input files and of the parameters the arrays were
+computed with, so changing any input or parameter computes them again instead of reading stale arrays. Arrays are saved
+as .npy files and memory mapped when read.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """
+    :param path: file, or folder whose files are all hashed in name order
+    :return: sha1 hex digest of the contents
+    """
+    h = hashlib.sha1()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode('utf-8'))
+            h.update(file_digest(os.path.join(path, name)).encode('ascii'))
+        return h.hexdigest()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(inputs, params):
+    """
+    :param inputs: paths of the input files, missing ones are hashed as missing
+    :param params: json serializable parameters
+    """
+    h = hashlib.sha1()
+    for path in inputs:
+        h.update(os.path.basename(path).encode('utf-8'))
+        h.update((file_digest(path) if os.path.exists(path) else 'missing').encode('ascii'))
+    h.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ArrayCache(object):
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.key = key
+        self.path = os.path.join(directory, key)
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, 'meta.json'))
+
+    def load(self, mmap_mode='r'):
+        """
+        :return: dict of name to array, memory mapped so nothing is read until it is used.
+        """
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            names = json.load(f)['arrays']
+        return {name: np.load(os.path.join(self.path, name + '.npy'), mmap_mode=mmap_mode) for name in names}
+
+    def save(self, arrays, params=None):
+        """
+        Writes the arrays into a temporary folder first, so an interrupted run never leaves a half written entry.
+        """
+        tmp = self.path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), array)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'arrays': sorted(arrays), 'params': params}, f)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.rename(tmp, self.path)
+
+    def subdir(self, name):
+        """
+        Folder inside the entry for other files derived from the arrays.
+        """
+        return os.path.join(self.path, name)
@@ -0,0 +1,131 @@
+"""
+Position of buttons on the screen, as the grid cell the centre of a button falls into, computed for a whole dataset at
+once. Used by parseJson.py (wide model data) and learning/generate_traintest.py.
+
+Buttons are identified by their clickable name, {class}-{text}-{[left,top][right,bottom]}, and screens by the
+dimensions in img_dimension_extract.txt. Cells are numbered row by row starting from 1, and '-1' marks a button whose
+position is unknown.
+"""
+import re
+
+import numpy as np
+
+BRACES = re.compile('{(.*?)}')
+SIGNED_BOUNDS = re.compile(r'\[(-?\d+),(-?\d+)\]')
+UNSIGNED_BOUNDS = re.compile(r'\[(\d+),(\d+)\]')
+
+
+def read_img_dimensions(imgdimextfile):
+    """
+    :return: dict of screenshot file name to its (width, height) strings, either of which may be 'err'.
+    """
+    imgdict = {}
+    with open(imgdimextfile, 'r') as f:
+        for line in f:
+            isplit = line.strip().split('\t')
+            imgdict[isplit[0].split('/')[4]] = (isplit[1], isplit[2])
+    return imgdict
+
+
+def parse_names(names, signed=True):
+    """
+    Parses the class and bounds of every clickable name in one pass.
+    :param signed: whether negative coordinates are parsed. If not, a button with one is treated as unparsable.
+    :return: (classes, bounds, parsed). classes is a list holding the first {} group of every name, or None if there
+    is none. bounds is an (n, 4) int64 array of left, top, right, bottom. parsed is a boolean array that is False
+    wherever the name has no bounds, in which case its row of bounds is 0.
+    """
+    bounds_pattern = SIGNED_BOUNDS if signed else UNSIGNED_BOUNDS
+    classes = []
+    bounds = np.zeros((len(names), 4), dtype=np.int64)
+    parsed = np.zeros(len(names), dtype=bool)
+    for i, name in enumerate(names):
+        m = BRACES.findall(name)
+        classes.append(m[0] if m else None)
+        if len(m) < 3:
+            continue
+        corners = bounds_pattern.findall(m[2])
+        if len(corners) < 2:
+            continue
+        bounds[i] = (int(corners[0][0]), int(corners[0][1]), int(corners[1][0]), int(corners[1][1]))
+        parsed[i] = True
+    return classes, bounds, parsed
+
+
+def screen_dimensions(imgnames, imgdict):
+    """
+    :return: (n, 2) float64 array of the width and height of every screenshot, nan where it is unknown.
+    """
+    dims = np.full((len(imgnames), 2), np.nan)
+    for i, imgname in enumerate(imgnames):
+        try:
+            dims[i] = (int(imgdict[imgname][0]), int(imgdict[imgname][1]))
+        except (KeyError, ValueError):
+            pass
+    return dims
+
+
+def centres(bounds):
+    return np.stack(((bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2), axis=1)
+
+
+def grid_cells(centre, dims, columns, rows):
+    """
+    :return: float64 array of the cell every centre falls into on a grid of columns x rows over the screen. This is
+    not checked against the grid, so a centre outside of the screen gives a cell outside of 1 to columns * rows.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        col = np.ceil(centre[:, 0] / dims[:, 0] * columns)
+        row = np.ceil(centre[:, 1] / dims[:, 1] * rows)
+    # Rows are always 3 cells apart, so the 5 x 3 grid of landscape screens shares its numbers with 3 x 5
+    return col + 3 * (row - 1)
+
+
+def known(parsed, dims):
+    return parsed & np.all(np.isfinite(dims), axis=1) & np.all(dims != 0, axis=1)
+
+
+def to_strings(cells, valid, prefix=None):
+    """
+    :param prefix: array of strings to put in front of each valid cell, or None.
+    """
+    out = []
+    for i in range(len(cells)):
+        if not valid[i]:
+            out.append('-1')
+        elif prefix is None:
+            out.append(str(int(cells[i])))
+        else:
+            out.append(prefix[i] + str(int(cells[i])))
+    return out
+
+
+def grid_3x3(bounds, parsed, dims):
+    """
+    Cells of a 3 x 3 grid over every screen, as parseJson.py has always computed them.
+    :return: list of cell strings, '-1' wherever the bounds or the screen dimensions are unknown.
+    """
+    valid = known(parsed, dims)
+    return to_strings(grid_cells(centres(bounds), dims, 3, 3), valid)
+
+
+def grid_by_screen(bounds, parsed, dims):
+    """
+    Cells of a grid chosen by the screen dimensions, as generate_traintest.py has always computed them: 3 x 5 for
+    480 x 800 screens, 5 x 3 for 800 x 480 screens, and 3 x 3 marked with an 'E' for every other screen.
+    :return: list of cell strings, '-1' wherever the position is unknown, outside of the screen, or outside of the grid.
+    """
+    centre = centres(bounds)
+    valid = known(parsed, dims)
+    with np.errstate(invalid='ignore'):
+        valid &= np.all(centre <= dims, axis=1)
+
+    portrait = (dims[:, 0] == 480) & (dims[:, 1] == 800)
+    landscape = (dims[:, 0] == 800) & (dims[:, 1] == 480)
+    other = ~(portrait | landscape)
+
+    cells = np.where(portrait, grid_cells(centre, dims, 3, 5),
+                     np.where(landscape, grid_cells(centre, dims, 5, 3), grid_cells(centre, dims, 3, 3)))
+    with np.errstate(invalid='ignore'):
+        valid &= (cells >= 1) & (cells <= np.where(other, 9, 15))
+    return to_strings(cells, valid, np.where(other, 'E', ''))
@@ -0,0 +1,139 @@
+"""
+Column store for the split data, so that the preparation steps can read the one or two fields they need without
+parsing every record as json again.
+
+A dataset is a folder holding, for every string column, <name>.utf8 (all values utf-8 encoded back to back) and
+<name>.offsets (rows + 1 int64 offsets into it), for every float column <name>.float64, and meta.json with the number
+of rows and the names of the columns. All files are little endian and are memory mapped when read.
+"""
+
+import json
+import os
+from array import array
+
+import numpy as np
+
+BUFFER_ROWS = 65536
+
+
+class ColumnWriter(object):
+    """
+    Appends records to a column store row by row, holding at most BUFFER_ROWS offsets and floats in memory.
+    """
+
+    def __init__(self, directory, strings=(), floats=()):
+        self.directory = directory
+        self.strings = list(strings)
+        self.floats = list(floats)
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self.data_files = {}
+        self.offset_files = {}
+        self.float_files = {}
+        self.positions = {}
+        self.offset_buffers = {}
+        self.float_buffers = {}
+        for name in self.strings:
+            self.data_files[name] = open(os.path.join(directory, name + '.utf8'), 'wb')
+            self.offset_files[name] = open(os.path.join(directory, name + '.offsets'), 'wb')
+            self.positions[name] = 0
+            self.offset_buffers[name] = array('q', [0])
+        for name in self.floats:
+            self.float_files[name] = open(os.path.join(directory, name + '.float64'), 'wb')
+            self.float_buffers[name] = array('d')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, record):
+        """
+        :param record: dict. Missing or None strings are stored as '' and missing floats as nan.
+        """
+        for name in self.strings:
+            value = record.get(name)
+            data = (value if value is not None else '').encode('utf-8')
+            self.data_files[name].write(data)
+            self.positions[name] += len(data)
+            self.offset_buffers[name].append(self.positions[name])
+        for name in self.floats:
+            value = record.get(name)
+            self.float_buffers[name].append(float(value) if value is not None else float('nan'))
+        self.rows += 1
+        if self.rows % BUFFER_ROWS == 0:
+            self.flush()
+
+    def flush(self):
+        for name in self.strings:
+            self.offset_buffers[name].tofile(self.offset_files[name])
+            self.offset_buffers[name] = array('q')
+        for name in self.floats:
+            self.float_buffers[name].tofile(self.float_files[name])
+            self.float_buffers[name] = array('d')
+
+    def close(self):
+        if not self.data_files and not self.float_files:
+            return
+        self.flush()
+        for f in list(self.data_files.values()) + list(self.offset_files.values()) + list(self.float_files.values()):
+            f.close()
+        self.data_files = {}
+        self.offset_files = {}
+        self.float_files = {}
+        write_meta(self.directory, self.rows, self.strings, self.floats)
+
+
+def write_meta(directory, rows, strings, floats):
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'rows': rows, 'strings': strings, 'floats': floats}, f)
+
+
+def truncate(directory, rows):
+    """
+    Keeps only the first rows records of a column store, in place.
+    """
+    reader = ColumnReader(directory)
+    rows = min(rows, len(reader))
+    for name in reader.meta['strings']:
+        end = int(reader.offsets(name)[rows])
+        os.truncate(os.path.join(directory, name + '.utf8'), end)
+        os.truncate(os.path.join(directory, name + '.offsets'), (rows + 1) * 8)
+    for name in reader.meta['floats']:
+        os.truncate(os.path.join(directory, name + '.float64'), rows * 8)
+    write_meta(directory, rows, reader.meta['strings'], reader.meta['floats'])
+
+
+class ColumnReader(object):
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def memmap(self, filename, dtype, count):
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.directory, filename), dtype=dtype, mode='r', shape=(count,))
+
+    def offsets(self, name):
+        return self.memmap(name + '.offsets', '<i8', len(self) + 1)
+
+    def strings(self, name):
+        """
+        Yields the values of a string column in row order, decoding one value at a time.
+        """
+        offsets = self.offsets(name)
+        data = self.memmap(name + '.utf8', np.uint8, int(offsets[-1]))
+        for i in range(len(self)):
+            yield data[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+    def floats(self, name):
+        """
+        :return: read-only, memory mapped float64 array of a float column.
+        """
+        return self.memmap(name + '.float64', '<f8', len(self))
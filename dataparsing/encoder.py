@@ -0,0 +1,69 @@
+"""
+Hashed vocabularies that turn whole columns of tokens into id arrays at once, used by learning/widenrnn.py instead of
+list.index lookups.
+"""
+import numpy as np
+
+UNKNOWN = -1
+
+
+class Vocabulary(object):
+    def __init__(self, tokens, unknown=None):
+        """
+        :param tokens: the tokens in id order. A token listed twice keeps its first id, like list.index.
+        :param unknown: token that tokens outside the vocabulary are encoded as. If None, they are an error.
+        """
+        self.tokens = list(tokens)
+        self.ids = {}
+        for i, token in enumerate(self.tokens):
+            self.ids.setdefault(token, i)
+        self.unknown = unknown
+        self.unknown_id = UNKNOWN if unknown is None else self.ids[unknown]
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def encode(self, values, strict=True):
+        """
+        :param strict: raise ValueError for tokens outside the vocabulary when there is no unknown token. Otherwise
+        they are encoded as UNKNOWN.
+        :return: int32 array of the ids of values
+        """
+        ids = np.fromiter((self.ids.get(value, self.unknown_id) for value in values), dtype=np.int32,
+                          count=len(values))
+        if strict:
+            self.check(ids, values)
+        return ids
+
+    def check(self, ids, values):
+        """
+        Raises ValueError naming the values that were encoded as UNKNOWN.
+        """
+        missing = np.flatnonzero(ids == UNKNOWN)
+        if len(missing):
+            examples = sorted(set(str(values[i]) for i in missing[:1000]))[:10]
+            raise ValueError('%d tokens are not in the vocabulary, e.g. %s' % (len(missing), ', '.join(examples)))
+
+    def translate(self, names, ids):
+        """
+        Re-encodes ids of another vocabulary into this one.
+        :param names: tokens of the other vocabulary in id order
+        :param ids: array of ids into names
+        """
+        out = self.encode(names, strict=False)[ids] if len(names) else np.full(len(ids), UNKNOWN, dtype=np.int32)
+        if self.unknown is None:
+            self.check(out, [names[i] for i in ids])
+        return out
+
+    def encode_rows(self, rows, length, pad=0):
+        """
+        Encodes rows of tokens into a (rows, length) matrix, cutting every row to length tokens and padding it with pad.
+        """
+        lengths = np.array([min(len(row), length) for row in rows], dtype=np.int64)
+        flat = [token for row in rows for token in row[:length]]
+        ids = self.encode(flat)
+        out = np.full((len(rows), length), pad, dtype=np.int32)
+        row_index = np.repeat(np.arange(len(rows)), lengths)
+        col_index = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        out[row_index, col_index] = ids
+        return out
@@ -1,36 +1,342 @@
+import argparse
+import itertools
+import multiprocessing
+import os
 import re
 import subprocess
+import threading
+from collections import Counter
+from multiprocessing.pool import ThreadPool
 
-import itertools
+RESULT = re.compile(r'^([PR])@\d+\s+(\S+)', re.MULTILINE)
+COLUMNS = ['lr', 'dim', 'epoch', 'precision', 'recall', 'f1', 'model']
+CLASS_COLUMNS = ['lr', 'dim', 'epoch', 'label', 'precision', 'recall', 'f1', 'support']
+LABEL_PREFIX = '__label__'
+
+
+def parse_result(output):
+    """
+    :param output: what `fasttext test` prints, N, P@k and R@k one per line
+    :return: (precision, recall)
+    """
+    found = dict(RESULT.findall(output))
+    return float(found['P']), float(found['R'])
+
+
+def f1_score(precision, recall):
+    if precision + recall == 0:
+        return 0.0
+    return 2 * (precision * recall) / (precision + recall)
+
+
+def read_labelled(filename):
+    """
+    :return: (labels, texts) of every line of a fastText data file, labels being the list of labels of the line
+    """
+    labels = []
+    texts = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            words = line.split()
+            count = 0
+            while count < len(words) and words[count].startswith(LABEL_PREFIX):
+                count += 1
+            labels.append(words[:count])
+            texts.append(' '.join(words[count:]))
+    return labels, texts
+
+
+def count_predictions(model, labels, texts, batch_size):
+    """
+    Predicts the top label of every labelled text, batch_size texts at a time. Lines without a label are left out,
+    as `fasttext test` does.
+    :return: Counters of label to the number of times it was predicted, was a gold label and was predicted correctly
+    """
+    predicted = Counter()
+    actual = Counter()
+    correct = Counter()
+    labelled = [(gold, text) for gold, text in zip(labels, texts) if gold]
+    for start in range(0, len(labelled), batch_size):
+        batch = labelled[start:start + batch_size]
+        predictions = model.predict([text for gold, text in batch], k=1)[0]
+        for (gold, text), top in zip(batch, predictions):
+            actual.update(gold)
+            if top:
+                predicted[top[0]] += 1
+                correct[top[0]] += top[0] in gold
+    return predicted, actual, correct
+
+
+def overall_metrics(counts):
+    """
+    :param counts: what count_predictions returns
+    :return: (precision, recall) at 1 over every line, as `fasttext test` computes them
+    """
+    predicted, actual, correct = (sum(c.values()) for c in counts)
+    return (correct / predicted if predicted else 0.0), (correct / actual if actual else 0.0)
+
+
+def class_metrics(counts):
+    """
+    :param counts: what count_predictions returns
+    :return: dict of label to (precision, recall, f1, support)
+    """
+    predicted, actual, correct = counts
+    metrics = {}
+    for label in sorted(set(actual) | set(predicted)):
+        precision = correct[label] / predicted[label] if predicted[label] else 0.0
+        recall = correct[label] / actual[label] if actual[label] else 0.0
+        metrics[label] = (precision, recall, f1_score(precision, recall), actual[label])
+    return metrics
+
+
+def model_path(model_dir, lr, dim, epoch):
+    return os.path.join(model_dir, 'model-lr%g-dim%d-epoch%d' % (lr, dim, epoch))
+
+
+def empty_result(lr, dim, epoch, model):
+    return {'lr': lr, 'dim': dim, 'epoch': epoch, 'precision': None, 'recall': None, 'f1': None, 'model': model}
+
+
+class BestModel(object):
+    """
+    Keeps the in-process model with the best f1 so far, so that only that one is ever saved.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.model = None
+        self.result = None
+
+    def offer(self, result, model):
+        with self.lock:
+            if self.result is None or result['f1'] > self.result['f1']:
+                self.result, self.model = result, model
+
+    def save(self, model_dir):
+        """
+        Saves the best model into model_dir and records its path in its result.
+        """
+        if self.model is not None:
+            path = model_path(model_dir, self.result['lr'], self.result['dim'], self.result['epoch'])
+            self.model.save_model(path + '.bin')
+            self.result['model'] = path
+
+
+class ApiRunner(object):
+    """
+    Trains and tests models in this process with the fastText Python bindings. The bindings only train from a file, so
+    the training file is read by every run. The test file is read once, and every model is tested on the lines in
+    memory with batched predictions rather than with model.test, which would read it again.
+    """
+
+    def __init__(self, fasttext, train, test, min_count, threads, per_class, predict_batch):
+        """
+        :param fasttext: the fasttext module
+        :param per_class: also compute the metrics of every class of every run
+        """
+        self.fasttext = fasttext
+        self.train = train
+        self.min_count = min_count
+        self.threads = threads
+        self.per_class = per_class
+        self.predict_batch = predict_batch
+        self.test_labels, self.test_texts = read_labelled(test)
+        self.best_model = BestModel()
+
+    def __call__(self, config):
+        """
+        Trains and tests a model for one configuration. Only the best model is kept, see BestModel, so 'model' is
+        None in the results until the best one is saved.
+        :return: same as CliRunner, with the metrics of every class under 'classes' when per_class is set.
+        """
+        lr, dim, epoch = config
+        result = empty_result(lr, dim, epoch, None)
+        try:
+            model = self.fasttext.train_supervised(input=self.train, lr=lr, dim=dim, epoch=epoch,
+                                                   minCount=self.min_count, thread=self.threads, verbose=0)
+        except ValueError as e:
+            print('Training lr: %s, dim: %d, epoch: %d failed: %s' % (lr, dim, epoch, e))
+            return result
+        counts = count_predictions(model, self.test_labels, self.test_texts, self.predict_batch)
+        precision, recall = overall_metrics(counts)
+        result.update(precision=precision, recall=recall, f1=f1_score(precision, recall))
+        if self.per_class:
+            result['classes'] = class_metrics(counts)
+        self.best_model.offer(result, model)
+        print('lr: %s, dim: %d, epoch: %d, f1: %f' % (lr, dim, epoch, result['f1']))
+        return result
+
+
+class CliRunner(object):
+    """
+    Trains every model into its own file with the fastText executable, and tests it with the executable too.
+    """
+
+    def __init__(self, train, test, model_dir, min_count, threads):
+        self.train = train
+        self.test = test
+        self.model_dir = model_dir
+        self.min_count = min_count
+        self.threads = threads
+
+    def __call__(self, config):
+        """
+        Trains a model for one configuration, waits for it, and tests it.
+        :param config: (lr, dim, epoch)
+        :return: dict with the COLUMNS of the run, precision, recall and f1 being None if it failed.
+        """
+        lr, dim, epoch = config
+        model = model_path(self.model_dir, lr, dim, epoch)
+        result = empty_result(lr, dim, epoch, model)
+        train = subprocess.run(
+            ['fasttext', 'supervised', '-input', self.train, '-output', model, '-lr', str(lr), '-dim', str(dim),
+             '-epoch', str(epoch), '-minCount', str(self.min_count), '-thread', str(self.threads)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if train.returncode != 0:
+            print('Training %s failed: %s' % (model, train.stderr.decode('utf-8', 'replace').strip()))
+            return result
+        test = subprocess.run(['fasttext', 'test', model + '.bin', self.test], stdout=subprocess.PIPE)
+        try:
+            precision, recall = parse_result(test.stdout.decode('utf-8'))
+        except (KeyError, ValueError):
+            print('Testing %s failed: %s' % (model, test.stdout.decode('utf-8', 'replace').strip()))
+            return result
+        result.update(precision=precision, recall=recall, f1=f1_score(precision, recall))
+        print('lr: %s, dim: %d, epoch: %d, f1: %f' % (lr, dim, epoch, result['f1']))
+        return result
+
+
+def run_all(pool, run, configs):
+    return pool.map(run, configs, chunksize=1)
+
+
+def ranked(results):
+    """
+    :return: the results that did not fail, best f1 first
+    """
+    return sorted([r for r in results if r['f1'] is not None], key=lambda r: r['f1'], reverse=True)
+
+
+def successive_halving(pool, run, configs, min_epoch, max_epoch, eta):
+    """
+    Trains every configuration for min_epoch epochs, keeps the best 1/eta of them, and trains these again for eta times
+    as many epochs, until one is left or max_epoch is reached.
+    :param run: ApiRunner or CliRunner
+    :param configs: list of (lr, dim)
+    :return: the results of every round
+    """
+    results = []
+    epoch = min_epoch
+    while True:
+        round_results = run_all(pool, run, [(lr, dim, epoch) for lr, dim in configs])
+        results.extend(round_results)
+        best = ranked(round_results)
+        print('%d configurations trained for %d epochs, best f1: %s' % (
+            len(configs), epoch, best[0]['f1'] if best else None))
+        if len(best) <= 1 or epoch >= max_epoch:
+            return results
+        configs = [(r['lr'], r['dim']) for r in best[:max(1, len(best) // eta)]]
+        epoch = min(epoch * eta, max_epoch)
+
+
+def write_table(results, filename):
+    with open(filename, 'w') as f:
+        f.write('\t'.join(COLUMNS) + '\n')
+        for r in ranked(results):
+            # 'model' is None for the models that were not kept
+            f.write('\t'.join('' if r[c] is None else str(r[c]) for c in COLUMNS) + '\n')
+
+
+def write_class_table(results, filename):
+    with open(filename, 'w') as f:
+        f.write('\t'.join(CLASS_COLUMNS) + '\n')
+        for r in ranked(results):
+            for label, metrics in sorted(r.get('classes', {}).items()):
+                f.write('\t'.join(str(x) for x in (r['lr'], r['dim'], r['epoch'], label) + metrics) + '\n')
+
+
+def remove_models(results, keep):
+    """
+    Removes the model files of every run but keep, and leaves their paths out of the results.
+    """
+    for r in results:
+        if r['model'] is None or r['model'] == keep:
+            continue
+        for ext in ('.bin', '.vec'):
+            if os.path.isfile(r['model'] + ext):
+                os.remove(r['model'] + ext)
+        r['model'] = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train", default='../data/fastTextTrain.txt', help="Training data.")
+    parser.add_argument("--test", default='../data/fastTextTest.txt', help="Test data.")
+    parser.add_argument("--model_dir", default='../data/fasttext_sweep', help="Folder the models are trained into.")
+    parser.add_argument("--results", default='./fasttext_sweep.tsv', help="Table of the results, best f1 first.")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() // 4),
+                        help="Number of models trained at the same time.")
+    parser.add_argument("--threads", type=int, default=4, help="Number of threads every fastText run uses.")
+    parser.add_argument("--min_count", type=int, default=1, help="fastText -minCount.")
+    parser.add_argument("--halving", action='store_true',
+                        help="Sweep learning rate and dimension with successive halving over the number of epochs, "
+                             "instead of training every configuration of the grid.")
+    parser.add_argument("--eta", type=int, default=3, help="Successive halving keeps the best 1/eta every round.")
+    parser.add_argument("--min_epoch", type=int, default=1, help="Epochs of the first successive halving round.")
+    parser.add_argument("--keep_models", action='store_true', help="Keep the models of every run, not just the best.")
+    parser.add_argument("--api", action='store_true',
+                        help="Train and test in this process with the fastText Python bindings instead of the "
+                             "fasttext executable. Only the best model is saved.")
+    parser.add_argument("--per_class", action='store_true',
+                        help="With --api, also compute precision, recall and f1 of every class.")
+    parser.add_argument("--class_results", default='./fasttext_sweep_classes.tsv',
+                        help="Table of the metrics of every class of every run, with --per_class.")
+    parser.add_argument("--predict_batch", type=int, default=10000, help="Number of test lines predicted at a time.")
+    args = parser.parse_args()
+
+    if args.api:
+        try:
+            import fasttext
+        except ImportError:
+            parser.error("--api requires the fasttext Python package (pip install fasttext).")
+        run = ApiRunner(fasttext, args.train, args.test, args.min_count, args.threads, args.per_class,
+                        args.predict_batch)
+    elif args.per_class:
+        parser.error("--per_class requires --api.")
+    else:
+        run = CliRunner(args.train, args.test, args.model_dir, args.min_count, args.threads)
+
+    learning_rate = [x * 0.005 for x in range(1, 11)]
+    # dimension = [x for x in range(1, 11)]
+    dimension = [10]
+    # epoch = [x for x in range(1, 11)]
+    epoch = [10]
+
+    os.makedirs(args.model_dir, exist_ok=True)
+    with ThreadPool(args.workers) as pool:
+        if args.halving:
+            configs = list(itertools.product(learning_rate, dimension))
+            print(len(configs))
+            results = successive_halving(pool, run, configs, args.min_epoch, max(epoch), args.eta)
+        else:
+            configs = list(itertools.product(learning_rate, dimension, epoch))
+            print(len(configs))
+            results = run_all(pool, run, configs)
 
-import time
-
-learning_rate = [x * 0.005 for x in range(1, 11)]
-# dimension = [x for x in range(1, 11)]
-dimension = [10]
-# epoch = [x for x in range(1, 11)]
-epoch = [10]
-min_count = 1
-
-s = [learning_rate, dimension, epoch]
-p = list(itertools.product(*s))
-print(len(p))
-maxf1 = 0
-max_i = ()
-for i in p:
-    subprocess.Popen(
-        ['fasttext', 'supervised', '-input', '../data/fastTextTrain.txt', '-output', 'model', '-lr', str(i[0]),
-         '-dim', str(i[1]), '-epoch', str(i[2]), '-minCount', str(min_count)])
-    time.sleep(1)
-    omsg = subprocess.Popen(['fasttext', 'test', './model.bin', '../data/fastTextTest.txt'],
-                            stdout=subprocess.PIPE)
-    o = omsg.communicate()[0].decode('utf-8')
-    no = re.findall('\d*\.?\d+', o, re.MULTILINE)
-    precision = float(no[2])
-    recall = float(no[4])
-    f1 = 2 * (precision * recall) / (precision + recall)
-    maxf1 = max(f1, maxf1)
-    max_i = i
-    print(maxf1)
-    print(max_i)
-    time.sleep(1)
+    best = ranked(results)
+    if args.api:
+        # Only the best model was kept, and it is the only one the table lists a model of
+        run.best_model.save(args.model_dir)
+        best = [run.best_model.result] if best else []
+    elif best and not args.keep_models:
+        remove_models(results, best[0]['model'])
+    write_table(results, args.results)
+    if args.per_class:
+        write_class_table(results, args.class_results)
+    if not best:
+        print('Every run failed.')
+        exit(1)
+    print('Max f1: %f' % best[0]['f1'])
+    print('lr: %s, dim: %d, epoch: %d, model: %s.bin' % (best[0]['lr'], best[0]['dim'], best[0]['epoch'],
+                                                         best[0]['model']))
@@ -1,21 +1,108 @@
+import argparse
+import multiprocessing
 import os
-from glob import glob
+import struct
+
 from PIL import Image
 from crawler.Config import Config
 
-result = [y for x in os.walk(Config.screen_location) for y in glob(os.path.join(x[0], '*.png'))]
-dimension_list = []
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
 
-for f in result:
+def image_size(f):
+    """
+    Reads the width and height of a screenshot from its PNG IHDR header, without decoding the image. Files that are not
+    PNGs are left to PIL.
+    :return: (width, height), or ('err', 'err') if the file cannot be read.
+    """
     try:
+        with open(f, 'rb') as img:
+            header = img.read(24)
+        if header[:8] == PNG_SIGNATURE and header[12:16] == b'IHDR':
+            return struct.unpack('>II', header[16:24])
         with Image.open(f) as img:
-            width, height = img.size
-            dimension_list.append((f, width, height))
+            return img.size
     except Exception:
         print(f)
-        dimension_list.append((f, 'err', 'err'))
+        return 'err', 'err'
+
+
+def find_screenshots(directory):
+    """
+    :return: list of (path, mtime_ns, size) of every .png file under directory, in the order os.walk lists them.
+    """
+    result = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.png') and not name.startswith('.'):
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                result.append((path, st.st_mtime_ns, st.st_size))
+    return result
+
+
+def read_cache(cachefile):
+    """
+    :return: dict of path to (mtime_ns, size, width, height)
+    """
+    cache = {}
+    if os.path.isfile(cachefile):
+        with open(cachefile, 'r') as f:
+            for line in f:
+                isplit = line.rstrip('\n').split('\t')
+                cache[isplit[0]] = (int(isplit[1]), int(isplit[2]), isplit[3], isplit[4])
+    return cache
+
+
+def write_cache(cachefile, screenshots, dimensions):
+    with open(cachefile + '.tmp', 'w') as f:
+        for (path, mtime, size), (width, height) in zip(screenshots, dimensions):
+            f.write('%s\t%d\t%d\t%s\t%s\n' % (path, mtime, size, width, height))
+    os.replace(cachefile + '.tmp', cachefile)
+
+
+def extract_dimensions(directory, cachefile, workers):
+    """
+    Dimensions of every screenshot under directory. Only screenshots that are new, or whose mtime or size changed since
+    they were cached, are read.
+    :return: list of (path, width, height)
+    """
+    screenshots = find_screenshots(directory)
+    cache = read_cache(cachefile)
+    dimensions = [None] * len(screenshots)
+    todo = []
+    for i, (path, mtime, size) in enumerate(screenshots):
+        cached = cache.get(path)
+        if cached is not None and cached[0] == mtime and cached[1] == size:
+            dimensions[i] = cached[2:]
+        else:
+            todo.append(i)
+
+    print('%d screenshots, %d of them cached.' % (len(screenshots), len(screenshots) - len(todo)))
+    paths = [screenshots[i][0] for i in todo]
+    if workers > 1 and len(paths) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            sizes = pool.map(image_size, paths, chunksize=256)
+    else:
+        sizes = [image_size(path) for path in paths]
+    for i, size in zip(todo, sizes):
+        dimensions[i] = size
+
+    write_cache(cachefile, screenshots, dimensions)
+    return [(path, width, height) for (path, mtime, size), (width, height) in zip(screenshots, dimensions)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="Number of processes reading the screenshots.")
+    parser.add_argument("--cache", default='./img_dimension_cache.txt',
+                        help="File keeping the dimensions of the screenshots already read, by path, mtime and size.")
+    args = parser.parse_args()
+
+    dimension_list = extract_dimensions(Config.screen_location, args.cache, args.workers)
 
-with open('./img_dimension_extract.txt', 'w') as f:
-    for dim in dimension_list:
-        f.write('%s\t%s\t%s' % (dim[0], dim[1], dim[2]))
-        f.write('\n')
+    with open('./img_dimension_extract.txt', 'w') as f:
+        for dim in dimension_list:
+            f.write('%s\t%s\t%s' % (dim[0], dim[1], dim[2]))
+            f.write('\n')
@@ -2,163 +2,188 @@ import argparse
 import codecs
 import collections
 import getpass
+import itertools
 import json
-import math
+import multiprocessing
 import operator
+import os
 import random
 import re
 import string
-import sys
 from enum import Enum
 from os import listdir
 from os.path import isfile, join
 
 from tqdm import *
 
+from dataparsing import btn_position, columnar
 
-def pre_process(fileno, datafile):
-    print('Opening file ' + str(fileno) + ': ' + datafile)
+# Column stores of the split data, holding the fields that the preparation steps read
+ncolumns = '../data/ndata/'
+pcolumns = '../data/pdata/'
+COLUMNS = ('text', 'name', 'parent_activity_state', 'next_transition_state')
+FLOAT_COLUMNS = ('score',)
+
+
+def read_lines(datafile):
+    """
+    Yields the stripped lines of a file one at a time, so that files of any size are read in constant memory.
+    """
     with codecs.open(datafile, "r", 'utf-8') as f:
-        datainput = [x.strip() for x in tqdm(f)]
-    text_list = []
-    obj_list = []
-    for i in tqdm(datainput):
+        for line in f:
+            yield line.strip()
+
+
+def write_lines(datafile, lines):
+    """
+    Writes lines to a file as they are generated.
+    :return: the number of lines written.
+    """
+    count = 0
+    with codecs.open(datafile, 'w', 'utf-8') as f:
+        for line in lines:
+            f.write('{}\n'.format(line))
+            count += 1
+    return count
+
+
+# Matches any character outside of string.printable
+not_printable = re.compile('[^' + re.escape(string.printable) + ']')
+
+
+def english_records(lines):
+    """
+    Yields the records that have a text made only of printable ASCII characters.
+    """
+    for i in lines:
         try:
             json_obj = json.loads(i)
             if 'text' in json_obj:
                 curr_text = json_obj['text']
-                if curr_text:
-                    not_english = False
-                    for scii in curr_text:
-                        if scii not in string.printable:
-                            not_english = True
-                            break
-
-                    if not not_english:
-                        text_list.append(curr_text.lower())
-                        obj_list.append(json_obj)
+                if curr_text and not_printable.search(curr_text) is None:
+                    yield json_obj
         except Exception:
             print('Error')
-    with codecs.open('../data/serverdata/dataformatted' + str(fileno) + '.json', 'w', 'utf-8') as f:
-        for i in obj_list:
-            f.write('{}\n'.format(json.dumps(i)))
+
+
+def pre_process(fileno, datafile):
+    print('Opening file ' + str(fileno) + ': ' + datafile)
+    records = english_records(tqdm(read_lines(datafile)))
+    write_lines('../data/serverdata/dataformatted' + str(fileno) + '.json', (json.dumps(i) for i in records))
 
 
 def combine_dataformatted(datano):
-    datainput = {}
-    for i in range(1, datano + 1):
-        with codecs.open('../data/serverdata/dataformatted' + str(i) + '.json', "r", 'utf-8') as f:
-            datainput[i] = [x.strip() for x in tqdm(f)]
-    text_list = []
-    obj_list = []
-    for k, v in tqdm(datainput.items()):
-        for item in v:
-            json_obj = json.loads(item)
-            obj_list.append(json_obj)
-
-    with codecs.open('../data/serverdata/dataformattedF.json', 'w', 'utf-8') as f:
-        for i in obj_list:
-            f.write('{}\n'.format(json.dumps(i)))
+    def formatted_lines():
+        for i in range(1, datano + 1):
+            # Every line was written by json.dumps in pre_process, so it can be copied over as it is
+            for line in tqdm(read_lines('../data/serverdata/dataformatted' + str(i) + '.json')):
+                if line:
+                    yield line
+
+    write_lines('../data/serverdata/dataformattedF.json', formatted_lines())
+
+
+def transitions(datafile):
+    """
+    Yields (line, record) for the records whose next transition state is known, i.e. neither None nor OUTOFAPK.
+    """
+    for line in read_lines(datafile):
+        if not line:
+            continue
+        obj_loaded = json.loads(line)
+        if obj_loaded['next_transition_state'] is not None and obj_loaded['next_transition_state'] != 'OUTOFAPK':
+            yield line, obj_loaded
 
 
-def split_to_pd(feature):
-    print('Spltting data using %s.' % feature)
-    with open('../data/serverdata/dataformattedF.json', 'r') as f:
-        lines = [x.strip() for x in f.readlines()]
-    pdata = []
-    ndata = []
+def build_transitiondict(datafile, feature):
+    """
+    Pre-pass of DST and DST_RELAXED over the combined data, mapping every state to its possible previous states.
+    For DST, only states with a single possible previous state are kept, mapped to that state.
+    For DST_RELAXED, every state is kept, mapped to the set of its previous states.
+    """
     activitydict = {}
     transitiondict = {}
+    for line, obj_loaded in tqdm(transitions(datafile)):
+        # Adding to activitydict a matching between next state with the current state
+        # This is done so that we have a dict which we can use to find the previous state
+        if obj_loaded['next_transition_state'] not in activitydict:
+            activitydict[obj_loaded['next_transition_state']] = set()
+        activitydict[obj_loaded['next_transition_state']].add(obj_loaded['parent_activity_state'])
+
+    # Excluding cases where there are multiple possibilities of previous states
+    for k, v in activitydict.items():
+        if feature == FEATURE.DST_RELAXED:
+            transitiondict[k] = v
+        elif feature == FEATURE.DST:
+            if len(v) == 1:
+                transitiondict[k] = v.pop()
+    return transitiondict
+
+
+def is_negative(obj_loaded, feature, transitiondict):
+    if feature == FEATURE.NST:
+        # FEATURE.NST checks if the current state is different from the next state
+        # If they are different, means positive data set. Otherwise, negative
+        return obj_loaded['parent_activity_state'] == obj_loaded['next_transition_state']
+
+    # FEATURE.DST includes checking of previous to the next state
+    if obj_loaded['parent_activity_state'] == obj_loaded['next_transition_state']:
+        return True
+    if obj_loaded['parent_activity_state'] in transitiondict:
+        # transitiondict[obj_loaded['parent_activity_state']] will give the previous state
+        # Checks if previous state is equivalent to the next state
+        if feature == FEATURE.DST:
+            return transitiondict[obj_loaded['parent_activity_state']] == obj_loaded['next_transition_state']
+        # RELAXED version of DST checks if any of the previous state is equivalent to the next state
+        return obj_loaded['next_transition_state'] in transitiondict[obj_loaded['parent_activity_state']]
+    return False
+
+
+def split_to_pd(feature):
+    print('Spltting data using %s.' % feature)
+    datafile = '../data/serverdata/dataformattedF.json'
 
     """ Pre-processing work """
-    if feature == FEATURE.DST or FEATURE.DST_RELAXED:
-        for line in tqdm(lines):
-            obj_loaded = json.loads(line)
-            # We must exclude cases where NST is none and NST is OUTOFAPK
-            # Adding to activitydict a matching between next state with the current state
-            # This is done so that we have a dict which we can use to find the previous state
-            if obj_loaded['next_transition_state'] is not None and obj_loaded['next_transition_state'] != 'OUTOFAPK':
-                if obj_loaded['next_transition_state'] not in activitydict:
-                    activitydict[obj_loaded['next_transition_state']] = set()
-                activitydict[obj_loaded['next_transition_state']].add(obj_loaded['parent_activity_state'])
-
-        # Excluding cases where there are multiple possibilities of previous states
-        for k, v in activitydict.items():
-            if feature == FEATURE.DST_RELAXED:
-                transitiondict[k] = set(activitydict[k])
-            elif feature == FEATURE.DST:
-                if len(v) == 1:
-                    transitiondict[k] = activitydict[k].pop()
-                else:
-                    pass
+    transitiondict = {}
+    if feature in (FEATURE.DST, FEATURE.DST_RELAXED):
+        transitiondict = build_transitiondict(datafile, feature)
 
     """ Actual implementation """
-    for line in lines:
-        obj_loaded = json.loads(line)
-
+    # The records are streamed into temporary files first, since how many of them are kept is only known at the end
+    ntmp = '../data/ndata.txt.tmp'
+    ptmp = '../data/pdata.txt.tmp'
+    nlen = 0
+    plen = 0
+    with codecs.open(ntmp, 'w', 'utf-8') as nf, codecs.open(ptmp, 'w', 'utf-8') as pf, \
+            columnar.ColumnWriter(ncolumns, COLUMNS, FLOAT_COLUMNS) as nc, \
+            columnar.ColumnWriter(pcolumns, COLUMNS, FLOAT_COLUMNS) as pc:
         # We exclude cases of NST being none and NST being OUTOFAPK
-        if obj_loaded['next_transition_state'] is not None and obj_loaded['next_transition_state'] != 'OUTOFAPK':
-
-            if feature == FEATURE.NST:
-                # FEATURE.NST checks if the current state is different from the next state
-                # If they are different, means positive data set. Otherwise, negative
-                if obj_loaded['parent_activity_state'] == obj_loaded['next_transition_state']:
-                    ndata.append(obj_loaded)
-                else:
-                    pdata.append(obj_loaded)
-
-            elif feature == FEATURE.DST or FEATURE.DST_RELAXED:
-                # FEATURE.DST includes checking of previous to the next state
-                if obj_loaded['parent_activity_state'] == obj_loaded['next_transition_state']:
-                    ndata.append(obj_loaded)
-                elif obj_loaded['parent_activity_state'] in transitiondict:
-                    # transitiondict[obj_loaded['parent_activity_state']] will give the previous state
-                    # Checks if previous state is equivalent to the next state
-                    if feature == FEATURE.DST:
-                        if transitiondict[obj_loaded['parent_activity_state']] == obj_loaded['next_transition_state']:
-                            ndata.append(obj_loaded)
-                        else:
-                            pdata.append(obj_loaded)
-                    elif feature == FEATURE.DST_RELAXED:
-                        # RELAXED version of DST checks if any of the previous state is equivalent to the next state
-                        if obj_loaded['next_transition_state'] in transitiondict[obj_loaded['parent_activity_state']]:
-                            ndata.append(obj_loaded)
-                        else:
-                            pdata.append(obj_loaded)
-
-                else:
-                    pdata.append(obj_loaded)
+        for line, obj_loaded in tqdm(transitions(datafile)):
+            if is_negative(obj_loaded, feature, transitiondict):
+                nf.write(line + '\n')
+                nc.append(obj_loaded)
+                nlen += 1
+            else:
+                pf.write(line + '\n')
+                pc.append(obj_loaded)
+                plen += 1
 
     print('Current feature: %s' % feature)
-    print('Negative data amount: {}'.format(len(ndata)))
-    print('Positive data amount: {}'.format(len(pdata)))
-    print('Total data amount: %s' % (len(ndata) + len(pdata)))
-    min_amt = min(len(ndata), len(pdata))
-    with open('../data/ndata.txt', 'w') as f:
-        for i in range(min_amt):
-            f.write(json.dumps(ndata[i]) + '\n')
-
-    with open('../data/pdata.txt', 'w') as f:
-        for i in range(min_amt):
-            f.write(json.dumps(pdata[i]) + '\n')
+    print('Negative data amount: {}'.format(nlen))
+    print('Positive data amount: {}'.format(plen))
+    print('Total data amount: %s' % (nlen + plen))
+    min_amt = min(nlen, plen)
+    write_lines('../data/ndata.txt', itertools.islice(read_lines(ntmp), min_amt))
+    write_lines('../data/pdata.txt', itertools.islice(read_lines(ptmp), min_amt))
+    os.remove(ntmp)
+    os.remove(ptmp)
+    columnar.truncate(ncolumns, min_amt)
+    columnar.truncate(pcolumns, min_amt)
 
 
 def get_info_on_text_pd():
-    with open('../data/pdata.txt', 'r') as f:
-        plines = [x.strip() for x in f.readlines()]
-    with open('../data/ndata.txt', 'r') as f:
-        nlines = [x.strip() for x in f.readlines()]
-    obj_list = []
-    next_ts_list = []
-    pdata = []
-    ndata = []
-
-    for pline in plines:
-        obj_loaded = json.loads(pline)
-        pdata.append(obj_loaded['text'].lower())
-    for nline in nlines:
-        obj_loaded = json.loads(nline)
-        ndata.append(obj_loaded['text'].lower())
+    pdata = [x.lower() for x in columnar.ColumnReader(pcolumns).strings('text')]
+    ndata = [x.lower() for x in columnar.ColumnReader(ncolumns).strings('text')]
 
     print('Negative data amount: {}'.format(len(ndata)))
     print('Positive data amount: {}'.format(len(pdata)))
@@ -183,23 +208,14 @@ def get_info_on_text_pd():
 
 
 def get_info_on_btn_distribution():
-    with open('../data/pdata.txt', 'r') as f:
-        lines = [x.strip() for x in f.readlines()]
-    obj_list = []
-    pdata = []
-
-    for line in lines:
-        obj_loaded = json.loads(line)
-        pdata.append(obj_loaded)
+    pcolumn = columnar.ColumnReader(pcolumns)
 
     pscoredict = {}
     pscoredictavg = {}
-    for obj_loaded in pdata:
-        curr_state = obj_loaded['parent_activity_state']
-        next_state = obj_loaded['next_transition_state']
-        if obj_loaded['text'].lower() not in pscoredict:
-            pscoredict[obj_loaded['text'].lower()] = []
-        pscoredict[obj_loaded['text'].lower()].append(obj_loaded['score'])
+    for text, score in zip(pcolumn.strings('text'), pcolumn.floats('score')):
+        if text.lower() not in pscoredict:
+            pscoredict[text.lower()] = []
+        pscoredict[text.lower()].append(float(score))
 
     for k, v in pscoredict.items():
         pscoredictavg[k] = sum(pscoredict[k]) / len(pscoredict[k])
@@ -218,19 +234,8 @@ def get_info_on_btn_distribution():
 def prep_data_for_fasttext():
     print('\nPreparing data for fast text model...')
 
-    with open('../data/pdata.txt', 'r') as f:
-        pdata = [x.strip() for x in f.readlines()]
-
-    for i in range(len(pdata)):
-        jp = json.loads(pdata[i])
-        pdata[i] = '__label__p ' + jp['text'].lower()
-
-    with open('../data/ndata.txt', 'r') as f:
-        ndata = [x.strip() for x in f.readlines()]
-
-    for i in range(len(ndata)):
-        jn = json.loads(ndata[i])
-        ndata[i] = '__label__n ' + jn['text'].lower()
+    pdata = ['__label__p ' + x.lower() for x in columnar.ColumnReader(pcolumns).strings('text')]
+    ndata = ['__label__n ' + x.lower() for x in columnar.ColumnReader(ncolumns).strings('text')]
 
     training_amt = int(len(ndata) * 9 / 10)
 
@@ -257,15 +262,23 @@ def prep_data_for_fasttext():
     print('Written a total of %s amount of data into %s' % ((len(ndata) - training_amt) * 2, fttesttxt))
 
 
+def wide_dataset(column, categorydict, imgdict, signed, label):
+    """
+    :return: list of (category, button class, button position on a 3 x 3 grid, label) of every record of a column store
+    """
+    states = list(column.strings('parent_activity_state'))
+    classes, bounds, parsed = btn_position.parse_names(list(column.strings('name')), signed)
+    dims = btn_position.screen_dimensions([state + '.png' for state in states], imgdict)
+    positions = btn_position.grid_3x3(bounds, parsed, dims)
+    return [(categorydict[state.split('-')[0]], btn_class if btn_class is not None else '', position, label)
+            for state, btn_class, position in zip(states, classes, positions)]
+
+
 def prep_data_for_wide():
     print('\nPreparing data for wide model...')
-    n_dataset_list = []
-    p_dataset_list = []
     categorydict = {}
     catfile = '../data/serverdata/category.txt'
     imgdimextfile = '../data/serverdata/img_dimension_extract.txt'
-    ndatafile = '../data/ndata.txt'
-    pdatafile = '../data/pdata.txt'
 
     print('\nParsing %s file.' % catfile)
     with open(catfile, 'r') as f:
@@ -276,62 +289,17 @@ def prep_data_for_wide():
         categorydict[isp[0]] = isp[1]
 
     print('\nParsing %s file.' % imgdimextfile)
-    with open(imgdimextfile, 'r') as f:
-        imgdims = [x.strip() for x in tqdm(f)]
-
-    imgdict = {}
+    imgdict = btn_position.read_img_dimensions(imgdimextfile)
 
-    for i in imgdims:
-        isplit = i.split('\t')
-        imgdict[isplit[0].split('/')[4]] = (isplit[1], isplit[2])
+    print('\nReading %s columns.' % ncolumns)
+    ncolumn = columnar.ColumnReader(ncolumns)
+    n_dataset_list = wide_dataset(ncolumn, categorydict, imgdict, True, 'negative')
 
-    print('\nParsing %s file.' % ndatafile)
-    with open(ndatafile, 'r') as f:
-        ndata = [x.strip() for x in tqdm(f)]
-
-    for i in ndata:
-        obj_loaded = json.loads(i)
-        packname = obj_loaded['parent_activity_state'].split('-')[0]
-        category = categorydict[packname]
-        try:
-            m = re.findall('{(.*?)}', obj_loaded['name'])
-            btn_class = m[0]
-            btn_location = m[2]
-            imgname = obj_loaded['parent_activity_state'] + '.png'
-            m = re.findall('\[(-?\d+),(-?\d+)\]', btn_location)
-            y = [sum(x) / len(x) for x in zip((int(z) for z in (m[0])), (int(zz) for zz in m[1]))]
-            positional_num = []
-            for i in range(len(y)):
-                positional_num.append(math.ceil(y[i] / int(imgdict[imgname][i]) * 3))
-            btn_positional_representation = str(positional_num[0] + 3 * (positional_num[1] - 1))
-        except Exception:
-            btn_positional_representation = '-1'
-        n_dataset_list.append((category, btn_class, btn_positional_representation, 'negative'))
+    print('\nReading %s columns.' % pcolumns)
+    pcolumn = columnar.ColumnReader(pcolumns)
+    p_dataset_list = wide_dataset(pcolumn, categorydict, imgdict, False, 'positive')
 
-    print('\nParsing %s file.' % pdatafile)
-    with open(pdatafile, 'r') as f:
-        pdata = [x.strip() for x in tqdm(f)]
-
-    for i in pdata:
-        obj_loaded = json.loads(i)
-        packname = obj_loaded['parent_activity_state'].split('-')[0]
-        category = categorydict[packname]
-        try:
-            m = re.findall('{(.*?)}', obj_loaded['name'])
-            btn_class = m[0]
-            btn_location = m[2]
-            imgname = obj_loaded['parent_activity_state'] + '.png'
-            m = re.findall('\[(\d+),(\d+)\]', btn_location)
-            y = [sum(x) / len(x) for x in zip((int(z) for z in (m[0])), (int(zz) for zz in m[1]))]
-            positional_num = []
-            for i in range(len(y)):
-                positional_num.append(math.ceil(y[i] / int(imgdict[imgname][i]) * 3))
-            btn_positional_representation = str(positional_num[0] + 3 * (positional_num[1] - 1))
-        except Exception:
-            btn_positional_representation = '-1'
-        p_dataset_list.append((category, btn_class, btn_positional_representation, 'positive'))
-
-    training_amt = int(len(ndata) * 9 / 10)
+    training_amt = int(len(ncolumn) * 9 / 10)
     random.shuffle(p_dataset_list)
     random.shuffle(n_dataset_list)
 
@@ -352,17 +320,25 @@ def prep_data_for_wide():
     print('Written a total of %s amount of data into %s' % ((len(n_dataset_list) - training_amt) * 2, wndtraintxt))
 
 
-def extract_and_combine_files():
+def extract_and_combine_files(workers=1):
+    """
+    :param workers: number of processes extracting the clickable files in parallel. Every file is extracted into its
+    own dataformatted file, and these are combined in file order, so the result does not depend on this.
+    """
     onlyfiles = [f for f in listdir(clickabledir) if isfile(join(clickabledir, f))]
     no_of_data = 0
     for i in onlyfiles:
         if re.match('^clickable\d+\.json$', i) is not None:
             no_of_data += 1
     print('Extracting and combining %d files...' % no_of_data)
-    for i in range(1, no_of_data + 1):
-        print('\nExtracting file %d' % i)
-        datafile = datadir + str(i) + '.json'
-        pre_process(i, datafile)
+    jobs = [(i, datadir + str(i) + '.json') for i in range(1, no_of_data + 1)]
+    if workers > 1:
+        with multiprocessing.Pool(min(workers, max(no_of_data, 1))) as pool:
+            pool.starmap(pre_process, jobs)
+    else:
+        for i, datafile in jobs:
+            print('\nExtracting file %d' % i)
+            pre_process(i, datafile)
     print('\nCombining files...')
     combine_dataformatted(no_of_data)
 
@@ -381,30 +357,34 @@ elif current_user == 'root':
     datadir = '/home/hongda/Document/UITestLearning/data/serverdata/clickable'
     clickabledir = '/home/hongda/Document/UITestLearning/data/serverdata'
 
-parser = argparse.ArgumentParser()
-parser.add_argument("method", metavar="method",
-                    choices=["e", "n", "d", "r", "f", "w", "en", "ed", "er", "enw", "enf", "edf", "edw", "erf", "erw",
-                             "nf", "nw", "df", "dw", "rf", "rw"],
-                    help="Method of parsing: [e: extract and combine files, n: Split data according to NST, d: Split "
-                         "data according to DST, r: Split data according to DST_R, f: Preparing the split data for "
-                         "fasttext, w: Preparing the split data for wide model.]")
-args = parser.parse_args()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("method", metavar="method",
+                        choices=["e", "n", "d", "r", "f", "w", "en", "ed", "er", "enw", "enf", "edf", "edw", "erf",
+                                 "erw", "nf", "nw", "df", "dw", "rf", "rw"],
+                        help="Method of parsing: [e: extract and combine files, n: Split data according to NST, "
+                             "d: Split data according to DST, r: Split data according to DST_R, f: Preparing the "
+                             "split data for fasttext, w: Preparing the split data for wide model.]")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes extracting the clickable files in parallel.")
+    args = parser.parse_args()
+
+    if 'e' in args.method:
+        extract_and_combine_files(args.workers)
 
-if 'e' in args.method:
     """ splitting dataset to positive and negative data """
-    extract_and_combine_files()
-elif 'n' in args.method:
-
-    split_to_pd(FEATURE.NST)
-elif 'd' in args.method:
-    split_to_pd(FEATURE.DST)
-elif 'r' in args.method:
-    split_to_pd(FEATURE.DST_RELAXED)
-    # get_info_on_text_pd()
-    # get_info_on_btn_distribution()
-
-    """ Preparing data for fasttext training and classification """
-if 'f' in sys.argv[1]:
-    prep_data_for_fasttext()
-elif 'w' in sys.argv[1]:
-    prep_data_for_wide()
+    if 'n' in args.method:
+
+        split_to_pd(FEATURE.NST)
+    elif 'd' in args.method:
+        split_to_pd(FEATURE.DST)
+    elif 'r' in args.method:
+        split_to_pd(FEATURE.DST_RELAXED)
+        # get_info_on_text_pd()
+        # get_info_on_btn_distribution()
+
+        """ Preparing data for fasttext training and classification """
+    if 'f' in args.method:
+        prep_data_for_fasttext()
+    elif 'w' in args.method:
+        prep_data_for_wide()
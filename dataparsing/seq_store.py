@@ -0,0 +1,161 @@
+"""
+Integer coded store of the action sequences, written by learning/generate_traintest.py and read by learning/widenrnn.py.
+
+The words of every step of every sequence are kept one after the other in a single flat array of word ids, with the
+offsets of every step into it and the offsets of every sequence into the steps. Every step also has the id of its label
+and of its wide features (category, button class, button position), or NO_BUTTON when the step was not a button. The
+n-gram windows are given by the steps they start at. The steps of a window are next to each other, so its words are a
+slice of the flat array and no window is ever copied until a batch of them is asked for.
+"""
+import json
+import os
+
+import numpy as np
+
+NO_BUTTON = -1
+
+
+def encode_column(values, vocab=None):
+    """
+    :param vocab: dict of value to id that new values are added to, in order of first appearance.
+    :return: (int32 array of ids, vocab)
+    """
+    vocab = {} if vocab is None else vocab
+    ids = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        ids[i] = vocab.setdefault(value, len(vocab))
+    return ids, vocab
+
+
+def vocab_list(vocab):
+    return [value for value, i in sorted(vocab.items(), key=lambda item: item[1])]
+
+
+class SeqStore(object):
+    def __init__(self, grams, tokens, step_offsets, sequence_offsets, labels, wide, starts, words, label_names,
+                 wide_names, window_words=None):
+        """
+        :param tokens: (words,) int32 word ids of every step, one step after the other
+        :param step_offsets: (steps + 1,) int64 offset of the first word of every step in tokens
+        :param sequence_offsets: (sequences + 1,) int64 first step of every sequence
+        :param labels: (steps,) int32 ids into label_names
+        :param wide: (steps, 3) int32 ids into the three lists of wide_names, NO_BUTTON where the step is no button
+        :param starts: (windows,) int64 step every window starts at
+        :param words: the word list. Words that are in no window may be left out of it, see build.
+        :param window_words: number of words at the start of words that are in a window, all of them by default
+        """
+        self.grams = grams
+        self.tokens = tokens
+        self.step_offsets = step_offsets
+        self.sequence_offsets = sequence_offsets
+        self.labels = labels
+        self.wide = wide
+        self.starts = starts
+        self.words = words
+        self.label_names = label_names
+        self.wide_names = wide_names
+        self.window_words = len(words) if window_words is None else window_words
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def ends(self):
+        """
+        Last step of every window, which the label and wide features of the window are taken from.
+        """
+        return self.starts + (self.grams - 1)
+
+    def window(self, i):
+        """
+        :return: read-only view of the word ids of the i-th window, the words of its steps one after the other.
+        """
+        start = self.starts[i]
+        return self.tokens[self.step_offsets[start]:self.step_offsets[start + self.grams]]
+
+    def window_tokens(self, windows, length, pad=0):
+        """
+        Words of the given windows, one row per window, with the words of its steps one after the other, cut or padded
+        with pad to length words.
+        :param windows: indices into starts
+        """
+        starts = self.starts[windows]
+        begin = np.asarray(self.step_offsets[starts])
+        end = np.asarray(self.step_offsets[starts + self.grams])
+        index = begin[:, None] + np.arange(length)
+        inside = index < end[:, None]
+        out = np.full((len(windows), length), pad, dtype=np.int32)
+        out[inside] = self.tokens[index[inside]]
+        return out
+
+    def set_wide(self, steps, reps):
+        """
+        :param steps: steps that are buttons
+        :param reps: (category, class, position) of each of these steps
+        """
+        for k in range(3):
+            vocab = {name: i for i, name in enumerate(self.wide_names[k])}
+            self.wide[steps, k] = encode_column([rep[k] for rep in reps], vocab)[0]
+            self.wide_names[k] = vocab_list(vocab)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump({'grams': self.grams, 'labels': self.label_names, 'wide': self.wide_names}, f)
+
+    @staticmethod
+    def load(directory, words, mmap_mode='r'):
+        """
+        :param words: the word list the token ids index into, as saved by generate_traintest.py.
+        """
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in ARRAYS]
+        return SeqStore(meta['grams'], *arrays, words=words, label_names=meta['labels'], wide_names=meta['wide'])
+
+
+# Arrays of a SeqStore in the order of its constructor, each saved as <name>.npy
+ARRAYS = ('tokens', 'step_offsets', 'sequence_offsets', 'labels', 'wide', 'starts')
+
+
+def build(sequences, labels, grams, skip_null_windows, null):
+    """
+    :param sequences: list of sequences of steps, every step either a token or a list of words
+    :param labels: list of the label of every step of every sequence
+    :param skip_null_windows: leave out the windows of which every step is null
+    :return: SeqStore with no wide features, see SeqStore.set_wide. The words that are in a window come first in the
+    word list, in order of first appearance, followed by those that are only in steps outside of every window, e.g. of
+    sequences shorter than grams. window_words is the number of the former.
+    """
+    steps = [step if isinstance(step, list) else [step] for sequence in sequences for step in sequence]
+    is_null = np.array([set(step) == {null} for step in steps], dtype=bool)
+
+    lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+    sequence_offsets = np.concatenate(([0], np.cumsum(lengths)))
+    starts = np.concatenate([np.arange(sequence_offsets[i], sequence_offsets[i + 1] - grams + 1, dtype=np.int64)
+                             for i in range(len(sequences)) if lengths[i] >= grams] or [np.zeros(0, dtype=np.int64)])
+    if skip_null_windows and len(starts):
+        null_count = np.concatenate(([0], np.cumsum(is_null)))
+        starts = starts[null_count[starts + grams] - null_count[starts] != grams]
+
+    # Steps that are in at least one window
+    cover = np.zeros(len(steps) + 1, dtype=np.int64)
+    np.add.at(cover, starts, 1)
+    np.add.at(cover, starts + grams, -1)
+    covered = np.cumsum(cover[:-1]) > 0
+
+    words = {}
+    for i in np.flatnonzero(covered):
+        for word in steps[i]:
+            words.setdefault(word, len(words))
+    window_words = len(words)
+    step_lengths = np.array([len(step) for step in steps], dtype=np.int64)
+    tokens, words = encode_column([word for step in steps for word in step], words)
+    step_offsets = np.concatenate(([0], np.cumsum(step_lengths)))
+
+    label_ids, label_vocab = encode_column([label for sequence in labels for label in sequence])
+    wide = np.full((len(steps), 3), NO_BUTTON, dtype=np.int32)
+    return SeqStore(grams, tokens, step_offsets, sequence_offsets, label_ids, wide, starts, vocab_list(words),
+                    vocab_list(label_vocab), [[], [], []], window_words)
@@ -1,11 +1,12 @@
 import codecs
-import math
 import re
 import sys
 import numpy as np
 from gensim.models import Word2Vec
 from tqdm import *
 
+from dataparsing import btn_position, seq_store
+
 dataset = []
 labeldataset = []
 widedataset = []
@@ -19,7 +20,6 @@ name_diff_line = False
 name_diff_temp = ''
 multi_line = False
 multi_line_temp = ''
-wordList = set()
 treat_as_individual_word = False
 treat_all_null_as_invalid = False
 suffix = ''
@@ -29,7 +29,6 @@ imgdimextfile = '../data/serverdata/img_dimension_extract.txt'
 seq_combi_wnd = '../data/serverdata/sequence_combination_wnd.txt'
 
 categorydict = {}
-imgdict = {}
 
 try:
     grams = int(sys.argv[1])
@@ -66,12 +65,7 @@ for i in categoryinput:
     categorydict[isp[0]] = isp[1]
 
 print('Parsing %s file.' % imgdimextfile)
-with open(imgdimextfile, 'r') as f:
-    imgdims = [x.strip() for x in f]
-
-for i in imgdims:
-    isplit = i.split('\t')
-    imgdict[isplit[0].split('/')[4]] = (isplit[1], isplit[2])
+imgdict = btn_position.read_img_dimensions(imgdimextfile)
 
 pdict = {}
 ndict = {}
@@ -190,90 +184,34 @@ else:
             else:
                 dataset[i][x] = dataset[i][x].lower()
 
-newdata = []
-newlabel = []
-newwide = []
+print('Encoding sequences...')
+store = seq_store.build(dataset, labeldataset, grams, treat_all_null_as_invalid, '~!@#null#@!~')
+ends = store.ends
+sequence_offsets = store.sequence_offsets
+widesteps = [step for sequence in widedataset for step in sequence]
+labelsteps = [label for sequence in labeldataset for label in sequence]
 
-print('Parsing into new lists...')
-for i in tqdm(range(len(dataset))):
-    if len(dataset[i]) >= grams:
-        for j in range(len(dataset[i]) - grams + 1):
-            if treat_all_null_as_invalid:
-                checkset = set()
-                for item in dataset[i][j:j + grams]:
-                    if type(item) == list:
-                        for itema in item:
-                            checkset.add(itema)
-                    else:
-                        checkset.add(item)
-                if len(checkset) == 1 and list(checkset)[0] == '~!@#null#@!~':
-                    continue
-            newdata.append(dataset[i][j:j + grams])
-            newlabel.append(labeldataset[i][j + grams - 1])
-            newwide.append(widedataset[i][j + grams - 1])
+print('Number of windows: %d' % len(store))
 
-print('Number of newdata: %d' % len(newdata))
-print('Number of newlabel: %d' % len(newlabel))
-print('Number of newwide: %d' % len(newwide))
+print('Computing button positions...')
+buttons = sorted(set(int(i) for i in ends if len(widesteps[i]) == 2))
+states = [widesteps[i][0] for i in buttons]
+btn_classes, bounds, parsed = btn_position.parse_names([repr(widesteps[i][1]) for i in buttons])
+dims = btn_position.screen_dimensions([state + '.png' for state in states], imgdict)
+positions = btn_position.grid_by_screen(bounds, parsed, dims)
+reps = {}
+for j, i in enumerate(buttons):
+    reps[i] = (categorydict[states[j].split('-')[0]], btn_classes[j], positions[j])
+store.set_wide(buttons, [reps[i] for i in buttons])
+store.save('../data/seqstore' + str(grams) + suffix)
 
 with codecs.open('../data/datawide-gram' + str(grams) + suffix + '.txt', 'w', 'utf-8') as f:
-    for i in tqdm(range(len(newwide))):
-        statetuple = newwide[i]
-        if len(statetuple) == 2:
-            packname = statetuple[0].split('-')[0]
-            category = categorydict[packname]
-            imgname = statetuple[0] + '.png'
-            m1 = re.findall('{(.*?)}', repr(statetuple[1]))
-            assert len(m1) > 1
-            btn_class = m1[0]
-            btn_location = m1[2]
-            m2 = re.findall('\[(-?\d+),(-?\d+)\]', btn_location)
-            y = [sum(x) / len(x) for x in zip((int(z) for z in (m2[0])), (int(zz) for zz in m2[1]))]
-            positional_num = []
-            vError = False
-            kError = False
-            if imgname not in imgdict:
-                kError = True
-            if not kError:
-                if imgdict[imgname][0] == 'err':
-                    vError = True
-                    btn_positional_representation = '-1'
-
-                if not vError:
-                    for i in range(len(y)):
-                        if y[i] > int(imgdict[imgname][i]):
-                            btn_positional_representation = '-1'
-                            vError = True
-                if not vError:
-                    if int(imgdict[imgname][0]) == 480 and int(imgdict[imgname][1]) == 800:
-                        positional_num.append(math.ceil(y[0] / int(imgdict[imgname][0]) * 3))
-                        positional_num.append(math.ceil(y[1] / int(imgdict[imgname][1]) * 5))
-                        btn_positional_representation = str(positional_num[0] + 3 * (positional_num[1] - 1))
-                    elif int(imgdict[imgname][0]) == 800 and int(imgdict[imgname][1]) == 480:
-                        positional_num.append(math.ceil(y[0] / int(imgdict[imgname][0]) * 5))
-                        positional_num.append(math.ceil(y[1] / int(imgdict[imgname][1]) * 3))
-                        btn_positional_representation = str(positional_num[0] + 3 * (positional_num[1] - 1))
-                    else:
-                        for i in range(len(y)):
-                            positional_num.append(math.ceil(y[i] / int(imgdict[imgname][i]) * 3))
-                        btn_positional_representation = 'E' + str(positional_num[0] + 3 * (positional_num[1] - 1))
-                    try:
-                        if 'E' not in btn_positional_representation:
-                            assert 15 >= int(btn_positional_representation) >= 1
-                        else:
-                            assert 9 >= int(btn_positional_representation[1:]) >= 1
-                    except AssertionError:
-                        btn_positional_representation = '-1'
-            else:
-                btn_positional_representation = '-1'
-            rep = (category, btn_class, btn_positional_representation)
-        else:
-            rep = None
-
+    for i in tqdm(ends):
+        rep = reps.get(int(i))
         if rep is None:
             f.write('NA')
         else:
-            f.write(newlabel[i] + ':::')
+            f.write(labelsteps[i] + ':::')
             try:
                 f.write('\t'.join(rep))
             except TypeError:
@@ -282,25 +220,22 @@ with codecs.open('../data/datawide-gram' + str(grams) + suffix + '.txt', 'w', 'u
         f.write('\n')
 
 with codecs.open('../data/dataseq-gram' + str(grams) + suffix + '.txt', 'w', 'utf-8') as f:
-    for i in range(len(newdata)):
-        f.write(newlabel[i] + ':::')
+    for start in store.starts:
+        i = int(np.searchsorted(sequence_offsets, start, side='right')) - 1
+        j = int(start - sequence_offsets[i])
+        f.write(labeldataset[i][j + grams - 1] + ':::')
         if treat_as_individual_word:
             tempsection = []
-            for section in newdata[i]:
+            for section in dataset[i][j:j + grams]:
                 if type(section) == list:
                     for word in section:
                         tempsection.append(word)
                 else:
                     tempsection.append(section)
             f.write('\t'.join(tempsection))
-            f.write('\n')
-            for word in tempsection:
-                wordList.add(word)
         else:
-            f.write('\t'.join(newdata[i]))
-            f.write('\n')
-            for word in newdata[i]:
-                wordList.add(word)
+            f.write('\t'.join(dataset[i][j:j + grams]))
+        f.write('\n')
 
 flattened_dataset = []
 for sentence in dataset:
@@ -318,8 +253,9 @@ model = Word2Vec(flattened_dataset, min_count=1, size=50)
 words = list(model.wv.vocab)
 model.save('../data/model' + str(grams) + suffix + '.bin')
 new_model = Word2Vec.load('../data/model' + str(grams) + suffix + '.bin')
+# Only the words of the windows written out, as before. The token ids of the windows all index into these.
+wordList = store.words[:store.window_words]
 wordVector = np.zeros((len(wordList), 50), dtype='float32')
-wordList = list(wordList)
 for i in range(len(wordList)):
     wordVector[i][:] = model.wv[wordList[i]]
 
@@ -1,10 +1,14 @@
 import argparse
 import codecs
-import random
+import json
+import math
+import os
 import numpy as np
 import tensorflow as tf
 from tqdm import *
 
+from dataparsing import array_cache, encoder, seq_store
+
 parser = argparse.ArgumentParser()
 parser.add_argument("lmethod", choices=["w", "d", "wnd"], metavar="learning_method", help="Select the learning method ")
 parser.add_argument("grams", type=int, nargs="?", help="n-grams")
@@ -12,6 +16,10 @@ parser.add_argument("iwin", choices=["00", "01", "10", "11"], metavar="iwin", na
                     help="Set Individual Word (IW) and Invalid Null (IN).")
 parser.add_argument("-b", "--batch_size", type=int, default=24, help="Batch size for the training model.")
 parser.add_argument("-e", "--epoch", type=int, help="Number of training epochs.")
+parser.add_argument("--shards", type=int, default=8, help="Number of TFRecord files the data is written into.")
+parser.add_argument("--parallel_calls", type=int, default=4, help="Number of records parsed in parallel.")
+parser.add_argument("--shuffle_buffer", type=int, default=10000, help="Number of records shuffled at a time.")
+parser.add_argument("--export", help="Save the trained weights into this .npz file, to be used by crawler/Scorer.py.")
 args = parser.parse_args()
 
 if 'd' in args.lmethod and args.iwin is None:
@@ -52,6 +60,9 @@ btnclass = ['ViewPager', 'ViewAnimator', 'RelativeLayout', 'ActionBar$Tab', 'Hor
             'CheckedTextView', 'View', 'e', 'RatingBar', 'NA']
 position = ['-1', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15']
 
+# Category and position have to be known. Button classes that are not listed are taken as 'NA'.
+wide_vocab = [encoder.Vocabulary(category), encoder.Vocabulary(btnclass, unknown='NA'), encoder.Vocabulary(position)]
+
 lstmUnits = 64
 numDimensions = 50
 batch_size = args.batch_size
@@ -61,38 +72,83 @@ wSeqLength = 3
 
 wordVector = np.load('../data/wordVector' + str(grams) + suffix + '.npy')
 
-"""Populating model"""
 
-print('\nPopulating sequence and label...')
-try:
-    wids = np.load('../data/widslabel' + str(grams) + suffix + '.npy')
-    wlabellist = np.load('../data/wlabellist' + str(grams) + suffix + '.npy')
-    dlabellist = np.load('../data/dlabellist' + str(grams) + suffix + '.npy')
-    dids = np.load('../data/didslabel' + str(grams) + suffix + '.npy')
-    # assert len(wids) * 24 == len(dlabellist) == len(dids) * 24
-except FileNotFoundError:
-    wids = []
-    wlabellist = []
-    dids = []
-    dlabellist = []
-
-if len(wids) == 0:
-    ''' Populate the model and save it into .npy file for faster learning in the future. '''
-    print('Loading model and saving it into .npy files...')
-    data = []
-    wordList = np.load('../data/wordList' + str(grams) + suffix + '.npy')
+def write_records(prefix, wide_arr, deep_arr, wlabel_arr, dlabel_arr, shards):
+    """
+    Writes the rows round robin into shards TFRecord files named prefix-<shard>.tfrecord
+    """
+    writers = [tf.python_io.TFRecordWriter('%s-%05d.tfrecord' % (prefix, i)) for i in range(shards)]
+    for i in tqdm(range(len(wide_arr))):
+        example = tf.train.Example(features=tf.train.Features(feature={
+            'wide': tf.train.Feature(int64_list=tf.train.Int64List(value=wide_arr[i].tolist())),
+            'deep': tf.train.Feature(int64_list=tf.train.Int64List(value=deep_arr[i].tolist())),
+            'wlabel': tf.train.Feature(float_list=tf.train.FloatList(value=wlabel_arr[i].tolist())),
+            'dlabel': tf.train.Feature(float_list=tf.train.FloatList(value=dlabel_arr[i].tolist()))}))
+        writers[i % shards].write(example.SerializeToString())
+    for writer in writers:
+        writer.close()
+
+
+def parse_record(record):
+    features = tf.parse_single_example(record, {
+        'wide': tf.FixedLenFeature([wSeqLength], tf.int64),
+        'deep': tf.FixedLenFeature([dSeqLength], tf.int64),
+        'wlabel': tf.FixedLenFeature([2], tf.float32),
+        'dlabel': tf.FixedLenFeature([2], tf.float32)})
+    return (tf.cast(features['wide'], tf.float32), tf.cast(features['deep'], tf.int32), features['wlabel'],
+            features['dlabel'])
+
+
+def input_pipeline(prefix, training):
+    """
+    Reads the shards written by write_records in parallel, and batches them with batch_size. The training data is
+    shuffled and repeated for training_epochs.
+    """
+    files = tf.data.Dataset.list_files(prefix + '-*.tfrecord')
+    dataset = files.interleave(tf.data.TFRecordDataset, cycle_length=args.shards)
+    dataset = dataset.map(parse_record, num_parallel_calls=args.parallel_calls)
+    if training:
+        dataset = dataset.shuffle(args.shuffle_buffer).repeat(training_epochs)
+    return dataset.batch(batch_size).prefetch(1)
+
+
+def populate(wordlist_file, store_dir, datawide_file, dataseq_file):
+    """
+    Reads the rows of which the last action is a positive or negative button, from the sequence store if there is one
+    and from the text files otherwise.
+    :return: dict of the wide, deep, wlabel and dlabel arrays
+    """
+    wordList = np.load(wordlist_file)
     wordList = wordList.tolist()
-    with codecs.open('../data/datawide-gram' + str(grams) + suffix + '.txt', 'r', 'utf-8') as f:
+    if os.path.isdir(store_dir):
+        print('Reading sequence store %s.' % store_dir)
+        store = seq_store.SeqStore.load(store_dir, wordList)
+        ends = store.ends
+        label_ids = np.asarray(store.labels)[ends]
+        label_of = {name: i for i, name in enumerate(store.label_names)}
+        positive = label_ids == label_of.get('positive', -2)
+        negative = label_ids == label_of.get('negative', -2)
+        # Windows that do not end with a button, or whose label is neither positive nor negative, are left out
+        windows = np.flatnonzero((np.asarray(store.wide)[ends, 0] != seq_store.NO_BUTTON) & (positive | negative))
+
+        wide_ends = np.asarray(store.wide)[ends[windows]]
+        wide_arr = np.stack([wide_vocab[k].translate(store.wide_names[k], wide_ends[:, k])
+                             for k in range(wSeqLength)], axis=1)
+        deep_arr = store.window_tokens(windows, dSeqLength)
+        wlabel_arr = dlabel_arr = np.where(positive[windows][:, None], [1, 0], [0, 1])
+        return {'wide': wide_arr, 'deep': deep_arr, 'wlabel': wlabel_arr, 'dlabel': dlabel_arr}
+
+    with codecs.open(datawide_file, 'r', 'utf-8') as f:
         wlines = [x.strip() for x in f.readlines()]
-    with codecs.open('../data/dataseq-gram' + str(grams) + suffix + '.txt', 'r', 'utf-8') as f:
+    with codecs.open(dataseq_file, 'r', 'utf-8') as f:
         dlines = [x.strip('\n') for x in f.readlines()]
 
-    wbatch_ids = np.zeros((batch_size, wSeqLength), dtype='int32')
-    dnp_arr = np.zeros([batch_size, dSeqLength])
-    fileCounter = 0
-
     assert len(wlines) == len(dlines)
 
+    wide_rows = []
+    deep_rows = []
+    wlabels = []
+    dlabels = []
     for no in tqdm(range(len(wlines))):
         # If wlsplit is None, means action in sequence ends with not a button (can be a random button, or close)
         wlsplit = wlines[no].split(':::', 1)
@@ -100,124 +156,139 @@ if len(wids) == 0:
 
         if len(wlsplit) == 1:
             continue
-        else:
-            ssplit = wlsplit[1].split('\t')
-            assert len(ssplit) == 3
-            try:
-                if len(dlsplit) == 2:
-                    if dlsplit[0] == 'positive':
-                        dlabellist.append([1, 0])
-                    elif dlsplit[0] == 'negative':
-                        dlabellist.append([0, 1])
-                    else:
-                        if no + 24 > len(wlines):
-                            break
-                        continue
-                else:
-                    print(dlsplit)
-                    exit(1)
-
-                wbatch_ids[fileCounter][0] = category.index(ssplit[0])
-                try:
-                    wbatch_ids[fileCounter][1] = btnclass.index(ssplit[1])
-                except Exception:
-                    wbatch_ids[fileCounter][1] = btnclass.index('NA')
-                wbatch_ids[fileCounter][2] = position.index(ssplit[2])
-
-                displit = dlsplit[1].split('\t')
-                dindexCounter = 0
-                for section in displit:
-                    dnp_arr[fileCounter][dindexCounter] = wordList.index(section)
-                    dindexCounter += 1
-                    if dindexCounter >= dSeqLength:
-                        break
-                if wlsplit[0] == 'positive':
-                    wlabellist.append([1,0])
-                elif wlsplit[0] == 'negative':
-                    wlabellist.append([0,1])
-                else:
-                    wlabellist.append([1,1])
-                fileCounter += 1
-            except ValueError as e:
-                print(e)
-                exit(1)
-
-        if fileCounter >= batch_size:
-            wids.append(wbatch_ids)
-            dids.append(dnp_arr)
-            fileCounter = 0
-            wbatch_ids = np.zeros((batch_size, wSeqLength), dtype='int32')
-            dnp_arr = np.zeros([batch_size, dSeqLength])
-            try:
-                assert len(dlabellist) == len(dids) * 24 == len(wids) * 24 == len(wlabellist)
-            except Exception as e:
-                print(e)
-                print(len(wids) * 24)
-                print(len(wlabellist))
-                print(len(dids) * 24)
-                print(len(dlabellist))
-                exit(1)
-
-            if no + 24 > len(wlines):
-                break
-
-    np.save('../data/widslabel' + str(grams) + suffix, wids)
-    np.save('../data/wlabellist' + str(grams) + suffix, dlabellist)
-    np.save('../data/didslabel' + str(grams) + suffix, dids)
-    np.save('../data/dlabellist' + str(grams) + suffix, dlabellist)
-    """End populating model"""
+        ssplit = wlsplit[1].split('\t')
+        assert len(ssplit) == 3
+        if len(dlsplit) != 2:
+            print(dlsplit)
+            exit(1)
+        if dlsplit[0] != 'positive' and dlsplit[0] != 'negative':
+            continue
+        wide_rows.append(ssplit)
+        deep_rows.append(dlsplit[1].split('\t'))
+        wlabels.append(wlsplit[0])
+        dlabels.append(dlsplit[0])
+
+    count = len(dlabels)
+    wide_arr = np.stack([wide_vocab[k].encode([row[k] for row in wide_rows])
+                         for k in range(wSeqLength)], axis=1).reshape(count, wSeqLength)
+    deep_arr = encoder.Vocabulary(wordList).encode_rows(deep_rows, dSeqLength)
+    label_codes = {'positive': [1, 0], 'negative': [0, 1]}
+    wlabel_arr = np.array([label_codes.get(x, [1, 1]) for x in wlabels]).reshape(count, 2)
+    dlabel_arr = np.array([label_codes[x] for x in dlabels]).reshape(count, 2)
+    return {'wide': wide_arr, 'deep': deep_arr, 'wlabel': wlabel_arr, 'dlabel': dlabel_arr}
+
+
+def lstm_variables():
+    """
+    :return: kernel and bias of the BasicLSTMCell, which are created inside dynamic_rnn
+    """
+    lstm_vars = {}
+    for v in tf.trainable_variables():
+        if 'lstm_cell' in v.name:
+            lstm_vars['lstm_kernel' if v.name.endswith('kernel:0') else 'lstm_bias'] = v
+    return lstm_vars
+
+
+def export_model(sess, filename):
+    """
+    Saves the weights of the trained model with numpy, together with the vocabularies and word vectors, so that
+    crawler/Scorer.py computes the same predictions without Tensorflow.
+    """
+    weights = sess.run(export_vars)
+    np.savez(filename, method=learning_method, grams=grams, individual_word=treat_as_individual_word,
+             seq_length=dSeqLength, category=np.array(category), btnclass=np.array(btnclass),
+             position=np.array(position), word_list=np.load(wordlist_file), word_vector=wordVector, **weights)
+    print('Exported model to %s' % filename)
 
-no_train_data_batch = int(len(wids) * 9 / 10)
-no_test_data_batch = len(wids) - no_train_data_batch
 
-train_wids = wids[:no_train_data_batch]
-test_wids = wids[no_train_data_batch:]
-train_dids = dids[:no_train_data_batch]
-test_dids = dids[no_train_data_batch:]
+"""Populating model"""
 
-if learning_method == 'w':
-    train_labels = wlabellist[:no_train_data_batch * 24]
-    test_labels = wlabellist[no_train_data_batch * 24:]
+print('\nPopulating sequence and label...')
+wordlist_file = '../data/wordList' + str(grams) + suffix + '.npy'
+store_dir = '../data/seqstore' + str(grams) + suffix
+datawide_file = '../data/datawide-gram' + str(grams) + suffix + '.txt'
+dataseq_file = '../data/dataseq-gram' + str(grams) + suffix + '.txt'
+
+# The arrays are cached under a hash of everything they are computed from, so that changing the data, the vocabularies
+# or the encoding computes them again
+inputs = [wordlist_file, store_dir] if os.path.isdir(store_dir) else [wordlist_file, datawide_file, dataseq_file]
+params = {'version': 1, 'grams': grams, 'iw': treat_as_individual_word, 'in': treat_all_null_as_invalid,
+          'dSeqLength': dSeqLength, 'category': category, 'btnclass': btnclass, 'position': position}
+cache = array_cache.ArrayCache('../data/cache', array_cache.cache_key(inputs, params))
+
+if cache.exists():
+    print('Cache hit: %s' % cache.path)
 else:
-    train_labels = dlabellist[:no_train_data_batch * 24]
-    test_labels = dlabellist[no_train_data_batch * 24:]
+    print('Cache miss: %s, populating the model...' % cache.path)
+    try:
+        arrays = populate(wordlist_file, store_dir, datawide_file, dataseq_file)
+    except ValueError as e:
+        print(e)
+        exit(1)
+    cache.save(arrays, params)
+
+record_dir = cache.subdir('tfrecord' + str(args.shards))
+record_meta = os.path.join(record_dir, 'meta.json')
+
+if not os.path.isfile(record_meta):
+    ''' Save the cached arrays into TFRecord shards for faster learning in the future. '''
+    print('Saving the arrays into TFRecord shards...')
+    arrays = cache.load()
+    wide_arr, deep_arr, wlabel_arr, dlabel_arr = arrays['wide'], arrays['deep'], arrays['wlabel'], arrays['dlabel']
+
+    # The first 9/10 of the data is used for training, the rest for testing
+    os.makedirs(record_dir, exist_ok=True)
+    no_train_data = int(len(wide_arr) * 9 / 10)
+    write_records(os.path.join(record_dir, 'train'), wide_arr[:no_train_data], deep_arr[:no_train_data],
+                  wlabel_arr[:no_train_data], dlabel_arr[:no_train_data], args.shards)
+    write_records(os.path.join(record_dir, 'test'), wide_arr[no_train_data:], deep_arr[no_train_data:],
+                  wlabel_arr[no_train_data:], dlabel_arr[no_train_data:], args.shards)
+    with open(record_meta, 'w') as f:
+        json.dump({'train': no_train_data, 'test': len(wide_arr) - no_train_data}, f)
+    """End populating model"""
 
-combination_train = []
-for i in range(len(train_wids)):
-    combination_train.append((train_wids[i], train_dids[i], train_labels[i * 24:(i + 1) * 24]))
+with open(record_meta) as f:
+    record_count = json.load(f)
+no_train_data_batch = int(math.ceil(record_count['train'] / batch_size))
+no_test_data_batch = int(math.ceil(record_count['test'] / batch_size))
 
-print('Number of training data batch: %d.' % no_train_data_batch)
-print('Number of test data batch: %d.' % no_test_data_batch)
-print('Length of wide ids: %s' % len(wids))
-print('Length of wide labels: %s' % len(wlabellist))
-print('Length of deep ids: %s' % len(dids))
-print('Length of deep labels: %s' % len(dlabellist))
+print('Number of training data: %d in %d batches.' % (record_count['train'], no_train_data_batch))
+print('Number of test data: %d in %d batches.' % (record_count['test'], no_test_data_batch))
 
 tf.reset_default_graph()
 
 print('Undergoing %s model training.' % learning_method)
 
+if args.epoch is not None:
+    training_epochs = args.epoch
+else:
+    training_epochs = 5 if learning_method == 'w' else 1
+
+train_dataset = input_pipeline(os.path.join(record_dir, 'train'), True)
+test_dataset = input_pipeline(os.path.join(record_dir, 'test'), False)
+# The same graph reads either dataset, depending on the handle it is run with
+handle = tf.placeholder(tf.string, shape=[])
+iterator = tf.data.Iterator.from_string_handle(handle, train_dataset.output_types, train_dataset.output_shapes)
+wide_input, deep_input, wide_label, deep_label = iterator.get_next()
+train_iterator = train_dataset.make_one_shot_iterator()
+test_iterator = test_dataset.make_one_shot_iterator()
+
 if learning_method == 'w':
     ''' Wide model '''
     learning_rate = 0.1
-    training_epochs = 5 if args.epoch is None else args.epoch
-    wide_input = tf.placeholder(tf.float32, [None, 3])
-    wide_label = tf.placeholder(tf.float32, [None, 2])
     W = tf.Variable(tf.zeros([3, 2]))
     b = tf.Variable(tf.zeros([2]))
     wide_pred = (tf.matmul(wide_input, W) + b)
 
     cost = tf.nn.softmax_cross_entropy_with_logits_v2(logits=wide_pred, labels=wide_label)
     optimizer = tf.train.GradientDescentOptimizer(learning_rate).minimize(cost)
+    export_vars = {'wide_W': W, 'wide_b': b}
 
 if learning_method == 'd':
     ''' Deep model '''
     learning_rate = None
-    training_epochs = 1 if args.epoch is None else args.epoch
-    deep_label = tf.placeholder(tf.float32, [None, 2])
-    deep_input = tf.placeholder(tf.int32, [None, dSeqLength])
 
-    data = tf.Variable(tf.zeros([batch_size, dSeqLength, numDimensions]), dtype=tf.float32)  # (24x[grams*3]x150)
+    data = tf.Variable(tf.zeros([batch_size, dSeqLength, numDimensions]), dtype=tf.float32)  # (batch_size x [grams*3] x 50)
     data = tf.nn.embedding_lookup(wordVector, deep_input)
 
     lstmCell = tf.contrib.rnn.BasicLSTMCell(lstmUnits)
@@ -232,21 +303,17 @@ if learning_method == 'd':
 
     loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits_v2(logits=deep_pred, labels=deep_label))
     optimizer = tf.train.AdamOptimizer().minimize(loss)
+    export_vars = dict(lstm_variables(), deep_W=weight, deep_b=bias)
 
 if learning_method == 'wnd':
     ''' Wide and Deep model '''
     learning_rate = None
-    training_epochs = 1 if args.epoch is None else args.epoch
     intermediate_size = 2
 
-    wide_input = tf.placeholder(tf.float32, [None, 3])
     W = tf.Variable(tf.zeros([3, intermediate_size]))
     b = tf.Variable(tf.constant(0.1, shape=[intermediate_size]))
     wide_pred = tf.nn.relu(tf.matmul(wide_input, W) + b)
 
-    deep_label = tf.placeholder(tf.float32, [None, 2])
-    deep_input = tf.placeholder(tf.int32, [None, dSeqLength])
-
     data = tf.Variable(tf.zeros([batch_size, dSeqLength, numDimensions]), dtype=tf.float32)
     data = tf.nn.embedding_lookup(wordVector, deep_input)
 
@@ -271,57 +338,44 @@ if learning_method == 'wnd':
 
     loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits_v2(logits=new_prediction, labels=deep_label))
     optimizer = tf.train.AdamOptimizer().minimize(loss)
+    export_vars = dict(lstm_variables(), wide_W=W, wide_b=b, deep_W=weight, deep_b=bias, out_W=w1, out_b=b1)
+
+if learning_method == 'w':
+    prediction, label = wide_pred, wide_label
+elif learning_method == 'd':
+    prediction, label = deep_pred, deep_label
+else:
+    prediction, label = test_new_prediction, deep_label
+correct_count = tf.reduce_sum(tf.cast(tf.equal(tf.argmax(prediction, 1), tf.argmax(label, 1)), tf.float32))
+data_count = tf.shape(label)[0]
 
 init = tf.global_variables_initializer()
 
 with tf.Session() as sess:
     sess.run(init)
-    training_result = []
-
-    if learning_method == 'w':
-        for epoch in range(training_epochs):
-            for i in tqdm(range(no_train_data_batch)):
-                train_wide_input, train_deep_input, train_label = random.choice(combination_train)
-                sess.run(optimizer, feed_dict={wide_input: train_wide_input, wide_label: train_label})
-        correct_prediction = tf.equal(tf.argmax(wide_pred, 1), tf.argmax(wide_label, 1))
-        accuracy = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
-        for i in tqdm(range(no_test_data_batch)):
-            test_label = test_labels[i * 24: (i + 1) * 24]
-            test_wide_input = test_wids[i]
-            result = sess.run(accuracy, feed_dict={wide_input: test_wide_input, wide_label: test_label})
-            training_result.append(result)
-
-    elif learning_method == 'd':
-        for epoch in range(training_epochs):
-            for i in tqdm(range(no_train_data_batch)):
-                train_wide_input, train_deep_input, train_label = random.choice(combination_train)
-                sess.run(optimizer, feed_dict={deep_input: train_deep_input, deep_label: train_label})
-        correct_prediction = tf.equal(tf.argmax(deep_pred, 1), tf.argmax(deep_label, 1))
-        accuracy = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
-        for i in tqdm(range(no_test_data_batch)):
-            test_label = test_labels[i * 24: (i + 1) * 24]
-            test_deep_input = test_dids[i]
-            result = sess.run(accuracy, feed_dict={deep_input: test_deep_input, deep_label: test_label})
-            training_result.append(result)
-
-    elif learning_method == 'wnd':
-        for epoch in range(training_epochs):
-            for i in tqdm(range(no_train_data_batch)):
-                train_wide_input, train_deep_input, train_label = random.choice(combination_train)
-                sess.run(optimizer, feed_dict={wide_input: train_wide_input, deep_input: train_deep_input,
-                                               deep_label: train_label})
-        correct_prediction = tf.equal(tf.argmax(test_new_prediction, 1), tf.argmax(deep_label, 1))
-        accuracy = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
-        for i in tqdm(range(no_test_data_batch)):
-            test_label = test_labels[i * 24: (i + 1) * 24]
-            test_wide_input = test_wids[i]
-            test_deep_input = test_dids[i]
-            result = sess.run(accuracy,
-                              feed_dict={wide_input: test_wide_input, deep_input: test_deep_input,
-                                         deep_label: test_label})
-            training_result.append(result)
-
-    final_acc = sum(training_result) / len(training_result)
+    train_handle, test_handle = sess.run([train_iterator.string_handle(), test_iterator.string_handle()])
+
+    with tqdm(total=no_train_data_batch * training_epochs) as progress:
+        while True:
+            try:
+                sess.run(optimizer, feed_dict={handle: train_handle})
+            except tf.errors.OutOfRangeError:
+                break
+            progress.update()
+
+    total_correct = 0
+    total_data = 0
+    with tqdm(total=no_test_data_batch) as progress:
+        while True:
+            try:
+                correct, count = sess.run([correct_count, data_count], feed_dict={handle: test_handle})
+            except tf.errors.OutOfRangeError:
+                break
+            total_correct += correct
+            total_data += count
+            progress.update()
+
+    final_acc = total_correct / total_data
     print('Final accuracy: %f ' % final_acc)
 
     with open('./tstresult.txt', 'a') as f:
@@ -330,3 +384,6 @@ with tf.Session() as sess:
             'learning_rate: %s, batch_size: %s, epochs: %d using %s model \n' % (
                 final_acc, grams, treat_as_individual_word, treat_all_null_as_invalid, no_train_data_batch,
                 no_test_data_batch, learning_rate, batch_size, training_epochs, learning_method))
+
+    if args.export:
+        export_model(sess, args.export)
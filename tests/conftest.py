@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Config reads the SDK location when it is imported, but none of the tests talk to a device
+os.environ.setdefault('ANDROID_HOME', '/tmp/android-sdk')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+
+from dataparsing import array_cache
+
+PARAMS = {'grams': 3, 'lengths': [20, 30], 'method': 'wnd'}
+
+
+def write(path, content):
+    with open(str(path), 'w') as f:
+        f.write(content)
+    return str(path)
+
+
+def inputs(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    write(data / 'train.txt', 'positive 1 2 3\n')
+    write(data / 'test.txt', 'negative 4 5\n')
+    return [write(tmp_path / 'wordlist.txt', 'sign\nin\n'), str(data)]
+
+
+def test_key_is_stable(tmp_path):
+    paths = inputs(tmp_path)
+    key = array_cache.cache_key(paths, PARAMS)
+    assert array_cache.cache_key(paths, dict(reversed(list(PARAMS.items())))) == key
+    # Touching a file without changing it keeps the key
+    os.utime(paths[0], (0, 0))
+    assert array_cache.cache_key(paths, PARAMS) == key
+
+
+def test_key_follows_file_contents(tmp_path):
+    paths = inputs(tmp_path)
+    key = array_cache.cache_key(paths, PARAMS)
+    write(paths[0], 'sign\nout\n')
+    changed = array_cache.cache_key(paths, PARAMS)
+    assert changed != key
+    write(paths[0], 'sign\nin\n')
+    assert array_cache.cache_key(paths, PARAMS) == key
+
+
+def test_key_follows_folder_contents(tmp_path):
+    paths = inputs(tmp_path)
+    key = array_cache.cache_key(paths, PARAMS)
+    write(os.path.join(paths[1], 'test.txt'), 'positive 4 5\n')
+    edited = array_cache.cache_key(paths, PARAMS)
+    assert edited != key
+    write(os.path.join(paths[1], 'extra.txt'), '')
+    assert array_cache.cache_key(paths, PARAMS) not in (key, edited)
+
+
+def test_key_follows_renamed_and_missing_inputs(tmp_path):
+    paths = inputs(tmp_path)
+    key = array_cache.cache_key(paths, PARAMS)
+    os.rename(os.path.join(paths[1], 'test.txt'), os.path.join(paths[1], 'valid.txt'))
+    renamed = array_cache.cache_key(paths, PARAMS)
+    assert renamed != key
+    os.remove(paths[0])
+    assert array_cache.cache_key(paths, PARAMS) not in (key, renamed)
+
+
+def test_key_follows_params(tmp_path):
+    paths = inputs(tmp_path)
+    key = array_cache.cache_key(paths, PARAMS)
+    for name, value in [('grams', 4), ('lengths', [30, 20]), ('method', 'w'), ('extra', None)]:
+        params = dict(PARAMS)
+        params[name] = value
+        assert array_cache.cache_key(paths, params) != key
+
+
+def test_entries_round_trip(tmp_path):
+    cache = array_cache.ArrayCache(str(tmp_path), array_cache.cache_key([], PARAMS))
+    assert not cache.exists()
+    arrays = {'ids': np.arange(12, dtype=np.int32).reshape(3, 4), 'labels': np.array([1, 0, 1], dtype=np.int8)}
+    cache.save(arrays, PARAMS)
+    assert cache.exists()
+    loaded = cache.load()
+    assert sorted(loaded) == ['ids', 'labels']
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        assert np.array_equal(loaded[name], array)
+    assert not os.path.exists(cache.path + '.tmp')
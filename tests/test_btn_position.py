@@ -0,0 +1,112 @@
+import math
+import re
+
+import pytest
+
+from dataparsing import btn_position
+
+IMGDICT = {
+    'portrait.png': ('480', '800'),
+    'landscape.png': ('800', '480'),
+    'tablet.png': ('600', '1024'),
+    'broken.png': ('err', 'err'),
+    'zero.png': ('0', '0'),
+}
+
+
+def name(left, top, right, bottom):
+    return '{android.widget.Button}-{OK}-{[%d,%d][%d,%d]}' % (left, top, right, bottom)
+
+
+BUTTONS = [
+    # Centres exactly on cell edges, and on the corners of the screen
+    (name(0, 0, 0, 0), 'portrait.png'),
+    (name(0, 0, 320, 320), 'portrait.png'),
+    (name(160, 160, 160, 160), 'portrait.png'),
+    (name(470, 790, 490, 810), 'portrait.png'),
+    (name(400, 240, 400, 240), 'landscape.png'),
+    (name(300, 512, 300, 512), 'tablet.png'),
+    (name(600, 1024, 600, 1024), 'tablet.png'),
+    (name(10, 10, 50, 50), 'portrait.png'),
+    (name(10, 10, 50, 50), 'landscape.png'),
+    (name(10, 10, 50, 50), 'tablet.png'),
+    # Outside of the screen
+    (name(470, 790, 500, 820), 'portrait.png'),
+    (name(900, 100, 950, 120), 'landscape.png'),
+    (name(-100, 10, -20, 50), 'portrait.png'),
+    (name(-10, -10, 0, 0), 'tablet.png'),
+    # Unknown screens
+    (name(10, 10, 50, 50), 'broken.png'),
+    (name(10, 10, 50, 50), 'zero.png'),
+    (name(10, 10, 50, 50), 'missing.png'),
+]
+
+UNPARSABLE = [('{android.widget.Button}-{OK}', 'portrait.png'),
+              ('{android.view.View}-{}-{no bounds}', 'portrait.png'),
+              ('no braces at all', 'portrait.png')]
+
+
+def old_grid_3x3(btn_name, imgname, pattern):
+    """
+    The per-button loop of parseJson.prep_data_for_wide.
+    """
+    try:
+        m = re.findall('{(.*?)}', btn_name)
+        btn_location = m[2]
+        m = re.findall(pattern, btn_location)
+        y = [sum(x) / len(x) for x in zip((int(z) for z in (m[0])), (int(zz) for zz in m[1]))]
+        positional_num = []
+        for i in range(len(y)):
+            positional_num.append(math.ceil(y[i] / int(IMGDICT[imgname][i]) * 3))
+        return str(positional_num[0] + 3 * (positional_num[1] - 1))
+    except Exception:
+        return '-1'
+
+
+def old_grid_by_screen(btn_name, imgname):
+    """
+    The per-button loop of generate_traintest.py.
+    """
+    m2 = re.findall(r'\[(-?\d+),(-?\d+)\]', re.findall('{(.*?)}', repr(btn_name))[2])
+    y = [sum(x) / len(x) for x in zip((int(z) for z in (m2[0])), (int(zz) for zz in m2[1]))]
+    if imgname not in IMGDICT or IMGDICT[imgname][0] == 'err':
+        return '-1'
+    dims = [int(x) for x in IMGDICT[imgname]]
+    if y[0] > dims[0] or y[1] > dims[1]:
+        return '-1'
+    if dims == [480, 800]:
+        rep = str(math.ceil(y[0] / dims[0] * 3) + 3 * (math.ceil(y[1] / dims[1] * 5) - 1))
+    elif dims == [800, 480]:
+        rep = str(math.ceil(y[0] / dims[0] * 5) + 3 * (math.ceil(y[1] / dims[1] * 3) - 1))
+    else:
+        rep = 'E' + str(math.ceil(y[0] / dims[0] * 3) + 3 * (math.ceil(y[1] / dims[1] * 3) - 1))
+    if 'E' not in rep:
+        return rep if 15 >= int(rep) >= 1 else '-1'
+    return rep if 9 >= int(rep[1:]) >= 1 else '-1'
+
+
+@pytest.mark.parametrize('signed', [True, False])
+def test_grid_3x3_matches_the_old_loop(signed):
+    buttons = BUTTONS + UNPARSABLE
+    names = [btn for btn, img in buttons]
+    imgnames = [img for btn, img in buttons]
+    classes, bounds, parsed = btn_position.parse_names(names, signed=signed)
+    dims = btn_position.screen_dimensions(imgnames, IMGDICT)
+    pattern = r'\[(-?\d+),(-?\d+)\]' if signed else r'\[(\d+),(\d+)\]'
+    assert btn_position.grid_3x3(bounds, parsed, dims) == [old_grid_3x3(btn, img, pattern) for btn, img in buttons]
+
+
+def test_grid_by_screen_matches_the_old_loop():
+    # The old loop gave up on unparsable names and zero sized screens, so they are left out here
+    buttons = [(btn, img) for btn, img in BUTTONS if img != 'zero.png']
+    classes, bounds, parsed = btn_position.parse_names([repr(btn) for btn, img in buttons])
+    dims = btn_position.screen_dimensions([img for btn, img in buttons], IMGDICT)
+    assert btn_position.grid_by_screen(bounds, parsed, dims) == [old_grid_by_screen(btn, img) for btn, img in buttons]
+
+
+def test_grid_by_screen_on_edges():
+    classes, bounds, parsed = btn_position.parse_names(
+        [repr(name(160, 160, 160, 160)), repr(name(480, 800, 480, 800)), repr(name(482, 800, 482, 800))])
+    dims = btn_position.screen_dimensions(['portrait.png'] * 3, IMGDICT)
+    # A centre on the edge of a cell belongs to the cell before it, and the corner of the screen to the last cell
+    assert btn_position.grid_by_screen(bounds, parsed, dims) == ['1', '15', '-1']
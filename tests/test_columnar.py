@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+import pytest
+
+from dataparsing import columnar
+
+RECORDS = [{'text': 'Sign in', 'label': 'p', 'x': 1.5},
+           {'text': 'ünïcödé', 'label': None, 'x': None},
+           {'text': '', 'label': 'n', 'x': -2.0},
+           {'label': 'n', 'x': 3.0},
+           {'text': 'Help\ttab', 'label': 'p', 'x': 0.0}]
+
+
+def expected_text(record):
+    return record.get('text') or ''
+
+
+@pytest.fixture(autouse=True)
+def small_buffer(monkeypatch):
+    # Makes the writer flush several times on the way
+    monkeypatch.setattr(columnar, 'BUFFER_ROWS', 2)
+
+
+def write(directory, records):
+    with columnar.ColumnWriter(directory, ['text', 'label'], ['x']) as writer:
+        for record in records:
+            writer.append(record)
+
+
+def test_round_trip(tmp_path):
+    write(str(tmp_path), RECORDS)
+    reader = columnar.ColumnReader(str(tmp_path))
+    assert len(reader) == len(RECORDS)
+    assert list(reader.strings('text')) == [expected_text(r) for r in RECORDS]
+    assert list(reader.strings('label')) == [r['label'] or '' for r in RECORDS]
+    x = reader.floats('x')
+    assert isinstance(x, np.memmap)
+    assert math.isnan(x[1])
+    assert [v for i, v in enumerate(x) if i != 1] == [1.5, -2.0, 3.0, 0.0]
+
+
+def test_empty_store(tmp_path):
+    write(str(tmp_path), [])
+    reader = columnar.ColumnReader(str(tmp_path))
+    assert len(reader) == 0
+    assert list(reader.strings('text')) == []
+    assert len(reader.floats('x')) == 0
+
+
+def test_truncate_after_interrupted_write(tmp_path):
+    directory = str(tmp_path)
+    with pytest.raises(KeyboardInterrupt):
+        with columnar.ColumnWriter(directory, ['text', 'label'], ['x']) as writer:
+            for record in RECORDS:
+                writer.append(record)
+                if writer.rows == 3:
+                    raise KeyboardInterrupt()
+    # Closing on the way out leaves the rows written so far readable
+    assert list(columnar.ColumnReader(directory).strings('text')) == [expected_text(r) for r in RECORDS[:3]]
+
+    columnar.truncate(directory, 2)
+    reader = columnar.ColumnReader(directory)
+    assert len(reader) == 2
+    assert list(reader.strings('text')) == [expected_text(r) for r in RECORDS[:2]]
+    assert (tmp_path / 'text.offsets').stat().st_size == 3 * 8
+    assert (tmp_path / 'text.utf8').stat().st_size == len(''.join(expected_text(r) for r in RECORDS[:2]).encode('utf-8'))
+    assert list(reader.floats('x'))[0] == 1.5
+
+    # Truncating to more rows than there are keeps them all
+    columnar.truncate(directory, 10)
+    assert len(columnar.ColumnReader(directory)) == 2
@@ -0,0 +1,15 @@
+import pytest
+
+from crawler.Emulator import EmulatorPool
+
+
+def test_pool_runs_the_given_devices_and_avds():
+    pool = EmulatorPool(['avd0', 'avd1'], ['emulator-5554', 'emulator-5580'])
+    assert [(e.avdname, e.device_name, e.read_only) for e in pool.emulators] == [
+        ('avd0', 'emulator-5554', True), ('avd1', 'emulator-5580', True)]
+    assert pool.active.device_name == 'emulator-5554'
+
+
+def test_pool_rejects_a_spare_on_the_active_device():
+    with pytest.raises(ValueError):
+        EmulatorPool(['avd0', 'avd0'], ['emulator-5554', 'emulator-5554'])
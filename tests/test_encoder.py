@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from dataparsing import encoder
+
+WORDS = ['<pad>', 'sign', 'in', 'ok', 'NA', 'sign', 'help', 'back']
+ROWS = [['sign', 'in'], [], ['ok', 'help', 'back', 'sign', 'in', 'ok'], ['sign', 'sign', 'sign'], ['back']]
+
+
+def old_rows(vocabulary, rows, length, pad=0):
+    """
+    How widenrnn.py filled its deep input before the vocabulary: one list.index per token.
+    """
+    out = np.full((len(rows), length), pad, dtype=np.int32)
+    for i, row in enumerate(rows):
+        for j, token in enumerate(row):
+            if j >= length:
+                break
+            out[i][j] = vocabulary.index(token)
+    return out
+
+
+def old_ids(vocabulary, tokens, fallback):
+    """
+    How widenrnn.py encoded the button class: tokens it had never seen became fallback.
+    """
+    ids = []
+    for token in tokens:
+        try:
+            ids.append(vocabulary.index(token))
+        except ValueError:
+            ids.append(vocabulary.index(fallback))
+    return ids
+
+
+@pytest.mark.parametrize('length', [1, 3, 6, 10])
+@pytest.mark.parametrize('pad', [0, -1])
+def test_encode_rows_matches_list_index(length, pad):
+    vocabulary = encoder.Vocabulary(WORDS)
+    encoded = vocabulary.encode_rows(ROWS, length, pad)
+    assert encoded.dtype == np.int32
+    assert encoded.tolist() == old_rows(WORDS, ROWS, length, pad).tolist()
+    # Ids read back to the tokens they came from, including the first id of a repeated token
+    for row, ids in zip(ROWS, encoded):
+        assert [vocabulary.tokens[i] for i in ids[:len(row)]] == row[:length]
+
+
+def test_encode_rows_empty():
+    vocabulary = encoder.Vocabulary(WORDS)
+    assert vocabulary.encode_rows([], 4).shape == (0, 4)
+    assert vocabulary.encode_rows([[], []], 2).tolist() == [[0, 0], [0, 0]]
+
+
+def test_unknown_tokens_are_an_error_without_fallback():
+    vocabulary = encoder.Vocabulary(WORDS)
+    with pytest.raises(ValueError) as error:
+        vocabulary.encode_rows([['sign', 'logout'], ['exit']], 3)
+    assert 'logout' in str(error.value) and 'exit' in str(error.value)
+    with pytest.raises(ValueError):
+        vocabulary.encode(['logout'])
+    assert vocabulary.encode(['sign', 'logout'], strict=False).tolist() == [1, encoder.UNKNOWN]
+
+
+def test_unknown_tokens_become_the_fallback():
+    tokens = ['sign', 'logout', 'NA', 'help', 'exit']
+    vocabulary = encoder.Vocabulary(WORDS, unknown='NA')
+    assert vocabulary.encode(tokens).tolist() == old_ids(WORDS, tokens, 'NA')
+
+
+def test_translate_matches_encoding_the_names():
+    names = ['help', 'sign', 'logout', 'ok']
+    ids = np.array([3, 0, 1, 1, 2, 0])
+    tokens = [names[i] for i in ids]
+
+    vocabulary = encoder.Vocabulary(WORDS, unknown='NA')
+    assert vocabulary.translate(names, ids).tolist() == old_ids(WORDS, tokens, 'NA')
+
+    strict = encoder.Vocabulary(WORDS)
+    assert strict.translate(names, ids[:2]).tolist() == old_ids(WORDS, tokens[:2], 'NA')
+    with pytest.raises(ValueError) as error:
+        strict.translate(names, ids)
+    assert 'logout' in str(error.value)
+
+
+def test_translate_from_an_empty_vocabulary():
+    assert encoder.Vocabulary(WORDS, unknown='NA').translate([], np.array([], dtype=np.int64)).tolist() == []
@@ -0,0 +1,106 @@
+import hashlib
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from crawler import Fingerprint
+from crawler.Config import Config
+
+HOME = '''<hierarchy rotation="0">
+  <node index="0" text="" class="android.widget.FrameLayout" package="com.app" content-desc="">
+    <node index="0" text="Sign in" class="android.widget.Button" package="com.app" content-desc="" />
+    <node index="1" text="Help" class="android.widget.TextView" package="com.app" content-desc="" />
+  </node>
+</hierarchy>'''
+
+# Same structure as HOME, only the texts differ
+HOME_OTHER_TEXT = HOME.replace('Sign in', 'Log in').replace('Help', 'About')
+
+# One more button than HOME
+FORM = '''<hierarchy rotation="0">
+  <node index="0" text="" class="android.widget.FrameLayout" package="com.app" content-desc="">
+    <node index="0" text="" class="android.widget.EditText" package="com.app" content-desc="" />
+    <node index="1" text="Sign in" class="android.widget.Button" package="com.app" content-desc="" />
+    <node index="2" text="Help" class="android.widget.TextView" package="com.app" content-desc="" />
+  </node>
+</hierarchy>'''
+
+# Same indexes as HOME, but another class
+LIST = HOME.replace('android.widget.Button', 'android.widget.ListView')
+
+DUMPS = [HOME, HOME_OTHER_TEXT, FORM, LIST, HOME]
+
+
+@pytest.fixture(autouse=True)
+def widget_file(tmp_path, monkeypatch):
+    filename = tmp_path / 'classWidget.txt'
+    filename.write_text('{}')
+    monkeypatch.setattr(Config, 'classwidgetdict', str(filename))
+    monkeypatch.setattr(Config, 'state_fingerprint', 'legacy')
+    return filename
+
+
+def roots():
+    return [ET.fromstring(dump) for dump in DUMPS]
+
+
+def test_legacy_key_is_unchanged():
+    # Every index, then every class number in the order the classes first appear
+    expected = hashlib.md5('001' '012'.encode('utf-8')).hexdigest()
+    assert Fingerprint.state_key(ET.fromstring(HOME), 'com.app') == 'com.app-' + expected
+
+
+def test_widget_numbers_are_written_through(widget_file):
+    Fingerprint.state_key(ET.fromstring(FORM), 'com.app')
+    assert Fingerprint.WidgetDictionary(str(widget_file)).ids == {
+        'android.widget.FrameLayout': 0, 'android.widget.EditText': 1, 'android.widget.Button': 2,
+        'android.widget.TextView': 3}
+
+
+@pytest.mark.parametrize('strategy', ['legacy', 'structure', 'structure_text'])
+def test_keys_are_deterministic(strategy):
+    first = [Fingerprint.state_key(root, 'com.app', strategy) for root in roots()]
+    assert first == [Fingerprint.state_key(root, 'com.app', strategy) for root in roots()]
+    assert first[0] == first[-1]
+    # HOME, FORM and LIST are different screens under every strategy
+    assert len({first[0], first[2], first[3]}) == 3
+
+
+def test_structure_is_equivalent_to_legacy():
+    assert Fingerprint.equivalent(roots(), 'structure') == []
+
+
+def test_structure_text_tells_texts_apart():
+    home, other_text = roots()[:2]
+    legacy = [Fingerprint.state_key(root, 'com.app', 'legacy') for root in (home, other_text)]
+    with_text = [Fingerprint.state_key(root, 'com.app', 'structure_text') for root in (home, other_text)]
+    assert legacy[0] == legacy[1]
+    assert with_text[0] != with_text[1]
+    assert len(Fingerprint.equivalent(roots(), 'structure_text')) == 1
+
+
+def test_digests_are_the_same_with_and_without_reuse():
+    cold = [Fingerprint.MerkleFingerprint(('text',)) for _ in DUMPS]
+    warm = Fingerprint.MerkleFingerprint(('text',))
+    widgets = Fingerprint.get_widget_dictionary()
+    for fingerprint, root in zip(cold, roots()):
+        widgets.add_root(root)
+        assert fingerprint(root, widgets) == warm(root, widgets)
+
+
+def test_unchanged_subtrees_are_not_hashed_again():
+    fingerprint = Fingerprint.MerkleFingerprint(('text',))
+    widgets = Fingerprint.get_widget_dictionary()
+    home, other_text = roots()[:2]
+    widgets.add_root(home)
+    first = fingerprint(home, widgets)
+    # hierarchy, the layout and its two children
+    assert fingerprint.hashed == 4
+
+    assert fingerprint(ET.fromstring(HOME), widgets) == first
+    assert fingerprint.hashed == 4
+
+    # Only the changed button and its ancestors are hashed, the unchanged TextView is reused
+    changed = ET.fromstring(HOME.replace('Sign in', 'Log in'))
+    assert fingerprint(changed, widgets) != first
+    assert fingerprint.hashed == 7
@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from dataparsing import img_dimension_extract
+
+
+@pytest.fixture
+def screens(tmp_path):
+    directory = tmp_path / 'screen' / 'com.app'
+    directory.mkdir(parents=True)
+    for name, size in (('a.png', (480, 800)), ('b.png', (800, 480)), ('c.png', (1, 3000))):
+        Image.new('RGB', size).save(str(directory / name))
+    return directory
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA', 'L', 'P'])
+def test_png_header_matches_pil(tmp_path, mode):
+    path = str(tmp_path / 'x.png')
+    Image.new(mode, (123, 4567)).save(path)
+    with Image.open(path) as img:
+        assert tuple(img_dimension_extract.image_size(path)) == img.size
+
+
+def test_other_files(tmp_path):
+    jpeg = str(tmp_path / 'x.png')
+    Image.new('RGB', (31, 17)).save(jpeg, format='JPEG')
+    assert tuple(img_dimension_extract.image_size(jpeg)) == (31, 17)
+
+    broken = tmp_path / 'y.png'
+    broken.write_bytes(b'not an image')
+    assert img_dimension_extract.image_size(str(broken)) == ('err', 'err')
+
+
+def test_cache_is_invalidated_by_mtime(tmp_path, screens, monkeypatch):
+    reads = []
+    image_size = img_dimension_extract.image_size
+
+    def counting(path):
+        reads.append(os.path.basename(path))
+        return image_size(path)
+
+    monkeypatch.setattr(img_dimension_extract, 'image_size', counting)
+    cachefile = str(tmp_path / 'cache.txt')
+    directory = str(tmp_path / 'screen')
+
+    first = img_dimension_extract.extract_dimensions(directory, cachefile, 1)
+    assert sorted(reads) == ['a.png', 'b.png', 'c.png']
+    assert sorted((os.path.basename(p), int(w), int(h)) for p, w, h in first) == [
+        ('a.png', 480, 800), ('b.png', 800, 480), ('c.png', 1, 3000)]
+
+    del reads[:]
+    assert img_dimension_extract.extract_dimensions(directory, cachefile, 1) == [
+        (p, str(w), str(h)) for p, w, h in first]
+    assert reads == []
+
+    # Same contents and size, only the mtime changed
+    st = os.stat(str(screens / 'a.png'))
+    os.utime(str(screens / 'a.png'), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    img_dimension_extract.extract_dimensions(directory, cachefile, 1)
+    assert reads == ['a.png']
+
+    del reads[:]
+    Image.new('RGB', (640, 360)).save(str(screens / 'b.png'))
+    os.utime(str(screens / 'b.png'), ns=(st.st_atime_ns, st.st_mtime_ns + 2 * 10 ** 9))
+    third = img_dimension_extract.extract_dimensions(directory, cachefile, 1)
+    assert reads == ['b.png']
+    assert [(w, h) for p, w, h in third if p.endswith('b.png')] == [(640, 360)]
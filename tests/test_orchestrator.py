@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from crawler.Config import Config
+from crawler.Orchestrator import Orchestrator
+
+
+class FakeDevice(object):
+    def __init__(self, device_name):
+        self.device_name = device_name
+        self.dead = False
+
+    @property
+    def info(self):
+        if self.dead:
+            raise IOError(self.device_name + ' is gone')
+        return {}
+
+
+def start_emulator(avdname, device_name, window):
+    pass
+
+
+def stop_emulator(device_name):
+    pass
+
+
+def failing_start_emulator(avdname, device_name, window):
+    raise TimeoutError(device_name + ' did not boot')
+
+
+def make_crawl(directory, kill):
+    """
+    :param kill: dict of APK to the number of attempts its emulator dies in, or 'exit' to kill the worker process
+    on the first attempt instead
+    """
+
+    def crawl(device_name, device, avdname, window, apk, apk_dir, file, start_time):
+        with open(os.path.join(directory, apk), 'a') as f:
+            f.write(device_name + '\n')
+        attempts = len(open(os.path.join(directory, apk)).readlines())
+        if kill.get(apk) == 'exit':
+            if attempts == 1:
+                os._exit(1)
+        elif attempts <= kill.get(apk, 0):
+            device.dead = True
+
+    return crawl
+
+
+def attempts(directory, apk):
+    with open(os.path.join(directory, apk)) as f:
+        return len(f.readlines())
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'info_location', str(tmp_path / 'info'))
+    return str(tmp_path)
+
+
+def orchestrator(directory, apks, kill, emulators=2, **kwargs):
+    kwargs.setdefault('start_emulator', start_emulator)
+    return Orchestrator(apks, directory, ['avd' + str(i) for i in range(emulators)], max_retries=2,
+                        device_factory=FakeDevice, stop_emulator=stop_emulator, crawl=make_crawl(directory, kill),
+                        poll_interval=0.05, **kwargs)
+
+
+def test_every_apk_is_done(directory):
+    apks = ['a.apk', 'b.apk', 'c.apk', 'd.apk']
+    outcomes = orchestrator(directory, apks, {}).run()
+    assert outcomes == {apk: 'done' for apk in apks}
+    assert all(attempts(directory, apk) == 1 for apk in apks)
+
+
+def test_apk_is_requeued_after_its_device_died(directory):
+    outcomes = orchestrator(directory, ['a.apk', 'b.apk', 'c.apk'], {'b.apk': 1}).run()
+    assert outcomes == {'a.apk': 'done', 'b.apk': 'done', 'c.apk': 'done'}
+    assert attempts(directory, 'b.apk') == 2
+
+
+def test_apk_fails_when_out_of_retries(directory):
+    outcomes = orchestrator(directory, ['a.apk', 'b.apk'], {'b.apk': 10}).run()
+    assert outcomes == {'a.apk': 'done', 'b.apk': 'failed'}
+    assert attempts(directory, 'b.apk') == 3
+
+
+def test_apk_is_requeued_after_its_worker_died(directory):
+    outcomes = orchestrator(directory, ['a.apk', 'b.apk', 'c.apk'], {'b.apk': 'exit'}, emulators=1).run()
+    assert outcomes == {'a.apk': 'done', 'b.apk': 'done', 'c.apk': 'done'}
+    assert attempts(directory, 'b.apk') == 2
+
+
+def test_apks_fail_when_no_emulator_starts(directory):
+    outcomes = orchestrator(directory, ['a.apk', 'b.apk'], {}, start_emulator=failing_start_emulator).run()
+    assert outcomes == {'a.apk': 'failed', 'b.apk': 'failed'}
@@ -0,0 +1,88 @@
+import collections
+
+import pytest
+import uiautomator
+
+from crawler import Main
+from crawler.Navigator import Navigator
+
+Clickable = collections.namedtuple('Clickable', 'name next_transition_state')
+
+# A -b1-> B -b2-> C, where C has a clickable that was never clicked
+GRAPH = {'A': {'b1': 'B'}, 'B': {'b2': 'C'}, 'C': {'b3': None}}
+
+
+class FakeSnapshot(object):
+    def __init__(self, state):
+        self.state = state
+
+    def clickable_infos(self, package=None):
+        return [{'name': name, 'text': name.upper()} for name in GRAPH[self.state]]
+
+
+class FakeDevice(object):
+    """
+    Moves between the states of GRAPH on clicks, and raises errors[name] instead when clicking name.
+    """
+
+    def __init__(self, state, errors=None):
+        self.state = state
+        self.errors = errors or {}
+        self.deadlines = []
+
+    def snapshot(self, pack_name, deadline):
+        self.deadlines.append(deadline)
+        return FakeSnapshot(self.state)
+
+    def clickable_at(self, pack_name, index):
+        name = list(GRAPH[self.state])[index]
+        device = self
+
+        class Click(object):
+            def wait(self):
+                if name in device.errors:
+                    raise device.errors[name]
+                device.state = GRAPH[device.state][name]
+
+        return collections.namedtuple('Button', 'click')(Click())
+
+
+@pytest.fixture
+def device(monkeypatch):
+    device = FakeDevice('A')
+    monkeypatch.setattr(Main, 'current_snapshot', device.snapshot)
+    monkeypatch.setattr(Main, 'clickable_at', device.clickable_at)
+    monkeypatch.setattr(Main, 'settle', lambda pack_name, deadline: None)
+    monkeypatch.setattr(Main.Utility, 'btn_info_to_key', lambda info: info['name'])
+    monkeypatch.setattr(Main, 'navigator', Navigator())
+    monkeypatch.setattr(Main, 'sequence', [])
+    monkeypatch.setattr(Main, 'clickables', {state: [Clickable(name, nxt) for name, nxt in GRAPH[state].items()]
+                                             for state in GRAPH})
+    monkeypatch.setattr(Main, 'visited', {'A': [[1, 1]], 'B': [[1, 1]], 'C': [[1, 0]]})
+    return device
+
+
+def test_replay_reaches_frontier(device):
+    assert Main.replay_to_frontier('pkg') == 'C'
+    assert Main.sequence == [('A', 'b1', 'B1'), ('B', 'b2', 'B2')]
+    assert not Main.navigator.failed
+    # Every click has a deadline of its own
+    assert len(set(map(id, device.deadlines))) == 3
+
+
+@pytest.mark.parametrize('error', [TimeoutError('timeout. click took longer than 5.0s'),
+                                   uiautomator.JsonRPCError(-32001, 'UiObjectNotFoundException')])
+def test_failed_click_ends_replay(device, error):
+    device.errors['b2'] = error
+    assert Main.replay_to_frontier('pkg') == 'B'
+    assert Main.sequence == [('A', 'b1', 'B1')]
+    assert Main.navigator.failed == {('B', 'b2')}
+    # The failed transition is left out, so there is no way to the frontier any more
+    assert Main.navigator.path('B', Main.clickables, Main.visited, 10) is None
+
+
+def test_unexpected_state_ends_replay(device, monkeypatch):
+    monkeypatch.setitem(GRAPH, 'B', {'b2': 'A'})
+    Main.clickables['B'] = [Clickable('b2', 'C')]
+    assert Main.replay_to_frontier('pkg') == 'A'
+    assert Main.navigator.failed == {('B', 'b2')}
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from dataparsing import seq_store
+
+NULL = '~!@#null#@!~'
+
+# Steps are lists of words, as generate_traintest.py makes them with -iw, or single tokens without it
+WORDS = [
+    [['sign', 'in'], NULL, ['ok'], ['a', 'long', 'button', 'text', 'of', 'many', 'words', 'that', 'goes', 'on']],
+    [['short']],
+    [NULL, NULL, NULL, ['help']],
+    [],
+    [['x'], ['y'], ['x', 'y'], NULL, NULL, ['z']],
+]
+TOKENS = [['sign in', NULL, 'ok', 'back'], ['short'], [NULL, NULL, NULL, 'help'], [], ['x', 'y', 'x y', NULL]]
+
+
+def labels_of(sequences):
+    return [['positive' if (i + j) % 3 else 'negative' for j in range(len(sequence))]
+            for i, sequence in enumerate(sequences)]
+
+
+def baseline(sequences, labels, grams, skip_null_windows):
+    """
+    The window loop generate_traintest.py used before the store: every n-gram of every sequence as a slice of the
+    nested lists, with the words of its steps one after the other.
+    """
+    windows = []
+    for i in range(len(sequences)):
+        if len(sequences[i]) < grams:
+            continue
+        for j in range(len(sequences[i]) - grams + 1):
+            words = []
+            for step in sequences[i][j:j + grams]:
+                words.extend(step if type(step) == list else [step])
+            if skip_null_windows and set(words) == {NULL}:
+                continue
+            windows.append((words, labels[i][j + grams - 1]))
+    return windows
+
+
+@pytest.mark.parametrize('sequences', [WORDS, TOKENS])
+@pytest.mark.parametrize('grams', [1, 2, 3, 5])
+@pytest.mark.parametrize('skip_null_windows', [True, False])
+def test_windows_match_the_nested_lists(tmp_path, sequences, grams, skip_null_windows):
+    labels = labels_of(sequences)
+    expected = baseline(sequences, labels, grams, skip_null_windows)
+
+    store = seq_store.build(sequences, labels, grams, skip_null_windows, NULL)
+    store.save(str(tmp_path))
+    loaded = seq_store.SeqStore.load(str(tmp_path), store.words[:store.window_words])
+    assert len(loaded) == len(expected)
+
+    windows = np.arange(len(loaded))
+    length = max([len(words) for words, label in expected] or [1]) + 2
+    batch = loaded.window_tokens(windows, length, pad=-7)
+    for i, (words, label) in enumerate(expected):
+        assert [loaded.words[t] for t in loaded.window(i)] == words
+        assert list(batch[i]) == [loaded.words.index(w) for w in words] + [-7] * (length - len(words))
+        assert loaded.label_names[loaded.labels[loaded.ends[i]]] == label
+
+    # Rows are cut to the length asked for
+    if expected:
+        cut = loaded.window_tokens(windows, 2)
+        assert [[loaded.words[t] for t in row] for row in cut] == [
+            (words + [loaded.words[0]] * 2)[:2] for words, label in expected]
+
+
+@pytest.mark.parametrize('grams', [1, 3, 5])
+def test_word_list_holds_only_words_of_windows(grams):
+    labels = labels_of(WORDS)
+    store = seq_store.build(WORDS, labels, grams, True, NULL)
+    in_windows = {word for words, label in baseline(WORDS, labels, grams, True) for word in words}
+    assert set(store.words[:store.window_words]) == in_windows
+    assert set(store.words) == {word for sequence in WORDS for step in sequence
+                                for word in (step if type(step) == list else [step])}
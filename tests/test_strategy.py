@@ -0,0 +1,132 @@
+import random
+
+import pytest
+
+from crawler import Strategy
+from crawler.FenwickTree import FenwickTree
+
+
+class FixedRandom(object):
+    """
+    Stands in for random, returning the given values in turn.
+    """
+
+    def __init__(self, *values):
+        self.values = list(values)
+
+    def random(self):
+        return self.values.pop(0)
+
+
+def frequencies(sample, n, draws=20000):
+    counts = [0] * n
+    for _ in range(draws):
+        counts[sample()] += 1
+    return [c / draws for c in counts]
+
+
+def test_fenwick_prefix_sums_follow_set_and_append():
+    rng = random.Random(1)
+    weights = [rng.randint(0, 5) for _ in range(13)]
+    tree = FenwickTree(weights)
+    for _ in range(200):
+        if rng.random() < 0.2:
+            weights.append(rng.randint(0, 5))
+            tree.append(weights[-1])
+        else:
+            i = rng.randrange(len(weights))
+            weights[i] = rng.randint(0, 5)
+            tree.set(i, weights[i])
+        assert len(tree) == len(weights)
+        assert [tree[i] for i in range(len(tree))] == weights
+        assert [tree.prefix(i) for i in range(len(weights) + 1)] == [sum(weights[:i]) for i in range(len(weights) + 1)]
+
+
+def test_fenwick_sample_boundaries():
+    tree = FenwickTree([1, 0, 2, 0, 1])
+    # Prefix sums are 1, 1, 3, 3, 4, so [0, 1) is index 0, [1, 3) index 2 and [3, 4) index 4
+    for value, index in [(0, 0), (0.99, 0), (1, 2), (2.99, 2), (3, 4), (3.99, 4)]:
+        assert tree.sample(FixedRandom(value / 4.0)) == index
+
+
+def test_fenwick_sample_without_weight():
+    assert FenwickTree().sample() == -1
+    tree = FenwickTree([0, 0])
+    assert tree.sample() == -1
+    tree.set(1, 3)
+    assert tree.sample() == 1
+
+
+def test_fenwick_samples_in_proportion():
+    rng = random.Random(2)
+    tree = FenwickTree([1, 2, 0, 5])
+    assert frequencies(lambda: tree.sample(rng), 4) == pytest.approx([1 / 8, 2 / 8, 0, 5 / 8], abs=0.02)
+    tree.set(3, 0)
+    tree.set(2, 1)
+    tree.append(4)
+    assert frequencies(lambda: tree.sample(rng), 5) == pytest.approx([1 / 8, 2 / 8, 1 / 8, 0, 4 / 8], abs=0.02)
+
+
+def test_strategies_are_abstract():
+    with pytest.raises(TypeError):
+        Strategy.Strategy()
+    with pytest.raises(TypeError):
+        Strategy.WeightedStrategy()
+    for name in Strategy.STRATEGIES:
+        assert isinstance(Strategy.get_strategy(name), Strategy.Strategy)
+    with pytest.raises(ValueError):
+        Strategy.get_strategy('greedy')
+
+
+def test_least_visited_prefers_rarely_clicked(monkeypatch):
+    monkeypatch.setattr(Strategy.random, 'random', random.Random(3).random)
+    strategy = Strategy.LeastVisitedStrategy()
+    # The fourth clickable has no stats yet, so it is unvisited
+    stats = [[1, 0], [5, 1], [0, 3]]
+    expected = [1, 0.5, 0.125, 1]
+    assert frequencies(lambda: strategy.choose('s', stats, 4), 4) == pytest.approx(
+        [w / sum(expected) for w in expected], abs=0.02)
+
+    # Clicks reach the kept tree through update
+    stats[0] = [2, 3]
+    strategy.update('s', 0, stats)
+    expected[0] = 0.125
+    assert frequencies(lambda: strategy.choose('s', stats, 4), 4) == pytest.approx(
+        [w / sum(expected) for w in expected], abs=0.02)
+
+
+def test_score_never_picks_what_changed_nothing():
+    strategy = Strategy.ScoreStrategy()
+    stats = [[0, 2], [3, 1], [0, 1]]
+    assert {strategy.choose('s', stats, 3) for _ in range(200)} == {1}
+    stats[1] = [0, 2]
+    strategy.update('s', 1, stats)
+    # Nothing has weight left, so any clickable goes
+    assert {strategy.choose('s', stats, 3) for _ in range(200)} == {0, 1, 2}
+
+
+def test_ucb_clicks_every_clickable_once_first():
+    strategy = Strategy.UCBStrategy()
+    stats = [[9, 4], [0, 0], [9, 1], [0, 0]]
+    assert {strategy.choose('s', stats, 4) for _ in range(100)} == {1, 3}
+    assert strategy.choose('s', stats[:3], 5) in (1, 3, 4)
+
+
+def test_ucb_picks_highest_bound():
+    strategy = Strategy.UCBStrategy()
+    # Equal counts leave the scores to decide
+    assert strategy.choose('s', [[1, 2], [4, 2], [2, 2]], 3) == 1
+    # Bonus of sqrt(2 ln 22 / 1) = 2.49 beats a score lead of 1.5 over a clickable clicked 20 times
+    assert strategy.choose('s', [[2.5, 20], [1, 1], [0.5, 1]], 3) == 1
+    assert Strategy.UCBStrategy(exploration=0).choose('s', [[2.5, 20], [1, 1], [0.5, 1]], 3) == 0
+
+
+def test_thompson_follows_scores():
+    strategy = Strategy.ThompsonStrategy(deviation=1e-6)
+    assert strategy.choose('s', [[1, 3], [6, 3], [2, 0]], 3) == 1
+    assert strategy.choose('s', [[0.5, 3], [0, 3]], 3) == 2
+
+    random.seed(4)
+    # Wide posteriors of unclicked clickables still get picked sometimes
+    picks = frequencies(lambda: Strategy.ThompsonStrategy().choose('s', [[1, 50], [0.5, 0]], 2), 2, 2000)
+    assert 0.2 < picks[1] < 0.5
@@ -0,0 +1,73 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+from crawler import Utility
+from crawler.Clickable import Clickable
+from crawler.Config import Config
+from crawler.Data import Data
+from crawler.DataActivity import DataActivity
+from crawler.Mongo import Mongo
+from crawler.StateGraph import StateGraph
+
+mongomock = pytest.importorskip('mongomock')
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    monkeypatch.setattr(Config, 'app_name', 'app')
+    return Mongo(client=mongomock.MongoClient())
+
+
+def crawl_data():
+    data = Data(_appname='app', _packname='com.app', _data_activity=[])
+    activities = {'s0': DataActivity(_state='s0', _name='Main', _parent_app='app')}
+    clickables = {'s0': [Clickable(_name='b0', _text='OK', _parent_activity_state='s0', _parent_app_name='app',
+                                   next_transition_state='s1', _visits=2, _score=4),
+                         Clickable(_name='b1', _text='Cancel', _parent_activity_state='s0', _parent_app_name='app')]}
+    return data, activities, clickables
+
+
+def test_round_trip(mongo):
+    data, activities, clickables = crawl_data()
+    Utility.write_requests(mongo, Utility.collect_dirty(data, activities, clickables))
+
+    graph = StateGraph.load(mongo, 'app')
+    assert list(graph.activities) == ['s0']
+    assert graph.activities['s0'].clickables == ['b0', 'b1']
+    loaded = graph.clickables['s0']
+    assert [c.name for c in loaded] == ['b0', 'b1']
+    assert (loaded[0].next_transition_state, loaded[0].visits, loaded[0].score) == ('s1', 2, 4)
+    assert not any(c.dirty for c in loaded)
+
+    # Nothing changed since, so nothing is written again
+    app_requests, activity_requests, clickable_requests, changed = Utility.collect_dirty(data, activities, clickables)
+    assert not (app_requests or activity_requests or clickable_requests or changed)
+
+
+def test_only_changes_are_written(mongo):
+    data, activities, clickables = crawl_data()
+    Utility.write_requests(mongo, Utility.collect_dirty(data, activities, clickables))
+
+    clickables['s0'][1].visits += 1
+    app_requests, activity_requests, clickable_requests, changed = Utility.collect_dirty(data, activities, clickables)
+    assert (len(app_requests), len(activity_requests), len(clickable_requests)) == (0, 0, 1)
+    Utility.write_requests(mongo, (app_requests, activity_requests, clickable_requests, changed))
+    assert mongo.clickable.find_one({'name': 'b1'})['visits'] == 1
+    assert mongo.clickable.count_documents({}) == 2
+
+
+def test_failed_write_is_retried(mongo):
+    data, activities, clickables = crawl_data()
+
+    def unreachable(requests, ordered=True):
+        raise AutoReconnect('connection refused')
+
+    mongo.clickable.bulk_write = unreachable
+    with pytest.raises(AutoReconnect):
+        Utility.write_requests(mongo, Utility.collect_dirty(data, activities, clickables))
+    assert all(c.dirty for c in clickables['s0'])
+
+    del mongo.clickable.bulk_write
+    Utility.write_requests(mongo, Utility.collect_dirty(data, activities, clickables))
+    assert mongo.clickable.count_documents({'parent_app_name': 'app'}) == 2
+    assert not any(c.dirty for c in clickables['s0'])